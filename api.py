@@ -1,13 +1,16 @@
 # api.py
 # Main API for the AI-driven living web service
 
-from fastapi import FastAPI, HTTPException, Header, Request
-from fastapi.responses import JSONResponse, HTMLResponse, FileResponse
+from fastapi import FastAPI, HTTPException, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, HTMLResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr
+from contextlib import asynccontextmanager
 from typing import Optional, List, Dict
+import anyio
 import uvicorn
+import asyncio
 import os
 
 # Import our modules
@@ -22,21 +25,38 @@ from npc_generator import (
 from rooms import (
     create_room, get_room, join_room, leave_room,
     add_chat_message, add_npc_interaction, get_active_rooms,
-    close_room, get_room_participants
+    close_room, get_room_participants, get_room_entries_since, get_room_history,
+    heartbeat, run_presence_sweeper, archive_closed_rooms, idle_room,
+    loaded_room_ids, room_exists, chat_message_exists, PRESENCE_TTL
 )
 from sharing import (
-    create_share, get_share, increment_remix_from_share,
-    get_user_shares, get_popular_shares
+    create_share, get_share, find_share, increment_remix_from_share,
+    get_user_shares, get_popular_shares, ensure_og_image,
+    get_placeholder_image, get_render_stats, shutdown_render_pool,
+    image_etag, webp_variant_path, get_webp_variant, open_share_image,
+    get_share_page, get_share_page_stats, run_view_flusher, flush_share_views,
+    record_image_access, run_image_sweeper, get_image_store_stats,
+    invalidate_share_pages, OG_IMAGE_WAIT, SHARE_IMAGE_CACHE_CONTROL
 )
+from realtime import room_hub, RoomConnection, ROOM_MOVED_CLOSE_CODE, receive_json
+from sharding import shard_router
 from leaderboard import (
     get_weekly_leaderboard, get_most_remixed_npcs,
-    get_trending_npcs, update_user_reputation, get_global_stats
+    get_trending_npcs, update_user_reputation, get_global_stats,
+    get_archived_weeks, get_archived_leaderboard, get_creator_rank_history,
+    run_snapshot_scheduler
 )
 from moderation import (
-    check_rate_limit, validate_npc_content, validate_message,
-    get_user_rate_limit_status, report_content
+    check_rate_limit, validate_npc_content, validate_message, record_message,
+    get_user_rate_limit_status, report_content, get_report, get_report_queue,
+    claim_reports, resolve_reports, get_report_queue_stats, is_moderator, is_hidden,
+    get_filter_stats, on_visibility_change,
+    REPORTABLE_TYPES
 )
 
+# Cached share pages must not outlive a hide/restore decision
+on_visibility_change(invalidate_share_pages)
+
 app = FastAPI(title="Realm of Echoes - Living World API")
 
 # CORS middleware
@@ -47,6 +67,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Background jobs
+@app.on_event("startup")
+async def start_background_jobs():
+    app.state.leaderboard_scheduler = asyncio.create_task(run_snapshot_scheduler())
+    archive_closed_rooms()
+    room_hub.start(asyncio.get_running_loop())
+    app.state.presence_sweeper = asyncio.create_task(run_presence_sweeper())
+    if shard_router.enabled:
+        app.state.shard_refresher = asyncio.create_task(shard_router.run(shed_moved_rooms))
+    app.state.view_flusher = asyncio.create_task(run_view_flusher())
+    app.state.image_sweeper = asyncio.create_task(run_image_sweeper())
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    shutdown_render_pool()
+    flush_share_views()
+
+def shed_moved_rooms():
+    """
+    After a rebalance, drop state for rooms now owned by another shard.
+    Their sockets are closed with 1012 so clients reconnect to the new owner.
+    """
+    for room_id in set(room_hub.connections) | loaded_room_ids():
+        if not shard_router.is_local(room_id):
+            idle_room(room_id)
+            asyncio.create_task(room_hub.close_room(room_id, ROOM_MOVED_CLOSE_CODE))
+
+# Forward room-scoped requests to the shard that owns the room
+@app.middleware("http")
+async def route_to_room_shard(request: Request, call_next):
+    body_room_id = None
+    if shard_router.enabled and request.url.path == "/api/rooms/interact":
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        if isinstance(body, dict) and isinstance(body.get("room_id"), str):
+            body_room_id = body["room_id"]
+    owner_url = shard_router.remote_owner_url(request.url.path, request.headers, body_room_id)
+    if owner_url:
+        return await shard_router.forward(request, owner_url)
+    return await call_next(request)
+
 # Mount static files directory
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -85,6 +148,20 @@ class NPCInteractionRequest(BaseModel):
     npc_id: str
     dialogue_id: str
 
+class ReportRequest(BaseModel):
+    content_type: str
+    content_id: str
+    reason: str
+
+class ClaimReportsRequest(BaseModel):
+    limit: int = 20
+    content_type: Optional[str] = None
+
+class ResolveReportsRequest(BaseModel):
+    item_ids: List[str]
+    action: str
+    note: Optional[str] = None
+
 # Helper to get current user from token
 def get_current_user(authorization: Optional[str] = Header(None)):
     if not authorization or not authorization.startswith("Bearer "):
@@ -102,6 +179,82 @@ def get_current_user(authorization: Optional[str] = Header(None)):
     
     return user
 
+def get_websocket_user(websocket: WebSocket) -> Optional[Dict]:
+    """
+    Resolve the user for a WebSocket handshake. Browsers can't set headers on
+    WebSocket connections, so the JWT may also be passed as ?token=...
+    """
+    token = websocket.query_params.get("token")
+    authorization = websocket.headers.get("authorization")
+    if not token and authorization and authorization.startswith("Bearer "):
+        token = authorization.split(" ")[1]
+    if not token:
+        return None
+    
+    payload = decode_token(token)
+    if not payload or "user_id" not in payload:
+        return None
+    
+    return get_user_by_id(payload["user_id"])
+
+def post_chat_message(room_id: str, user_id: str, message: str) -> Dict:
+    """
+    Rate-limit, validate, store and broadcast a chat message
+    """
+    allowed, error = check_rate_limit(user_id, "chat_message")
+    if not allowed:
+        raise HTTPException(status_code=429, detail=error)
+    
+    valid, error = validate_message(message, user_id)
+    if not valid:
+        raise HTTPException(status_code=400, detail=error)
+    
+    entry = add_chat_message(room_id, user_id, message)
+    
+    if not entry:
+        raise HTTPException(status_code=404, detail="Room not found or not a member")
+    
+    record_message(message, user_id)
+    
+    room_hub.publish(room_id, {"type": "chat", "room_id": room_id, **entry})
+    return entry
+
+def interact_with_npc(room_id: str, user_id: str, npc_id: str, dialogue_id: str) -> Dict:
+    """
+    Resolve a dialogue choice, record it in the room and broadcast it
+    """
+    npc = get_npc(npc_id)
+    if not npc:
+        raise HTTPException(status_code=404, detail="NPC not found")
+    
+    # Find the dialogue response
+    dialogue_tree = npc.get("dialogue_tree", [])
+    response_text = "..."
+    
+    for node in dialogue_tree:
+        if node["id"] == "start":
+            for response in node.get("responses", []):
+                if response["id"] == dialogue_id:
+                    response_text = response["response"]
+                    break
+    
+    # Record interaction
+    interaction = add_npc_interaction(room_id, user_id, npc_id, dialogue_id, response_text)
+    if interaction:
+        room_hub.publish(room_id, {"type": "interaction", "room_id": room_id, **interaction})
+    
+    # Increment NPC interaction count
+    from npc_generator import load_npcs, save_npcs
+    npcs = load_npcs()
+    if npc_id in npcs:
+        npcs[npc_id]["interactions"] = npcs[npc_id].get("interactions", 0) + 1
+        save_npcs(npcs)
+    
+    return {
+        "response": response_text,
+        "npc_name": npc["name"]
+    }
+
 # ===== Authentication Endpoints =====
 
 @app.post("/api/auth/register")
@@ -173,7 +326,7 @@ async def api_create_npc(req: CreateNPCRequest, authorization: Optional[str] = H
 async def api_get_npc(npc_id: str):
     npc = get_npc(npc_id)
     
-    if not npc:
+    if not npc or is_hidden("npc", npc_id):
         raise HTTPException(status_code=404, detail="NPC not found")
     
     # Get lineage for attribution
@@ -195,7 +348,8 @@ async def api_remix_npc(req: RemixNPCRequest, authorization: Optional[str] = Hea
     
     # Validate content if provided
     if req.name or req.trait or req.backstory:
-        valid, error = validate_npc_content(req.name or "", req.trait or "", req.backstory or "")
+        original = get_npc(req.original_npc_id)
+        valid, error = validate_npc_content(req.name or "", req.trait or "", req.backstory or "", remix_of=original)
         if not valid:
             raise HTTPException(status_code=400, detail=error)
     
@@ -272,6 +426,8 @@ async def api_join_room(room_id: str, authorization: Optional[str] = Header(None
     if not room:
         raise HTTPException(status_code=400, detail="Cannot join room")
     
+    room_hub.publish(room_id, {"type": "join", "room_id": room_id, "user_id": user["id"]})
+    
     return {"room": room}
 
 @app.post("/api/rooms/{room_id}/leave")
@@ -279,63 +435,69 @@ async def api_leave_room(room_id: str, authorization: Optional[str] = Header(Non
     user = get_current_user(authorization)
     
     leave_room(room_id, user["id"])
+    room_hub.publish(room_id, {"type": "leave", "room_id": room_id, "user_id": user["id"]})
     
     return {"success": True}
 
-@app.post("/api/rooms/{room_id}/chat")
-async def api_room_chat(room_id: str, req: ChatMessageRequest, authorization: Optional[str] = Header(None)):
+@app.post("/api/rooms/{room_id}/heartbeat")
+async def api_room_heartbeat(room_id: str, authorization: Optional[str] = Header(None)):
     user = get_current_user(authorization)
     
-    # Check rate limit
-    allowed, error = check_rate_limit(user["id"], "chat_message")
-    if not allowed:
-        raise HTTPException(status_code=429, detail=error)
+    if not heartbeat(room_id, user["id"]):
+        raise HTTPException(status_code=400, detail="Not in room")
     
-    # Validate message
-    valid, error = validate_message(req.message)
-    if not valid:
-        raise HTTPException(status_code=400, detail=error)
+    return {"success": True, "ttl": PRESENCE_TTL}
+
+@app.get("/api/rooms/{room_id}/presence")
+async def api_room_presence(room_id: str):
+    participants = list(get_room_participants(room_id))
     
-    success = add_chat_message(room_id, user["id"], req.message)
+    return {
+        "count": len(participants),
+        "participants": participants,
+        "idle": len(participants) == 0
+    }
+
+@app.post("/api/rooms/{room_id}/chat")
+async def api_room_chat(room_id: str, req: ChatMessageRequest, authorization: Optional[str] = Header(None)):
+    user = get_current_user(authorization)
     
-    if not success:
-        raise HTTPException(status_code=404, detail="Room not found")
+    post_chat_message(room_id, user["id"], req.message)
     
     return {"success": True}
 
-@app.post("/api/rooms/interact")
-async def api_npc_interaction(req: NPCInteractionRequest, authorization: Optional[str] = Header(None)):
-    user = get_current_user(authorization)
+@app.get("/api/rooms/{room_id}/chat")
+async def api_get_room_chat(room_id: str, since: int = 0, limit: int = 100):
+    messages = get_room_entries_since(room_id, "chat", since, min(limit, 500))
     
-    npc = get_npc(req.npc_id)
-    if not npc:
-        raise HTTPException(status_code=404, detail="NPC not found")
+    if messages is None:
+        raise HTTPException(status_code=404, detail="Room not found")
     
-    # Find the dialogue response
-    dialogue_tree = npc.get("dialogue_tree", [])
-    response_text = "..."
+    return {"messages": messages}
+
+@app.get("/api/rooms/{room_id}/chat/history")
+async def api_get_room_chat_history(room_id: str, before: Optional[int] = None, limit: int = 50):
+    messages = get_room_history(room_id, "chat", before, min(limit, 500))
     
-    for node in dialogue_tree:
-        if node["id"] == "start":
-            for response in node.get("responses", []):
-                if response["id"] == req.dialogue_id:
-                    response_text = response["response"]
-                    break
+    if messages is None:
+        raise HTTPException(status_code=404, detail="Room not found")
     
-    # Record interaction
-    add_npc_interaction(req.room_id, user["id"], req.npc_id, req.dialogue_id, response_text)
+    return {"messages": messages}
+
+@app.get("/api/rooms/{room_id}/interactions")
+async def api_get_room_interactions(room_id: str, since: int = 0, limit: int = 100):
+    interactions = get_room_entries_since(room_id, "interactions", since, min(limit, 500))
     
-    # Increment NPC interaction count
-    from npc_generator import load_npcs, save_npcs
-    npcs = load_npcs()
-    if req.npc_id in npcs:
-        npcs[req.npc_id]["interactions"] = npcs[req.npc_id].get("interactions", 0) + 1
-        save_npcs(npcs)
+    if interactions is None:
+        raise HTTPException(status_code=404, detail="Room not found")
     
-    return {
-        "response": response_text,
-        "npc_name": npc["name"]
-    }
+    return {"interactions": interactions}
+
+@app.post("/api/rooms/interact")
+async def api_npc_interaction(req: NPCInteractionRequest, authorization: Optional[str] = Header(None)):
+    user = get_current_user(authorization)
+    
+    return interact_with_npc(req.room_id, user["id"], req.npc_id, req.dialogue_id)
 
 @app.get("/api/rooms")
 async def api_get_active_rooms(limit: int = 20):
@@ -351,8 +513,69 @@ async def api_close_room(room_id: str, authorization: Optional[str] = Header(Non
     if not success:
         raise HTTPException(status_code=403, detail="Not authorized to close room")
     
+    # Every worker disconnects its sockets when it sees the "closed" event
+    room_hub.publish(room_id, {"type": "closed", "room_id": room_id})
+    
     return {"success": True}
 
+@app.websocket("/ws/rooms/{room_id}")
+async def ws_room(websocket: WebSocket, room_id: str):
+    """
+    Live room channel. Server pushes small event deltas:
+      {"type": "join"|"leave", "user_id"}, {"type": "chat", "user_id", "message", "timestamp"},
+      {"type": "interaction", ...}, {"type": "hidden", "seq"} (a chat message removed
+      by moderation), {"type": "closed"}
+    Clients may send {"type": "chat", "message"}, {"type": "interact", "npc_id", "dialogue_id"}
+    or {"type": "ping"}. Every client message refreshes presence, so idle clients
+    should ping more often than PRESENCE_TTL.
+    """
+    owner_url = shard_router.remote_owner_url(websocket.url.path, websocket.headers)
+    if owner_url:
+        await shard_router.proxy_websocket(websocket, owner_url)
+        return
+    
+    user = get_websocket_user(websocket)
+    if not user:
+        await websocket.close(code=1008)
+        return
+    
+    room = join_room(room_id, user["id"])
+    if not room:
+        await websocket.close(code=1008)
+        return
+    
+    await websocket.accept()
+    conn = RoomConnection(websocket, room_id, user["id"])
+    room_hub.add(conn)
+    room_hub.publish(room_id, {"type": "join", "room_id": room_id, "user_id": user["id"]})
+    
+    try:
+        while True:
+            data = await receive_json(websocket)
+            kind = data.get("type") if isinstance(data, dict) else None
+            # Any message from the client counts as a presence heartbeat
+            if not heartbeat(room_id, user["id"]):
+                conn.offer({"type": "error", "status": 400, "detail": "Not in room"})
+                break
+            try:
+                if kind == "chat":
+                    post_chat_message(room_id, user["id"], str(data.get("message", "")))
+                elif kind == "interact":
+                    result = interact_with_npc(room_id, user["id"], str(data.get("npc_id", "")), str(data.get("dialogue_id", "")))
+                    conn.offer({"type": "interaction_result", **result})
+                elif kind == "ping":
+                    conn.offer({"type": "pong"})
+                else:
+                    conn.offer({"type": "error", "detail": "Unknown message type"})
+            except HTTPException as e:
+                conn.offer({"type": "error", "status": e.status_code, "detail": e.detail})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        room_hub.remove(conn)
+        await conn.close()
+        leave_room(room_id, user["id"])
+        room_hub.publish(room_id, {"type": "leave", "room_id": room_id, "user_id": user["id"]})
 # ===== Sharing Endpoints =====
 
 @app.post("/api/share/{npc_id}")
@@ -382,9 +605,9 @@ async def api_create_share(npc_id: str, authorization: Optional[str] = Header(No
 
 @app.get("/api/share/{share_id}")
 async def api_get_share(share_id: str):
-    share = get_share(share_id)
+    share = None if is_hidden("share", share_id) else get_share(share_id)
     
-    if not share:
+    if not share or is_hidden("npc", share["npc_id"]):
         raise HTTPException(status_code=404, detail="Share not found")
     
     # Get NPC data
@@ -396,19 +619,96 @@ async def api_get_share(share_id: str):
     }
 
 @app.get("/api/share/{share_id}/image")
-async def api_get_share_image(share_id: str):
-    share = get_share(share_id)
+async def api_get_share_image(share_id: str, request: Request):
+    # Read-only lookup: serving an image doesn't count as a view
+    share = None if is_hidden("share", share_id) else find_share(share_id)
     
-    if not share or not os.path.exists(share["image_path"]):
+    if not share or is_hidden("npc", share["npc_id"]):
         raise HTTPException(status_code=404, detail="Image not found")
     
-    return FileResponse(share["image_path"], media_type="image/png")
+    image_path = share["image_path"]
+    record_image_access(image_path)
+    
+    # Still rendering (or evicted and re-rendering): wait briefly, then fall
+    # back to the placeholder
+    if not os.path.exists(image_path):
+        pending = ensure_og_image(share, get_npc(share["npc_id"]))
+        if pending is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(pending)), OG_IMAGE_WAIT)
+            except Exception:
+                pass
+    
+    if not os.path.exists(image_path):
+        return FileResponse(get_placeholder_image(), media_type="image/png", headers={"Cache-Control": "no-store"})
+    
+    # Serve WebP to clients that accept it
+    media_type = "image/png"
+    if "image/webp" in request.headers.get("accept", ""):
+        image_path, media_type = webp_variant_path(image_path), "image/webp"
+    
+    etag = image_etag(image_path)
+    headers = {"ETag": etag, "Cache-Control": SHARE_IMAGE_CACHE_CONTROL, "Vary": "Accept"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    if media_type == "image/webp" and not os.path.exists(image_path):
+        webp_path = await asyncio.to_thread(get_webp_variant, share["image_path"])
+        if webp_path is None:
+            image_path, media_type = share["image_path"], "image/png"
+            headers["ETag"] = image_etag(image_path)
+    
+    # Open before responding: the sweeper may remove the file at any point
+    # after the checks above, but an open file stays readable
+    image_file = open_share_image(image_path)
+    if image_file is None:
+        ensure_og_image(share, get_npc(share["npc_id"]))
+        return FileResponse(get_placeholder_image(), media_type="image/png", headers={"Cache-Control": "no-store"})
+    return OpenFileResponse(image_file, media_type=media_type, headers=headers)
+
+class OpenFileResponse(FileResponse):
+    """
+    FileResponse for a file opened before responding, so the sweeper can
+    delete the path mid-response without breaking it. Stats come from the
+    open handle, servers with pathsend are pointed at the handle's /proc
+    path where there is one, and the handle is closed however the response
+    ends (including client disconnects).
+    """
+    def __init__(self, file, **kwargs):
+        super().__init__(file.name, stat_result=os.fstat(file.fileno()), **kwargs)
+        self.file = file
+        fd_path = f"/proc/self/fd/{file.fileno()}"
+        if os.path.exists(fd_path):
+            self.path = fd_path
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.file.close()
+
+    @asynccontextmanager
+    async def _open_file(self):
+        # Closed by __call__, after every range has been read
+        yield anyio.wrap_file(self.file)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
 
 @app.get("/api/shares/popular")
 async def api_get_popular_shares(limit: int = 10):
     shares = get_popular_shares(limit)
     return {"shares": shares}
 
+@app.get("/api/shares/render-stats")
+async def api_get_render_stats():
+    return {**get_render_stats(), "page_cache": get_share_page_stats(), "image_store": get_image_store_stats()}
+
 @app.get("/api/shares/user/{user_id}")
 async def api_get_user_shares(user_id: str, limit: int = 20):
     shares = get_user_shares(user_id, limit)
@@ -421,6 +721,24 @@ async def api_get_weekly_leaderboard():
     leaderboard = get_weekly_leaderboard()
     return leaderboard
 
+@app.get("/api/leaderboard/weekly/archive")
+async def api_get_leaderboard_archive():
+    return {"weeks": get_archived_weeks()}
+
+@app.get("/api/leaderboard/weekly/{week}")
+async def api_get_archived_leaderboard(week: str, limit: int = 20):
+    leaderboard = get_archived_leaderboard(week, limit)
+    
+    if not leaderboard:
+        raise HTTPException(status_code=404, detail="No snapshot for that week")
+    
+    return leaderboard
+
+@app.get("/api/leaderboard/history/{creator_id}")
+async def api_get_rank_history(creator_id: str):
+    history = get_creator_rank_history(creator_id)
+    return {"creator_id": creator_id, "history": history}
+
 @app.get("/api/leaderboard/remixed")
 async def api_get_most_remixed(limit: int = 10):
     npcs = get_most_remixed_npcs(limit)
@@ -439,6 +757,96 @@ async def api_get_rate_limits(authorization: Optional[str] = Header(None)):
     status = get_user_rate_limit_status(user["id"])
     return {"rate_limits": status}
 
+def get_moderator(authorization: Optional[str]) -> Dict:
+    user = get_current_user(authorization)
+    if not is_moderator(user):
+        raise HTTPException(status_code=403, detail="Moderators only")
+    return user
+
+@app.get("/api/moderation/stats")
+async def api_get_moderation_stats(authorization: Optional[str] = Header(None)):
+    get_moderator(authorization)
+    return {"filter": get_filter_stats(), "queue": get_report_queue_stats()}
+
+def reported_content_exists(content_type: str, content_id: str) -> bool:
+    """
+    Check a report target exists. Chat messages are "<room_id>:<seq>".
+    """
+    if content_type == "npc":
+        return get_npc(content_id) is not None
+    if content_type == "share":
+        return find_share(content_id) is not None
+    if content_type == "room":
+        return room_exists(content_id)
+    if content_type == "user":
+        return get_user_by_id(content_id) is not None
+    if content_type == "chat":
+        room_id, _, seq = content_id.rpartition(":")
+        return seq.isdigit() and chat_message_exists(room_id, int(seq))
+    return False
+
+def announce_hidden_room_content(items: List[Dict]):
+    """
+    Tell open room sockets about hidden chat messages, and close rooms that
+    were hidden. Repeats for already-hidden content are harmless.
+    """
+    for item in items:
+        if not item["hidden"]:
+            continue
+        if item["content_type"] == "room":
+            room_hub.publish(item["content_id"], {"type": "closed", "room_id": item["content_id"], "reason": "hidden"})
+        elif item["content_type"] == "chat":
+            room_id, _, seq = item["content_id"].rpartition(":")
+            room_hub.publish(room_id, {"type": "hidden", "room_id": room_id, "seq": int(seq)})
+
+@app.post("/api/moderation/report")
+async def api_report_content(req: ReportRequest, authorization: Optional[str] = Header(None)):
+    user = get_current_user(authorization)
+    
+    if req.content_type not in REPORTABLE_TYPES:
+        raise HTTPException(status_code=400, detail=f"content_type must be one of: {', '.join(REPORTABLE_TYPES)}")
+    if not req.reason.strip() or len(req.reason) > 500:
+        raise HTTPException(status_code=400, detail="Reason must be 1-500 characters")
+    
+    allowed, error = check_rate_limit(user["id"], "content_report")
+    if not allowed:
+        raise HTTPException(status_code=429, detail=error)
+    
+    if not reported_content_exists(req.content_type, req.content_id):
+        raise HTTPException(status_code=404, detail="Content not found")
+    
+    item = report_content(user["id"], req.content_type, req.content_id, req.reason.strip())
+    announce_hidden_room_content([item])
+    return {"report": {k: item[k] for k in ("id", "status", "report_count", "hidden")}}
+
+@app.get("/api/moderation/queue")
+async def api_get_report_queue(status: str = "open", content_type: Optional[str] = None, limit: int = 50,
+                               authorization: Optional[str] = Header(None)):
+    get_moderator(authorization)
+    return {"items": get_report_queue(status, content_type, min(limit, 200)), "counts": get_report_queue_stats()}
+
+@app.get("/api/moderation/content/{content_type}/{content_id}")
+async def api_get_content_reports(content_type: str, content_id: str, authorization: Optional[str] = Header(None)):
+    get_moderator(authorization)
+    item = get_report(content_type, content_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="No reports for this content")
+    return {"item": item}
+
+@app.post("/api/moderation/claim")
+async def api_claim_reports(req: ClaimReportsRequest, authorization: Optional[str] = Header(None)):
+    moderator = get_moderator(authorization)
+    return {"items": claim_reports(moderator["id"], min(req.limit, 100), req.content_type)}
+
+@app.post("/api/moderation/resolve")
+async def api_resolve_reports(req: ResolveReportsRequest, authorization: Optional[str] = Header(None)):
+    moderator = get_moderator(authorization)
+    if req.action not in ("remove", "dismiss"):
+        raise HTTPException(status_code=400, detail="action must be 'remove' or 'dismiss'")
+    items = resolve_reports(moderator["id"], req.item_ids, req.action, req.note)
+    announce_hidden_room_content(items)
+    return {"items": items}
+
 # ===== Health Check =====
 
 @app.get("/api/health")
@@ -471,119 +879,15 @@ async def classic_frontend():
 @app.get("/share/{share_id}", response_class=HTMLResponse)
 async def share_page(share_id: str):
     try:
-        share = get_share(share_id)
-        if not share:
+        share = None if is_hidden("share", share_id) else get_share(share_id)
+        if not share or is_hidden("npc", share["npc_id"]):
             return HTMLResponse("<h1>Share not found</h1>", status_code=404)
         
-        npc = get_npc(share["npc_id"])
-        if not npc:
+        page = get_share_page(share, get_npc)
+        if page is None:
             return HTMLResponse("<h1>NPC not found</h1>", status_code=404)
         
-        # HTML escape user content to prevent XSS
-        import html
-        safe_name = html.escape(npc['name'])
-        safe_trait = html.escape(npc['trait'])
-        safe_backstory = html.escape(npc['backstory'])
-        safe_npc_id = html.escape(npc['id'])
-        safe_share_id = html.escape(share_id)
-        
-        # Simple share page with OG meta tags
-        html_content = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8">
-    <title>{safe_name} - Realm of Echoes</title>
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    
-    <!-- Open Graph / Facebook -->
-    <meta property="og:type" content="website">
-    <meta property="og:title" content="{safe_name} - {safe_trait}">
-    <meta property="og:description" content="{safe_backstory[:200]}">
-    <meta property="og:image" content="/api/share/{safe_share_id}/image">
-    
-    <!-- Twitter -->
-    <meta name="twitter:card" content="summary_large_image">
-    <meta name="twitter:title" content="{safe_name} - {safe_trait}">
-    <meta name="twitter:description" content="{safe_backstory[:200]}">
-    <meta name="twitter:image" content="/api/share/{safe_share_id}/image">
-    
-    <style>
-        body {{
-            font-family: system-ui, -apple-system, sans-serif;
-            background: #0b1020;
-            color: #dfe7ff;
-            padding: 40px 20px;
-            margin: 0;
-        }}
-        .container {{
-            max-width: 800px;
-            margin: 0 auto;
-            background: #0f1724;
-            border: 1px solid #1f2a44;
-            border-radius: 12px;
-            padding: 40px;
-        }}
-        h1 {{
-            color: #2563eb;
-            margin-top: 0;
-        }}
-        .trait {{
-            background: #14203a;
-            padding: 8px 16px;
-            border-radius: 999px;
-            display: inline-block;
-            margin: 12px 0;
-            font-weight: 600;
-        }}
-        .backstory {{
-            line-height: 1.6;
-            margin: 24px 0;
-        }}
-        .actions {{
-            margin-top: 32px;
-        }}
-        button {{
-            background: #2563eb;
-            color: white;
-            border: none;
-            padding: 12px 24px;
-            border-radius: 8px;
-            cursor: pointer;
-            font-size: 16px;
-            margin-right: 12px;
-        }}
-        button:hover {{
-            background: #1d4ed8;
-        }}
-        .secondary {{
-            background: #1f2a44;
-        }}
-        .secondary:hover {{
-            background: #2a3a54;
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>{safe_name}</h1>
-        <div class="trait">• {safe_trait.upper()} •</div>
-        <div class="backstory">{safe_backstory}</div>
-        
-        <div class="actions">
-            <button onclick="window.location.href='/api/npcs/{safe_npc_id}'">View Full NPC</button>
-            <button class="secondary" onclick="window.location.href='/'">Create Your Own</button>
-        </div>
-        
-        <div style="margin-top: 32px; padding-top: 32px; border-top: 1px solid #1f2a44; color: #9fb0ff; font-size: 14px;">
-            <p>Shared by a player in Realm of Echoes</p>
-            <p>Views: {share.get('view_count', 0)} | Remixes: {share.get('remix_from_share', 0)}</p>
-        </div>
-    </div>
-</body>
-</html>
-        """
-        return HTMLResponse(html_content)
+        return HTMLResponse(page)
     except Exception as e:
         # Don't expose stack trace details to users
         return HTMLResponse("<h1>Error loading share</h1><p>An error occurred while loading this share.</p>", status_code=500)
@@ -0,0 +1,475 @@
+# benchmarks.py
+# Local performance harnesses
+# Run: python benchmarks.py <name> [options]   (python benchmarks.py -h for the list)
+#
+# Each benchmark runs in a throwaway data directory so it never touches .data/
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def use_scratch_dir() -> str:
+    """
+    chdir into a temp directory (modules create .data/ relative to cwd)
+    """
+    scratch = tempfile.mkdtemp(prefix="roe-bench-")
+    os.symlink(os.path.join(REPO_DIR, "static"), os.path.join(scratch, "static"))
+    os.chdir(scratch)
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    return scratch
+
+# ===== Room sharding =====
+
+def seed_room_data(num_rooms: int, num_users: int):
+    """
+    Write rooms and users directly (skips bcrypt, which would dominate setup).
+    Every user is a member of every room, since only members may chat.
+    """
+    os.makedirs(".data", exist_ok=True)
+    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+    users = {}
+    for i in range(num_users):
+        user_id = str(uuid.uuid4())
+        users[user_id] = {"id": user_id, "email": f"bench{i}@example.com", "username": f"bench{i}",
+                          "password": "!", "created_at": now, "reputation": 0}
+    rooms = {}
+    for i in range(num_rooms):
+        room_id = str(uuid.uuid4())
+        rooms[room_id] = {"id": room_id, "name": f"bench-{i}", "creator_id": next(iter(users)),
+                          "npc_id": None, "max_players": max(4, num_users), "created_at": now,
+                          "active": True, "players": list(users)}
+    with open(".data/users.json", "w") as f:
+        json.dump(users, f)
+    with open(".data/rooms.json", "w") as f:
+        json.dump(rooms, f)
+    return list(users), list(rooms)
+
+def start_shards(count: int, base_port: int):
+    shards = {f"shard{i}": f"http://127.0.0.1:{base_port + i}" for i in range(count)}
+    peers = ",".join(f"{shard_id}={url}" for shard_id, url in shards.items())
+    procs = []
+    for i, (shard_id, url) in enumerate(shards.items()):
+        env = {**os.environ, "SHARD_ID": shard_id, "SHARD_URL": url, "SHARD_PEERS": peers}
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api:app", "--app-dir", REPO_DIR,
+             "--port", str(base_port + i), "--log-level", "warning"],
+            env=env
+        ))
+    return shards, procs
+
+async def wait_healthy(urls, timeout: float = 30.0):
+    import httpx
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        for url in urls:
+            while True:
+                try:
+                    if (await client.get(url + "/api/health")).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"shard at {url} did not start")
+                await asyncio.sleep(0.2)
+
+async def blast_chat(shards, tokens, room_ids, indices, concurrency: int, route: str):
+    import httpx
+    from sharding import HashRing
+
+    ring = HashRing(shards)
+    urls = list(shards.values())
+    sent = {"ok": 0, "failed": 0}
+    queue = asyncio.Queue()
+    for i in indices:
+        queue.put_nowait(i)
+
+    async def worker(client):
+        while not queue.empty():
+            i = queue.get_nowait()
+            room_id = room_ids[i % len(room_ids)]
+            # Each token stays well under the per-hour chat limit
+            token = tokens[i % len(tokens)]
+            url = shards[ring.owner(room_id)] if route == "owner" else random.choice(urls)
+            resp = await client.post(
+                f"{url}/api/rooms/{room_id}/chat",
+                json={"room_id": room_id, "message": f"benchmark message {i}"},
+                headers={"Authorization": f"Bearer {token}"}
+            )
+            sent["ok" if resp.status_code == 200 else "failed"] += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return sent
+
+def _chat_client(job):
+    # One load-generating process; a single Python client saturates long
+    # before a handful of shards do
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    return asyncio.run(blast_chat(*job))
+
+def bench_shards(args):
+    """
+    Chat messages/sec through 1..N local shard processes
+    """
+    root = use_scratch_dir()
+    counts = [n for n in (1, 2, 4, 8, 16) if n <= args.max_shards]
+    results = []
+    try:
+        for count in counts:
+            run_dir = os.path.join(root, f"run{count}")
+            os.makedirs(run_dir)
+            os.symlink(os.path.join(REPO_DIR, "static"), os.path.join(run_dir, "static"))
+            os.chdir(run_dir)
+            user_ids, room_ids = seed_room_data(args.rooms, args.messages // 50 + 1)
+
+            from auth import create_access_token
+            tokens = [create_access_token({"user_id": uid}) for uid in user_ids]
+
+            shards, procs = start_shards(count, args.port)
+            try:
+                asyncio.run(wait_healthy(shards.values()))
+                jobs = [
+                    (shards, tokens, room_ids, range(c, args.messages, args.clients), args.concurrency, args.route)
+                    for c in range(args.clients)
+                ]
+                with multiprocessing.Pool(args.clients) as pool:
+                    start = time.perf_counter()
+                    results_per_client = pool.map(_chat_client, jobs)
+                    elapsed = time.perf_counter() - start
+                sent = {k: sum(r[k] for r in results_per_client) for k in ("ok", "failed")}
+            finally:
+                for proc in procs:
+                    proc.terminate()
+                for proc in procs:
+                    proc.wait()
+            rate = sent["ok"] / elapsed
+            print(f"shards={count:<3} ok={sent['ok']:<6} failed={sent['failed']:<4} {elapsed:6.2f}s  {rate:8.1f} msg/s")
+            if not sent["ok"]:
+                raise SystemExit(f"no messages accepted with {count} shard(s); check the shard logs")
+            results.append((count, rate))
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(root, ignore_errors=True)
+
+    if results:
+        base = results[0][1]
+        print("scaling: " + ", ".join(f"{n}x -> {rate / base:.2f}" for n, rate in results))
+
+# ===== OG images =====
+
+def bench_og_images(args):
+    """
+    OG renders/sec: cold (fonts and canvas rebuilt per render, as before the
+    render cache), warm (preloaded per worker), and repeat shares of the
+    same NPC (content-hash hits)
+    """
+    root = use_scratch_dir()
+    try:
+        import sharing
+
+        npcs = [(f"Echo {i}", "curious", f"Wanderer number {i} who remembers every road and every name it was ever told.")
+                for i in range(args.renders)]
+
+        def rate(label, fn):
+            start = time.perf_counter()
+            for i, npc in enumerate(npcs):
+                fn(i, npc)
+            elapsed = time.perf_counter() - start
+            print(f"{label:<8} {len(npcs)} in {elapsed:6.2f}s  {len(npcs) / elapsed:8.1f} renders/s")
+            return len(npcs) / elapsed
+
+        def cold(i, npc):
+            sharing._fonts = sharing._base_canvas = None
+            sharing.generate_og_image(*npc, os.path.join(sharing.IMAGES_DIR, f"cold-{i}.png"))
+
+        def warm(i, npc):
+            sharing.generate_og_image(*npc)
+
+        def repeat(i, npc):
+            # What create_share does for an NPC that was already shared
+            path = sharing.og_image_path(*npcs[0])
+            if not os.path.exists(path):
+                sharing.generate_og_image(*npcs[0], path)
+
+        before = rate("cold", cold)
+        after = rate("warm", warm)
+        cached = rate("repeat", repeat)
+        print(f"warm vs cold: {after / before:.2f}x, repeat share vs cold: {cached / before:.0f}x")
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(root, ignore_errors=True)
+
+# ===== Rate limiting =====
+
+def _rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def bench_rate_limit(args):
+    """
+    check_rate_limit over many distinct users on the in-process broker:
+    checks/sec and memory per user, then status reads and idle-key eviction
+    """
+    root = use_scratch_dir()
+    try:
+        import moderation
+        from broker import InProcessBroker
+
+        moderation.broker = broker = InProcessBroker()
+        users = [f"user-{i}" for i in range(args.users)]
+
+        base_rss = _rss_bytes()
+        start = time.perf_counter()
+        for user_id in users:
+            moderation.check_rate_limit(user_id, "chat_message")
+        elapsed = time.perf_counter() - start
+        grown = _rss_bytes() - base_rss
+        print(f"check    {args.users} users in {elapsed:6.2f}s  {args.users / elapsed:10.0f} checks/s  "
+              f"~{grown / args.users:.0f} B/user ({broker.key_count()} keys)")
+
+        # One hot user hammering past the limit
+        start = time.perf_counter()
+        denied = sum(not moderation.check_rate_limit("hot-user", "chat_message")[0] for _ in range(args.hot))
+        elapsed = time.perf_counter() - start
+        print(f"hot key  {args.hot} checks in {elapsed:6.2f}s  {args.hot / elapsed:10.0f} checks/s  ({denied} denied)")
+
+        sample = users[:: max(1, args.users // 10000)]
+        start = time.perf_counter()
+        for user_id in sample:
+            moderation.get_user_rate_limit_status(user_id)
+        elapsed = time.perf_counter() - start
+        print(f"status   {len(sample)} reads in {elapsed:6.2f}s  {len(sample) / elapsed:10.0f} reads/s")
+
+        # Fast-forward past the TTL: writes from active users reclaim idle keys
+        for key in list(broker._expires):
+            broker._set_expiry(key, -1)
+        # Every call sweeps a batch, so this needs about users / batch calls;
+        # the cap only guards against a broker that stops expiring keys
+        max_writes = args.users + 1000
+        start = time.perf_counter()
+        writes = 0
+        while broker.key_count() > 1 and writes < max_writes:
+            moderation.check_rate_limit("active-user", "npc_create")
+            writes += 1
+        elapsed = time.perf_counter() - start
+        if broker.key_count() > 1:
+            raise SystemExit(f"evict    {broker.key_count() - 1} idle keys left after {writes} writes")
+        print(f"evict    {args.users} idle users reclaimed by {writes} writes in {elapsed:6.2f}s")
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(root, ignore_errors=True)
+
+# ===== Content filter =====
+
+def bench_wordfilter(args):
+    """
+    Blocklist scan throughput (MB/s) for a large wordlist, against the old
+    one-substring-check-per-term loop
+    """
+    from wordfilter import WordFilter, normalize_text
+
+    rng = random.Random(42)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+
+    def word(lo, hi):
+        return "".join(rng.choice(letters) for _ in range(rng.randint(lo, hi)))
+
+    # Long terms so random clean text rarely hits one and the whole text is scanned
+    terms = [word(8, 14) for _ in range(args.terms)]
+    text = " ".join(word(2, 9) for _ in range(args.kb * 1024 // 6))[: args.kb * 1024]
+    mb = len(text.encode()) / (1024 * 1024)
+
+    start = time.perf_counter()
+    wf = WordFilter(terms)
+    print(f"build    {args.terms} terms in {time.perf_counter() - start:6.2f}s")
+
+    start = time.perf_counter()
+    hit = wf.find(text)
+    elapsed = time.perf_counter() - start
+    print(f"automaton {mb:.2f} MB in {elapsed:6.2f}s  {mb / elapsed:6.2f} MB/s  (match: {hit})")
+
+    # The old loop: one substring search per term. Time a slice and scale.
+    sample = normalize_text(text[:16 * 1024])
+    sample_mb = len(sample) / (1024 * 1024)
+    start = time.perf_counter()
+    any(term in sample for term in terms)
+    elapsed = time.perf_counter() - start
+    print(f"naive    {sample_mb:.3f} MB in {elapsed:6.2f}s  {sample_mb / elapsed:6.2f} MB/s")
+
+# ===== Tile world =====
+
+def _legacy_chunk(rng):
+    # The original representation: a dict per tile under "x,y" keys
+    from chunks import BIOMES, CHUNK_SIZE
+    return {f"{x},{y}": {"biome": rng.choice(BIOMES), "effect": None}
+            for y in range(CHUNK_SIZE) for x in range(CHUNK_SIZE)}
+
+def bench_chunk_memory(args):
+    """
+    Resident memory for N generated chunks: compact Chunk objects vs. the
+    old dict-per-tile layout (measured on a sample and extrapolated)
+    """
+    import gc
+    from chunks import generate_chunks, dump_chunks
+
+    rng = random.Random(1)
+    gc.collect()
+    base = _rss_bytes()
+    legacy = {f"{i},0": _legacy_chunk(rng) for i in range(args.legacy_sample)}
+    legacy_per_chunk = (_rss_bytes() - base) / args.legacy_sample
+    legacy_json = len(json.dumps(next(iter(legacy.values()))))
+    del legacy
+    gc.collect()
+
+    base = _rss_bytes()
+    start = time.perf_counter()
+    world = {}
+    for start_row in range(0, args.chunks, 10_000):
+        coords = [(i % 1000, i // 1000) for i in range(start_row, min(start_row + 10_000, args.chunks))]
+        world.update(((c.cx, c.cy), c) for c in generate_chunks(coords))
+    elapsed = time.perf_counter() - start
+    compact_per_chunk = (_rss_bytes() - base) / args.chunks
+    compact_bin = len(next(iter(world.values())).to_bytes())
+
+    gb = 1024 ** 3
+    print(f"legacy   {legacy_per_chunk:8.0f} B/chunk in memory  ({legacy_per_chunk * args.chunks / gb:6.2f} GB at {args.chunks}, "
+          f"extrapolated)  {legacy_json} B/chunk as JSON")
+    print(f"compact  {compact_per_chunk:8.0f} B/chunk in memory  ({compact_per_chunk * args.chunks / gb:6.2f} GB at {args.chunks}, "
+          f"measured)  {compact_bin} B/chunk serialised; generated in {elapsed:.1f}s")
+    start = time.perf_counter()
+    blob = dump_chunks(world.values())
+    print(f"serialise {len(world)} chunks -> {len(blob) / 1024 ** 2:.0f} MB in {time.perf_counter() - start:.1f}s")
+
+def bench_chunk_gen(args):
+    """
+    Chunks/sec: the per-tile random loop (terrain 1) vs. value noise
+    (terrain 2) one chunk per call and in batches
+    """
+    from chunks import generate_chunk, generate_chunks
+
+    def rate(label, batch, terrain):
+        coords = [(i % 1000, i // 1000) for i in range(args.chunks)]
+        start = time.perf_counter()
+        for i in range(0, len(coords), batch):
+            if batch == 1:
+                generate_chunk(*coords[i], terrain=terrain)
+            else:
+                generate_chunks(coords[i:i + batch], terrain=terrain)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<22} {args.chunks / elapsed:10.0f} chunks/s")
+        return args.chunks / elapsed
+
+    before = rate("random loop", 1, 1)
+    rate("noise, single", 1, 2)
+    rate("noise, batch of 16", 16, 2)
+    after = rate(f"noise, batch of {args.batch}", args.batch, 2)
+    print(f"batched noise vs random loop: {after / before:.1f}x")
+
+def bench_chunk_batch(args):
+    """
+    Loading the chunks around a player: one /get_chunk JSON request per chunk
+    vs. a single /get_chunks (JSON runs, binary, and binary with a version
+    map for a view the client already holds), served in-process by main.app.
+    """
+    root = use_scratch_dir()
+    try:
+        from fastapi.testclient import TestClient
+        import main as tiles
+        from chunks import chunks_in_radius
+
+        client = TestClient(tiles.app)
+        r = args.radius
+        per_view = (2 * r + 1) ** 2
+
+        def views(label, urls_for):
+            total_bytes = requests = 0
+            start = time.perf_counter()
+            for i in range(args.views):
+                # A new spot each view so nothing is cached server-side beyond the chunk store
+                for url in urls_for(i * (2 * r + 1), 0):
+                    total_bytes += len(client.get(url).content)
+                    requests += 1
+            elapsed = time.perf_counter() - start
+            print(f"{label:<18} {total_bytes / args.views:9.0f} B/view  {requests / args.views:5.0f} req/view  "
+                  f"{args.views / elapsed:8.1f} views/s  {requests / elapsed:8.1f} req/s")
+
+        def known_map(cx, cy):
+            return ";".join(f"{x},{y},{tiles.world.get(x, y).version}" for x, y in chunks_in_radius(cx, cy, r))
+
+        print(f"radius {r}: {per_view} chunks per view, {args.views} views")
+        views("get_chunk json", lambda cx, cy: [f"/get_chunk?cx={x}&cy={y}" for x, y in chunks_in_radius(cx, cy, r)])
+        views("get_chunks json", lambda cx, cy: [f"/get_chunks?cx={cx}&cy={cy}&radius={r}&format=json"])
+        views("get_chunks binary", lambda cx, cy: [f"/get_chunks?cx={cx}&cy={cy}&radius={r}"])
+        views("  + version map", lambda cx, cy: [f"/get_chunks?cx={cx}&cy={cy}&radius={r}&known={known_map(cx, cy)}"])
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(root, ignore_errors=True)
+
+# ===== CLI =====
+
+BENCHMARKS = {
+    "shards": bench_shards,
+    "og": bench_og_images,
+    "ratelimit": bench_rate_limit,
+    "wordfilter": bench_wordfilter,
+    "chunk-memory": bench_chunk_memory,
+    "chunk-batch": bench_chunk_batch,
+    "chunk-gen": bench_chunk_gen,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Realm of Echoes local benchmarks")
+    sub = parser.add_subparsers(dest="name", required=True)
+
+    p = sub.add_parser("shards", help="room chat throughput vs. number of shard processes")
+    p.add_argument("--max-shards", type=int, default=4)
+    p.add_argument("--rooms", type=int, default=64)
+    p.add_argument("--messages", type=int, default=4000)
+    p.add_argument("--concurrency", type=int, default=32, help="in-flight requests per client process")
+    p.add_argument("--clients", type=int, default=4, help="load-generating processes")
+    p.add_argument("--port", type=int, default=8100)
+    p.add_argument("--route", choices=["owner", "random"], default="owner",
+                   help="send each message to its owning shard, or to a random shard (forwarded)")
+
+    p = sub.add_parser("og", help="OG image renders/sec, cold vs. warm vs. cached")
+    p.add_argument("--renders", type=int, default=200)
+
+    p = sub.add_parser("ratelimit", help="rate limiter checks/sec and memory with many users")
+    p.add_argument("--users", type=int, default=1_000_000)
+    p.add_argument("--hot", type=int, default=100_000, help="checks from a single over-limit user")
+
+    p = sub.add_parser("wordfilter", help="blocklist scan MB/s with a large wordlist")
+    p.add_argument("--terms", type=int, default=50_000)
+    p.add_argument("--kb", type=int, default=2048, help="size of text to scan")
+
+    p = sub.add_parser("chunk-memory", help="memory per tile-world chunk, compact vs. dict-per-tile")
+    p.add_argument("--chunks", type=int, default=1_000_000)
+    p.add_argument("--legacy-sample", type=int, default=20_000)
+
+    p = sub.add_parser("chunk-batch", help="bytes and req/s loading a view radius, per-chunk vs. batched")
+    p.add_argument("--radius", type=int, default=2)
+    p.add_argument("--views", type=int, default=100)
+
+    p = sub.add_parser("chunk-gen", help="chunk generation chunks/sec, random loop vs. vectorised noise")
+    p.add_argument("--chunks", type=int, default=50_000)
+    p.add_argument("--batch", type=int, default=1024)
+
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
+
+if __name__ == "__main__":
+    main()
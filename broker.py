@@ -0,0 +1,405 @@
+# broker.py
+# Shared state and pub/sub for multi-worker deployments
+#
+# Room presence, event fan-out and rate-limit counters go through a broker so
+# they work across uvicorn workers. Set REDIS_URL to use Redis; without it an
+# in-process broker is used, which is only correct for a single worker.
+
+from abc import ABC, abstractmethod
+import fnmatch
+import heapq
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+# callback(channel, message)
+MessageHandler = Callable[[str, Dict], None]
+
+class Broker(ABC):
+    """
+    Interface shared by the Redis and in-process brokers. Keys and members
+    are strings; published messages are JSON-serialisable dicts.
+    """
+    # --- sets ---
+    @abstractmethod
+    def set_add(self, key: str, member: str):
+        ...
+
+    @abstractmethod
+    def set_remove(self, key: str, member: str):
+        ...
+
+    @abstractmethod
+    def set_members(self, key: str) -> Set[str]:
+        ...
+
+    @abstractmethod
+    def set_size(self, key: str) -> int:
+        ...
+
+    # --- sorted sets (member -> score) ---
+    @abstractmethod
+    def zadd(self, key: str, member: str, score: float):
+        ...
+
+    @abstractmethod
+    def zrem(self, key: str, member: str):
+        ...
+
+    @abstractmethod
+    def zscore(self, key: str, member: str) -> Optional[float]:
+        ...
+
+    @abstractmethod
+    def zmembers(self, key: str) -> Set[str]:
+        ...
+
+    @abstractmethod
+    def zcount(self, key: str) -> int:
+        ...
+
+    @abstractmethod
+    def zremrangebyscore(self, key: str, max_score: float) -> int:
+        """
+        Remove members with score <= max_score, returning how many were removed
+        """
+
+    @abstractmethod
+    def zpop_due(self, key: str, max_score: float, limit: int = 100) -> List[Tuple[str, float]]:
+        """
+        Remove and return up to `limit` members with score <= max_score,
+        lowest score first. Each member is returned to exactly one caller.
+        """
+
+    # --- counters ---
+    @abstractmethod
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        ...
+
+    @abstractmethod
+    def get_counter(self, key: str) -> int:
+        ...
+
+    @abstractmethod
+    def incr_within_limit(self, key: str, previous_key: str, previous_weight: float, limit: int, ttl: float) -> bool:
+        """
+        Atomically add one to counter `key` unless that would take
+        previous * previous_weight + current above `limit` (sliding-window
+        rate limiting). Returns True if the hit was counted.
+        """
+
+    # --- keys ---
+    @abstractmethod
+    def expire(self, key: str, ttl: float):
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    # --- pub/sub ---
+    @abstractmethod
+    def publish(self, channel: str, message: Dict):
+        ...
+
+    @abstractmethod
+    def subscribe(self, pattern: str, handler: MessageHandler):
+        """
+        Call `handler` for every message on channels matching a glob pattern.
+        Handlers may run on a background thread.
+        """
+
+class ScoredSet:
+    """
+    Sorted-set stand-in: a member -> score dict plus a lazily-pruned min-heap,
+    so removing the lowest scores costs O(k log n) rather than a full scan
+    """
+    def __init__(self):
+        self.scores: Dict[str, float] = {}
+        self.heap: List[Tuple[float, str]] = []
+
+    def __len__(self):
+        return len(self.scores)
+
+    def add(self, member: str, score: float):
+        self.scores[member] = score
+        heapq.heappush(self.heap, (score, member))
+        # Rebuild if stale heap entries dominate
+        if len(self.heap) > 2 * len(self.scores) + 64:
+            self.heap = [(sc, m) for m, sc in self.scores.items()]
+            heapq.heapify(self.heap)
+
+    def remove(self, member: str):
+        self.scores.pop(member, None)
+
+    def pop_due(self, max_score: float, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        due = []
+        while self.heap and self.heap[0][0] <= max_score:
+            if limit is not None and len(due) >= limit:
+                break
+            score, member = heapq.heappop(self.heap)
+            if self.scores.get(member) == score:
+                del self.scores[member]
+                due.append((member, score))
+        return due
+
+# Expired keys the in-process broker reclaims per write, so keys nobody
+# reads again (idle users, closed rooms) don't accumulate
+EXPIRY_SWEEP_BATCH = 16
+
+class InProcessBroker(Broker):
+    """
+    Dict-backed broker for single-worker runs and tests
+    """
+    def __init__(self):
+        self._data: Dict[str, object] = {}
+        self._expires: Dict[str, float] = {}
+        self._expiry_queue = ScoredSet()  # key -> expires_at, oldest first
+        self._handlers: List[Tuple[str, MessageHandler]] = []
+        self._lock = threading.RLock()
+
+    def _get(self, key: str, factory=None):
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._forget(key)
+        value = self._data.get(key)
+        if value is None and factory is not None:
+            value = self._data[key] = factory()
+        return value
+
+    def _forget(self, key: str):
+        self._data.pop(key, None)
+        if self._expires.pop(key, None) is not None:
+            self._expiry_queue.remove(key)
+
+    def _set_expiry(self, key: str, ttl: float):
+        expires_at = time.monotonic() + ttl
+        self._expires[key] = expires_at
+        self._expiry_queue.add(key, expires_at)
+
+    def _sweep_expired(self):
+        # Amortised active expiry: a few due keys per write
+        for key, _ in self._expiry_queue.pop_due(time.monotonic(), EXPIRY_SWEEP_BATCH):
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+
+    def _drop_if_empty(self, key: str):
+        if not self._data.get(key):
+            self._forget(key)
+
+    def key_count(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def set_add(self, key, member):
+        with self._lock:
+            self._sweep_expired()
+            self._get(key, set).add(member)
+
+    def set_remove(self, key, member):
+        with self._lock:
+            members = self._get(key)
+            if members is not None:
+                members.discard(member)
+                self._drop_if_empty(key)
+
+    def set_members(self, key):
+        with self._lock:
+            return set(self._get(key) or ())
+
+    def set_size(self, key):
+        with self._lock:
+            return len(self._get(key) or ())
+
+    def zadd(self, key, member, score):
+        with self._lock:
+            self._sweep_expired()
+            self._get(key, ScoredSet).add(member, score)
+
+    def zrem(self, key, member):
+        with self._lock:
+            zset = self._get(key)
+            if zset is not None:
+                zset.remove(member)
+                self._drop_if_empty(key)
+
+    def zscore(self, key, member):
+        with self._lock:
+            zset = self._get(key)
+            return zset.scores.get(member) if zset is not None else None
+
+    def zmembers(self, key):
+        with self._lock:
+            zset = self._get(key)
+            return set(zset.scores) if zset is not None else set()
+
+    def zcount(self, key):
+        with self._lock:
+            return len(self._get(key) or ())
+
+    def zremrangebyscore(self, key, max_score):
+        return len(self.zpop_due(key, max_score, limit=None))
+
+    def zpop_due(self, key, max_score, limit=100):
+        with self._lock:
+            zset = self._get(key)
+            if zset is None:
+                return []
+            due = zset.pop_due(max_score, limit)
+            self._drop_if_empty(key)
+            return due
+
+    def incr(self, key, amount=1, ttl=None):
+        with self._lock:
+            self._sweep_expired()
+            value = (self._get(key) or 0) + amount
+            self._data[key] = value
+            if ttl is not None and key not in self._expires:
+                self._set_expiry(key, ttl)
+            return value
+
+    def get_counter(self, key):
+        with self._lock:
+            return self._get(key) or 0
+
+    def incr_within_limit(self, key, previous_key, previous_weight, limit, ttl):
+        with self._lock:
+            # Denied hits sweep too, or a client held at its limit stops expiry
+            self._sweep_expired()
+            previous = self._get(previous_key) or 0
+            if previous * previous_weight + (self._get(key) or 0) + 1 > limit:
+                return False
+            self.incr(key, 1, ttl=ttl)
+            return True
+
+    def expire(self, key, ttl):
+        with self._lock:
+            self._sweep_expired()
+            if self._get(key) is not None:
+                self._set_expiry(key, ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._forget(key)
+
+    def publish(self, channel, message):
+        # Round-trip through JSON so subscribers see what Redis would deliver
+        payload = json.loads(json.dumps(message))
+        for pattern, handler in list(self._handlers):
+            if fnmatch.fnmatchcase(channel, pattern):
+                handler(channel, payload)
+
+    def subscribe(self, pattern, handler):
+        self._handlers.append((pattern, handler))
+
+# KEYS: current, previous counter. ARGV: previous weight, limit, ttl.
+# Runs as one script, so no other client sees or changes the counters
+# between the check and the increment.
+INCR_WITHIN_LIMIT_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+if previous * tonumber(ARGV[1]) + current + 1 > tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('INCR', KEYS[1])
+if current == 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return 1
+"""
+
+class RedisBroker(Broker):
+    """
+    Redis-backed broker. Pass `client` to use an existing (or stand-in) client.
+    """
+    def __init__(self, url: Optional[str] = None, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.client = client
+        self._incr_within_limit = client.register_script(INCR_WITHIN_LIMIT_SCRIPT)
+        self._pubsub = None
+        self._listener = None
+
+    def set_add(self, key, member):
+        self.client.sadd(key, member)
+
+    def set_remove(self, key, member):
+        self.client.srem(key, member)
+
+    def set_members(self, key):
+        return set(self.client.smembers(key))
+
+    def set_size(self, key):
+        return self.client.scard(key)
+
+    def zadd(self, key, member, score):
+        self.client.zadd(key, {member: score})
+
+    def zrem(self, key, member):
+        self.client.zrem(key, member)
+
+    def zscore(self, key, member):
+        return self.client.zscore(key, member)
+
+    def zmembers(self, key):
+        return set(self.client.zrange(key, 0, -1))
+
+    def zcount(self, key):
+        return self.client.zcard(key)
+
+    def zremrangebyscore(self, key, max_score):
+        return self.client.zremrangebyscore(key, "-inf", max_score)
+
+    def zpop_due(self, key, max_score, limit=100):
+        candidates = self.client.zrangebyscore(key, "-inf", max_score, start=0, num=limit, withscores=True)
+        due = []
+        for member, score in candidates:
+            # ZREM returns 1 only for the worker that actually removed it
+            if self.client.zrem(key, member):
+                due.append((member, score))
+        return due
+
+    def incr(self, key, amount=1, ttl=None):
+        pipe = self.client.pipeline()
+        if ttl is not None:
+            # Only the first write in a window sets the expiry
+            pipe.set(key, 0, ex=int(ttl) + 1, nx=True)
+        pipe.incrby(key, amount)
+        return pipe.execute()[-1]
+
+    def get_counter(self, key):
+        return int(self.client.get(key) or 0)
+
+    def incr_within_limit(self, key, previous_key, previous_weight, limit, ttl):
+        return bool(self._incr_within_limit(keys=[key, previous_key], args=[previous_weight, limit, int(ttl) + 1]))
+
+    def expire(self, key, ttl):
+        self.client.expire(key, int(ttl) + 1)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def publish(self, channel, message):
+        self.client.publish(channel, json.dumps(message))
+
+    def subscribe(self, pattern, handler):
+        def on_message(msg):
+            handler(msg["channel"], json.loads(msg["data"]))
+
+        if self._pubsub is None:
+            self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.psubscribe(**{pattern: on_message})
+        if self._listener is None:
+            self._listener = self._pubsub.run_in_thread(sleep_time=0.01, daemon=True)
+
+def create_broker() -> Broker:
+    if REDIS_URL:
+        return RedisBroker(REDIS_URL)
+    return InProcessBroker()
+
+broker = create_broker()
@@ -0,0 +1,515 @@
+# chunks.py
+# Compact tile-world chunks: a biome byte per tile plus a sparse effect overlay,
+# seeded generation and region-file storage of player diffs
+
+import json
+import os
+import random
+import struct
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+from terrain import generate_biomes
+
+CHUNK_SIZE = 10
+TILES_PER_CHUNK = CHUNK_SIZE * CHUNK_SIZE
+
+# Ids are stored on disk; only ever append to these lists
+BIOMES = ['forest', 'water', 'mountain', 'desert', 'lava', 'ice', 'plains', 'swamp']
+BIOME_IDS = {name: i for i, name in enumerate(BIOMES)}
+EFFECTS = [None, 'glow']
+EFFECT_IDS = {name: i for i, name in enumerate(EFFECTS)}
+
+# cx, cy, version, effect count; then TILES_PER_CHUNK biome bytes and
+# (tile index, effect id) byte pairs
+CHUNK_HEADER = struct.Struct("<iiIH")
+
+class Chunk:
+    """
+    CHUNK_SIZE x CHUNK_SIZE tiles. Biomes are one byte per tile (row-major);
+    effects are rare, so they live in a dict that stays None until used.
+    `version` increases on every change.
+    """
+    __slots__ = ("cx", "cy", "biomes", "effects", "version")
+
+    def __init__(self, cx: int, cy: int, biomes: bytearray, effects: Optional[Dict[int, int]] = None, version: int = 0):
+        self.cx = cx
+        self.cy = cy
+        self.biomes = biomes
+        self.effects = effects or None
+        self.version = version
+
+    @staticmethod
+    def _index(x: int, y: int) -> int:
+        if not (0 <= x < CHUNK_SIZE and 0 <= y < CHUNK_SIZE):
+            raise ValueError(f"Tile ({x}, {y}) is outside the chunk")
+        return y * CHUNK_SIZE + x
+
+    def get_tile(self, x: int, y: int) -> Tuple[str, Optional[str]]:
+        i = self._index(x, y)
+        effect = self.effects.get(i, 0) if self.effects else 0
+        return BIOMES[self.biomes[i]], EFFECTS[effect]
+
+    def set_tile(self, x: int, y: int, biome: Optional[str] = None, effect: Optional[str] = None):
+        """
+        Change a tile's biome (if given) and effect (None clears it)
+        """
+        i = self._index(x, y)
+        if biome is not None:
+            self.biomes[i] = BIOME_IDS[biome]
+        if effect is None:
+            if self.effects:
+                self.effects.pop(i, None)
+                if not self.effects:
+                    self.effects = None
+        else:
+            if self.effects is None:
+                self.effects = {}
+            self.effects[i] = EFFECT_IDS[effect]
+        self.version += 1
+
+    def to_json(self) -> Dict:
+        """
+        The client's tile map: {"x,y": {"biome": ..., "effect": ...}}
+        """
+        effects = self.effects or {}
+        tiles = {}
+        for i, biome_id in enumerate(self.biomes):
+            effect = effects.get(i)
+            tiles[f"{i % CHUNK_SIZE},{i // CHUNK_SIZE}"] = {
+                "biome": BIOMES[biome_id],
+                "effect": EFFECTS[effect] if effect else None
+            }
+        return tiles
+
+    def to_bytes(self) -> bytes:
+        effects = sorted(self.effects.items()) if self.effects else []
+        overlay = bytes(b for item in effects for b in item)
+        return CHUNK_HEADER.pack(self.cx, self.cy, self.version, len(effects)) + bytes(self.biomes) + overlay
+
+    @classmethod
+    def from_bytes(cls, data: bytes, offset: int = 0) -> Tuple["Chunk", int]:
+        """
+        Decode one chunk starting at `offset`; returns (chunk, next offset)
+        """
+        cx, cy, version, n_effects = CHUNK_HEADER.unpack_from(data, offset)
+        offset += CHUNK_HEADER.size
+        biomes = bytearray(data[offset:offset + TILES_PER_CHUNK])
+        offset += TILES_PER_CHUNK
+        overlay = data[offset:offset + 2 * n_effects]
+        effects = {overlay[j]: overlay[j + 1] for j in range(0, len(overlay), 2)}
+        return cls(cx, cy, biomes, effects, version), offset + 2 * n_effects
+
+    @classmethod
+    def from_json(cls, cx: int, cy: int, tiles: Dict) -> "Chunk":
+        """
+        Build from the legacy string-keyed tile dict
+        """
+        chunk = cls(cx, cy, bytearray(TILES_PER_CHUNK))
+        for key, tile in tiles.items():
+            x, y = (int(v) for v in key.split(","))
+            i = y * CHUNK_SIZE + x
+            chunk.biomes[i] = BIOME_IDS.get(tile.get("biome"), 0)
+            if tile.get("effect"):
+                if chunk.effects is None:
+                    chunk.effects = {}
+                chunk.effects[i] = EFFECT_IDS.get(tile["effect"], 1)
+        return chunk
+
+# ===== Wire format =====
+# Batch responses: WIRE_HEADER (magic, format version, chunk count), then per
+# chunk WIRE_CHUNK_HEADER (cx, cy, version, run count, effect count),
+# (run length, biome id) byte pairs over the row-major tiles and
+# (tile index, effect id) byte pairs.
+
+WIRE_MAGIC = b"RC"
+WIRE_FORMAT_VERSION = 1
+WIRE_HEADER = struct.Struct("<2sBH")
+WIRE_CHUNK_HEADER = struct.Struct("<iiIBB")
+
+def biome_runs(biomes: bytes) -> List[Tuple[int, int]]:
+    """
+    Run-length encode a biome array: [(run length, biome id), ...]
+    """
+    runs = []
+    start = 0
+    for i in range(1, len(biomes) + 1):
+        if i == len(biomes) or biomes[i] != biomes[start]:
+            runs.append((i - start, biomes[start]))
+            start = i
+    return runs
+
+def encode_chunks(chunks: List[Chunk]) -> bytes:
+    parts = [WIRE_HEADER.pack(WIRE_MAGIC, WIRE_FORMAT_VERSION, len(chunks))]
+    for chunk in chunks:
+        runs = biome_runs(chunk.biomes)
+        effects = sorted(chunk.effects.items()) if chunk.effects else []
+        parts.append(WIRE_CHUNK_HEADER.pack(chunk.cx, chunk.cy, chunk.version, len(runs), len(effects)))
+        parts.append(bytes(b for run in runs for b in run))
+        parts.append(bytes(b for item in effects for b in item))
+    return b"".join(parts)
+
+def chunk_runs_json(chunk: Chunk) -> Dict:
+    """
+    The run-length JSON form of a chunk, for clients that don't read binary
+    """
+    return {
+        "cx": chunk.cx,
+        "cy": chunk.cy,
+        "version": chunk.version,
+        "runs": biome_runs(chunk.biomes),
+        "effects": sorted(chunk.effects.items()) if chunk.effects else [],
+    }
+
+def chunks_in_radius(cx: int, cy: int, radius: int) -> List[Tuple[int, int]]:
+    """
+    Chunk coordinates in the square of `radius` around (cx, cy), nearest first
+    """
+    coords = [(cx + dx, cy + dy) for dy in range(-radius, radius + 1) for dx in range(-radius, radius + 1)]
+    coords.sort(key=lambda c: (c[0] - cx) ** 2 + (c[1] - cy) ** 2)
+    return coords
+
+def parse_version_map(known: str) -> Dict[Tuple[int, int], int]:
+    """
+    Parse a client's "cx,cy,version;..." list of chunks it already holds
+    """
+    versions = {}
+    for entry in known.split(";"):
+        parts = entry.split(",")
+        if len(parts) == 3:
+            try:
+                cx, cy, version = (int(p) for p in parts)
+            except ValueError:
+                continue
+            versions[(cx, cy)] = version
+    return versions
+
+# Terrain is a pure function of (seed, cx, cy); only player changes are stored
+WORLD_SEED = int(os.getenv("WORLD_SEED", "1337"))
+
+# Terrain generators by version; a saved world keeps the one it was made with.
+# 1: an independent random biome per tile; 2: layered value noise (terrain.py)
+TERRAIN_VERSION = 2
+
+def _white_noise_biomes(cx: int, cy: int, seed: int) -> bytearray:
+    rng = random.Random(f"{seed}:{cx}:{cy}")
+    return bytearray(rng.randrange(len(BIOMES)) for _ in range(TILES_PER_CHUNK))
+
+def generate_chunks(coords: List[Tuple[int, int]], seed: int = WORLD_SEED, terrain: int = TERRAIN_VERSION) -> List[Chunk]:
+    """
+    Generated chunks for `coords`, in one vectorised batch
+    """
+    if not coords:
+        return []
+    if terrain == 1:
+        return [Chunk(cx, cy, _white_noise_biomes(cx, cy, seed)) for cx, cy in coords]
+    biomes = generate_biomes(coords, seed, CHUNK_SIZE)
+    return [Chunk(cx, cy, bytearray(tiles)) for (cx, cy), tiles in zip(coords, biomes)]
+
+def generate_chunk(cx: int, cy: int, seed: int = WORLD_SEED, terrain: int = TERRAIN_VERSION) -> Chunk:
+    return generate_chunks([(cx, cy)], seed, terrain)[0]
+
+def dump_chunks(chunks: Iterator[Chunk]) -> bytes:
+    return b"".join(chunk.to_bytes() for chunk in chunks)
+
+# ===== Diff persistence =====
+# A chunk is stored as a diff against its generated terrain: a CHUNK_HEADER
+# (count = changed tiles) and (tile index, biome, effect) triples.
+
+def chunk_diff(chunk: Chunk, base: Chunk) -> bytes:
+    """
+    Tiles where `chunk` differs from the generated `base`
+    """
+    effects = chunk.effects or {}
+    changed = [
+        (i, chunk.biomes[i], effects.get(i, 0))
+        for i in range(TILES_PER_CHUNK)
+        if chunk.biomes[i] != base.biomes[i] or i in effects
+    ]
+    body = bytes(b for triple in changed for b in triple)
+    return CHUNK_HEADER.pack(chunk.cx, chunk.cy, chunk.version, len(changed)) + body
+
+def patch_chunk(chunk: Chunk, data: bytes, offset: int = 0) -> int:
+    """
+    Apply the diff record at `offset` to the chunk's generated terrain.
+    Returns the offset just past the record.
+    """
+    _, _, version, count = CHUNK_HEADER.unpack_from(data, offset)
+    offset += CHUNK_HEADER.size
+    for j in range(offset, offset + 3 * count, 3):
+        i, biome, effect = data[j], data[j + 1], data[j + 2]
+        chunk.biomes[i] = biome
+        if effect:
+            if chunk.effects is None:
+                chunk.effects = {}
+            chunk.effects[i] = effect
+    chunk.version = version
+    return offset + 3 * count
+
+# ===== Region files =====
+# Chunks are grouped REGION_SIZE x REGION_SIZE per file. A region starts with
+# a header and an offset table (offset, length, capacity) per chunk slot;
+# records are chunk diffs. A record is rewritten in place while it fits its
+# slot, otherwise appended at the end of the file.
+
+REGION_SIZE = 32
+REGION_MAGIC = b"ROER"
+REGION_HEADER = struct.Struct("<4sB3x")
+REGION_ENTRY = struct.Struct("<IHH")
+REGION_TABLE_OFFSET = REGION_HEADER.size
+REGION_DATA_OFFSET = REGION_TABLE_OFFSET + REGION_SIZE * REGION_SIZE * REGION_ENTRY.size
+REGION_FORMAT_VERSION = 1
+# Slack so a record can grow a little before it has to move
+RECORD_ALIGN = 64
+EMPTY_REGION_TABLE = ((0, 0, 0),) * (REGION_SIZE * REGION_SIZE)
+
+def region_of(cx: int, cy: int) -> Tuple[Tuple[int, int], int]:
+    """
+    (region coordinates, slot index in that region) for a chunk
+    """
+    return (cx // REGION_SIZE, cy // REGION_SIZE), (cy % REGION_SIZE) * REGION_SIZE + cx % REGION_SIZE
+
+class ChunkStore:
+    """
+    Chunks by (cx, cy), backed by region files under `directory`.
+
+    Untouched chunks are generated on demand and never stored. Changed chunks
+    are marked dirty and written (as diffs) by `flush`, which the caller runs
+    on a tick. At most `max_resident` chunks are kept in memory; the least
+    recently used clean ones are dropped and re-read or regenerated later.
+    """
+    META_FILE = "world.meta"
+
+    # Missing chunks are generated a GENERATE_BLOCK x GENERATE_BLOCK aligned
+    # block at a time; players move into neighbouring chunks
+    GENERATE_BLOCK = 4
+
+    def __init__(self, directory: str, seed: int = WORLD_SEED, terrain: int = TERRAIN_VERSION, max_resident: int = 50000):
+        self.directory = directory
+        self.max_resident = max_resident
+        self._resident: "OrderedDict[Tuple[int, int], Chunk]" = OrderedDict()
+        self._dirty: Set[Tuple[int, int]] = set()
+        # Being written by flush: like dirty ones, these can't be evicted
+        self._flushing: Set[Tuple[int, int]] = set()
+        self._flush_lock = threading.Lock()
+        self._tables: Dict[Tuple[int, int], Sequence[Tuple[int, int, int]]] = {}
+        self._lock = threading.RLock()
+        self.reads = 0
+        self.writes = 0
+        self.evictions = 0
+        # Called with each chunk that's requested after (re)loading, or
+        # changed. Listeners run after the store lock is released, possibly on
+        # several threads at once and out of order, so they should read the
+        # chunk's current state; they may call back into the store.
+        self.listeners: List[Callable[[Chunk], None]] = []
+        self._unannounced: Set[Tuple[int, int]] = set()
+
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, self.META_FILE)
+        if os.path.exists(meta_path):
+            # Diffs only make sense against the terrain they were taken from
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            seed = meta["seed"]
+            terrain = meta.get("terrain", 1)
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"seed": seed, "terrain": terrain, "region_size": REGION_SIZE}, f)
+        self.seed = seed
+        self.terrain = terrain
+
+    def _region_path(self, region: Tuple[int, int]) -> str:
+        return os.path.join(self.directory, f"r.{region[0]}.{region[1]}.region")
+
+    def _table(self, region: Tuple[int, int]) -> Sequence[Tuple[int, int, int]]:
+        table = self._tables.get(region)
+        if table is None:
+            path = self._region_path(region)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    raw = f.read(REGION_DATA_OFFSET)
+                if REGION_HEADER.unpack_from(raw)[0] != REGION_MAGIC:
+                    raise ValueError(f"{path} is not a region file")
+                table = [entry for entry in REGION_ENTRY.iter_unpack(raw[REGION_TABLE_OFFSET:])]
+            else:
+                # Shared until the region is first written
+                table = EMPTY_REGION_TABLE
+            self._tables[region] = table
+        return table
+
+    def _is_stored(self, cx: int, cy: int) -> bool:
+        region, slot = region_of(cx, cy)
+        return self._table(region)[slot][1] > 0
+
+    def _read_records(self, keys: List[Tuple[int, int]]) -> List[bytes]:
+        """
+        Stored diff records for `keys`, opening each region file once
+        """
+        by_region: Dict[Tuple[int, int], List[int]] = {}
+        for i, key in enumerate(keys):
+            by_region.setdefault(region_of(*key)[0], []).append(i)
+        records: List[bytes] = [b""] * len(keys)
+        for region, indexes in by_region.items():
+            table = self._table(region)
+            with open(self._region_path(region), "rb") as f:
+                for i in indexes:
+                    offset, length, _ = table[region_of(*keys[i])[1]]
+                    f.seek(offset)
+                    records[i] = f.read(length)
+        self.reads += len(keys)
+        return records
+
+    def _load_missing(self, keys: List[Tuple[int, int]]):
+        """
+        Bring non-resident chunks in. Terrain for all of them, stored or
+        not, is generated in one batch; stored ones then get their diffs.
+        """
+        missing = list(dict.fromkeys(key for key in keys if key not in self._resident))
+        stored = [key for key in missing if self._is_stored(*key)]
+        stored_set = set(stored)
+        fresh = [key for key in missing if key not in stored_set]
+        chunks = generate_chunks(stored + fresh, self.seed, self.terrain)
+        for chunk, record in zip(chunks, self._read_records(stored)):
+            patch_chunk(chunk, record)
+        for chunk in chunks:
+            self._resident[(chunk.cx, chunk.cy)] = chunk
+        self._unannounced.update(missing)
+
+    def _announce(self, key: Tuple[int, int], pending: List[Chunk]):
+        # Listeners hear about a loaded chunk when it's first asked for
+        if key in self._unannounced:
+            self._unannounced.discard(key)
+            pending.append(self._resident[key])
+
+    def _notify(self, pending: List[Chunk]):
+        # Never called with the store lock held
+        for chunk in pending:
+            for listener in self.listeners:
+                listener(chunk)
+
+    def get(self, cx: int, cy: int) -> Chunk:
+        key = (cx, cy)
+        pending: List[Chunk] = []
+        with self._lock:
+            chunk = self._resident.get(key)
+            if chunk is None:
+                size = self.GENERATE_BLOCK
+                bx, by = cx - cx % size, cy - cy % size
+                self._load_missing([key] + [(bx + dx, by + dy) for dy in range(size) for dx in range(size)])
+                chunk = self._resident[key]
+            self._resident.move_to_end(key)
+            self._announce(key, pending)
+            self._evict()
+        self._notify(pending)
+        return chunk
+
+    def get_many(self, keys: List[Tuple[int, int]]) -> List[Chunk]:
+        """
+        Chunks for `keys`, generating all missing ones in a single batch
+        """
+        pending: List[Chunk] = []
+        with self._lock:
+            self._load_missing(keys)
+            chunks = []
+            for key in keys:
+                self._resident.move_to_end(key)
+                self._announce(key, pending)
+                chunks.append(self._resident[key])
+            self._evict()
+        self._notify(pending)
+        return chunks
+
+    def mark_modified(self, chunk: Chunk):
+        """
+        Record that a chunk changed; it stays in memory until flushed
+        """
+        key = (chunk.cx, chunk.cy)
+        with self._lock:
+            self._resident[key] = chunk
+            self._resident.move_to_end(key)
+            self._dirty.add(key)
+            self._evict()
+        self._notify([chunk])
+
+    def _evict(self):
+        # Oldest first; unwritten chunks go back to the recent end
+        kept = 0
+        while len(self._resident) > self.max_resident and kept < len(self._resident):
+            key, chunk = self._resident.popitem(last=False)
+            if key in self._dirty or key in self._flushing:
+                self._resident[key] = chunk
+                kept += 1
+                continue
+            self._unannounced.discard(key)
+            self.evictions += 1
+
+    def flush(self) -> int:
+        """
+        Write dirty chunks to their regions; returns how many were written.
+        The store lock is only held to take the dirty set, so reads carry on
+        while regions are written; chunks changed meanwhile stay dirty.
+        """
+        with self._flush_lock:
+            with self._lock:
+                keys = list(self._dirty)
+                chunks = [self._resident[key] for key in keys]
+                self._flushing.update(keys)
+                self._dirty.clear()
+            try:
+                by_region: Dict[Tuple[int, int], List[Chunk]] = {}
+                for chunk in chunks:
+                    by_region.setdefault(region_of(chunk.cx, chunk.cy)[0], []).append(chunk)
+                for region, region_chunks in by_region.items():
+                    self._write_region(region, region_chunks)
+            except BaseException:
+                with self._lock:
+                    self._dirty.update(keys)
+                raise
+            finally:
+                with self._lock:
+                    self._flushing.difference_update(keys)
+                    self._evict()
+            with self._lock:
+                self.writes += len(keys)
+            return len(keys)
+
+    def _write_region(self, region: Tuple[int, int], chunks: List[Chunk]):
+        # Runs outside the store lock: readers never look up the slots being
+        # written, since those chunks stay resident until flush finishes
+        path = self._region_path(region)
+        with self._lock:
+            table = self._table(region)
+            created = table is EMPTY_REGION_TABLE
+            if created:
+                table = self._tables[region] = list(EMPTY_REGION_TABLE)
+        if created:
+            with open(path, "wb") as f:
+                f.write(REGION_HEADER.pack(REGION_MAGIC, REGION_FORMAT_VERSION))
+                f.write(b"".join(REGION_ENTRY.pack(*entry) for entry in table))
+        bases = generate_chunks([(chunk.cx, chunk.cy) for chunk in chunks], self.seed, self.terrain)
+        with open(path, "r+b") as f:
+            end = f.seek(0, os.SEEK_END)
+            for chunk, base in zip(chunks, bases):
+                slot = region_of(chunk.cx, chunk.cy)[1]
+                record = chunk_diff(chunk, base)
+                offset, _, capacity = table[slot]
+                if len(record) > capacity:
+                    offset, capacity = end, -(-len(record) // RECORD_ALIGN) * RECORD_ALIGN
+                    end += capacity
+                f.seek(offset)
+                f.write(record.ljust(capacity, b"\x00"))
+                table[slot] = (offset, len(record), capacity)
+                f.seek(REGION_TABLE_OFFSET + slot * REGION_ENTRY.size)
+                f.write(REGION_ENTRY.pack(*table[slot]))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "resident": len(self._resident),
+                "max_resident": self.max_resident,
+                "dirty": len(self._dirty),
+                "regions_indexed": len(self._tables),
+                "reads": self.reads,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
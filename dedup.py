@@ -0,0 +1,166 @@
+# dedup.py
+# Near-duplicate detection over recent content (SimHash + LSH buckets)
+
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+import numpy as np
+from wordfilter import FOLD_TABLE
+
+FINGERPRINT_BITS = 64
+
+# Fingerprints within MAX_DISTANCE bits count as near-duplicates. Short
+# texts (chat) shift several bits per edited word, hence the wide margin;
+# unrelated texts sit around 32 bits apart.
+MAX_DISTANCE = 10
+
+# LSH: the fingerprint is split into bands and only entries sharing a band
+# value (and scope) are compared. With MAX_DISTANCE + 1 bands, fingerprints
+# within MAX_DISTANCE bits differ in at most MAX_DISTANCE bands, so they
+# always share one: the buckets never miss a near-duplicate.
+LSH_BANDS = MAX_DISTANCE + 1
+# (shift, mask) per band; 64 bits don't divide evenly, so some bands are a
+# bit wider than others
+_BAND_EDGES = [band * FINGERPRINT_BITS // LSH_BANDS for band in range(LSH_BANDS + 1)]
+_BAND_SLICES = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(_BAND_EDGES, _BAND_EDGES[1:])]
+
+# Character n-grams over the normalised words; steadier than word features
+# on short texts
+SHINGLE_SIZE = 4
+
+_TOKEN = re.compile(r"\w+")
+
+# 64-bit mixing constants (as in terrain.py), for hashing shingles
+_SHINGLE_PRIMES = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93],
+                           dtype=np.uint64)[:SHINGLE_SIZE]
+_MIX_1 = np.uint64(0xFF51AFD7ED558CCD)
+_MIX_2 = np.uint64(0xC4CEB9FE1A85EC53)
+_SHIFT = np.uint64(33)
+_BIT_POSITIONS = np.arange(FINGERPRINT_BITS, dtype=np.uint64)
+
+def tokenize(text: str) -> List[str]:
+    """
+    Words with case, homoglyphs and digit-leetspeak folded. Split before
+    folding so punctuation stays a separator ("prices!" is "prices").
+    """
+    words = _TOKEN.findall(unicodedata.normalize("NFKC", text).lower())
+    return [word.translate(FOLD_TABLE) for word in words]
+
+def simhash(tokens: List[str]) -> int:
+    """
+    64-bit SimHash over character shingles: similar texts get fingerprints
+    that differ in few bits
+    """
+    joined = " ".join(tokens).ljust(SHINGLE_SIZE)
+    codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    count = len(codes) - SHINGLE_SIZE + 1
+    # Hash every shingle at once: weight each of its characters, then mix
+    h = codes[:count] * _SHINGLE_PRIMES[0]
+    for offset in range(1, SHINGLE_SIZE):
+        h ^= codes[offset:offset + count] * _SHINGLE_PRIMES[offset]
+    h ^= h >> _SHIFT
+    h *= _MIX_1
+    h ^= h >> _SHIFT
+    h *= _MIX_2
+    h ^= h >> _SHIFT
+    # Per-bit majority vote over the shingle hashes
+    ones = ((h[:, None] >> _BIT_POSITIONS) & np.uint64(1)).sum(axis=0)
+    return int(np.bitwise_or.reduce((ones * 2 > count).astype(np.uint64) << _BIT_POSITIONS))
+
+def _bands(fingerprint: int, scope: str):
+    for band, (shift, mask) in enumerate(_BAND_SLICES):
+        yield scope, band, fingerprint >> shift & mask
+
+class NearDuplicateDetector:
+    """
+    Sliding window of recent fingerprints, bounded by count and age.
+    Entries carry a scope (e.g. a user id); only entries of the same scope
+    are compared. `count` reports how many recent entries are near-copies
+    of a text, `add` puts it in the window, `check` does both.
+    """
+    def __init__(self, max_entries: int = 10000, max_age: float = 600.0, min_tokens: int = 4):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.min_tokens = min_tokens
+        self._window: Deque[Tuple[int, int, str, float]] = deque()  # (seq, fingerprint, scope, added_at)
+        self._buckets: Dict[Tuple[str, int, int], Deque[Tuple[int, int]]] = {}  # (scope, band) -> (seq, fingerprint)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        while self._window and (len(self._window) >= self.max_entries or now - self._window[0][3] > self.max_age):
+            seq, fingerprint, scope, _ = self._window.popleft()
+            # Entries leave in insertion order, so they're always at the front of their buckets
+            for key in _bands(fingerprint, scope):
+                bucket = self._buckets[key]
+                if bucket and bucket[0][0] == seq:
+                    bucket.popleft()
+                if not bucket:
+                    del self._buckets[key]
+
+    def fingerprint(self, text: str) -> Optional[int]:
+        """
+        SimHash of a text, or None if it's shorter than min_tokens words
+        (too short to judge; such texts are never counted or added)
+        """
+        tokens = tokenize(text)
+        return simhash(tokens) if len(tokens) >= self.min_tokens else None
+
+    def count(self, text: str, scope: str = "", stop_at: Optional[int] = None) -> int:
+        """
+        Number of near-duplicates of `text` from the same scope in the
+        window (counting stops at `stop_at`), without adding it
+        """
+        fingerprint = self.fingerprint(text)
+        if fingerprint is None:
+            return 0
+        with self._lock:
+            self._evict(time.monotonic())
+            return self._count(fingerprint, scope, stop_at)
+
+    def _count(self, fingerprint: int, scope: str, stop_at: Optional[int]) -> int:
+        seen = set()
+        for key in _bands(fingerprint, scope):
+            for seq, other in self._buckets.get(key, ()):
+                if seq not in seen and (fingerprint ^ other).bit_count() <= MAX_DISTANCE:
+                    seen.add(seq)
+                    if len(seen) == stop_at:
+                        return stop_at
+        return len(seen)
+
+    def add(self, text: str, scope: str = ""):
+        """
+        Record an accepted text in the window
+        """
+        fingerprint = self.fingerprint(text)
+        if fingerprint is None:
+            return
+        with self._lock:
+            self._add(fingerprint, scope, time.monotonic())
+
+    def _add(self, fingerprint: int, scope: str, now: float):
+        self._evict(now)
+        self._seq += 1
+        self._window.append((self._seq, fingerprint, scope, now))
+        for key in _bands(fingerprint, scope):
+            self._buckets.setdefault(key, deque()).append((self._seq, fingerprint))
+
+    def check(self, text: str, scope: str = "", stop_at: Optional[int] = None) -> int:
+        """
+        count() and then add() in one step
+        """
+        fingerprint = self.fingerprint(text)
+        if fingerprint is None:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            seen = self._count(fingerprint, scope, stop_at)
+            self._add(fingerprint, scope, now)
+            return seen
+
+    def __len__(self) -> int:
+        return len(self._window)
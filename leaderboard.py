@@ -1,28 +1,98 @@
 # leaderboard.py
 # Leaderboard and reputation tracking
 
+import asyncio
+import fcntl
+import gzip
 import json
 import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import List, Dict, Optional
 from collections import defaultdict
 
 DATA_DIR = ".data"
+ARCHIVE_DIR = os.path.join(DATA_DIR, "leaderboard_archive")
+ARCHIVE_INDEX_FILE = os.path.join(ARCHIVE_DIR, "index.json")
+ARCHIVE_LOCK_FILE = ARCHIVE_INDEX_FILE + ".lock"
 
-def get_weekly_leaderboard() -> Dict:
+os.makedirs(ARCHIVE_DIR, exist_ok=True)
+if not os.path.exists(ARCHIVE_INDEX_FILE):
+    with open(ARCHIVE_INDEX_FILE, "w") as f:
+        json.dump({"weeks": [], "ranks": {}}, f)
+
+# Column order for archived snapshots (one list per column, one row per creator)
+SNAPSHOT_COLUMNS = [
+    "creator_id", "username", "npcs_created", "total_remixes",
+    "total_shares", "total_interactions", "reputation_score"
+]
+
+# How long the live weekly board is reused before recomputing (seconds)
+LIVE_LEADERBOARD_TTL = 60
+
+_live_cache: Dict = {"computed_at": 0.0, "board": None}
+
+# Most missed weeks frozen after downtime
+MAX_CATCHUP_WEEKS = 52
+
+def week_start(moment: datetime) -> datetime:
     """
-    Calculate weekly leaderboard based on NPC remixes, shares, and interactions
+    Monday 00:00 UTC of the week containing `moment`
     """
+    midnight = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight - timedelta(days=midnight.weekday())
+
+def week_key(moment: datetime) -> str:
+    """
+    ISO week label, e.g. "2024-W07"
+    """
+    year, week, _ = moment.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def get_weekly_leaderboard(end: Optional[datetime] = None, limit: Optional[int] = 20) -> Dict:
+    """
+    Calculate weekly leaderboard based on NPC remixes, shares, and interactions.
+    The window is the 7 days before `end` (defaults to now, cached briefly).
+    """
+    if end is None and limit == 20:
+        cached = _live_cache["board"]
+        if cached and time.monotonic() - _live_cache["computed_at"] < LIVE_LEADERBOARD_TTL:
+            return cached
+        board = _compute_leaderboard(datetime.utcnow(), limit, bounded=False)
+        _live_cache["board"] = board
+        _live_cache["computed_at"] = time.monotonic()
+        return board
+    
+    return _compute_leaderboard(end or datetime.utcnow(), limit, bounded=end is not None)
+
+def _compute_leaderboard(end: datetime, limit: Optional[int], bounded: bool) -> Dict:
     from npc_generator import load_npcs
     from sharing import load_shares
     from auth import load_users
+    from moderation import hidden_ids
     
-    npcs = load_npcs()
-    shares = load_shares()
+    # Hidden content and users don't score
+    hidden_npcs, hidden_shares, hidden_users = hidden_ids("npc"), hidden_ids("share"), hidden_ids("user")
+    npcs = {npc_id: npc for npc_id, npc in load_npcs().items() if npc_id not in hidden_npcs}
+    shares = {share_id: share for share_id, share in load_shares().items()
+              if share_id not in hidden_shares and share.get("npc_id") not in hidden_npcs}
     users = load_users()
     
-    # Calculate cutoff for weekly stats (7 days ago)
-    week_ago = (datetime.utcnow() - timedelta(days=7)).isoformat()
+    # Calculate cutoff for weekly stats (7 days before the end of the window)
+    week_ago = (end - timedelta(days=7)).isoformat()
+    # Frozen windows also exclude anything created after the boundary
+    week_end = end.isoformat() if bounded else "~"
+    
+    # Remixes made inside a frozen window, credited to the original's creator
+    weekly_remixes = defaultdict(int)
+    if bounded:
+        for npc in npcs.values():
+            parent = npcs.get(npc.get("parent_id") or "")
+            creator_id = parent.get("creator_id") if parent else None
+            if creator_id and creator_id not in hidden_users and week_ago <= npc.get("created_at", "") < week_end:
+                weekly_remixes[creator_id] += 1
     
     # Track stats by creator
     creator_stats = defaultdict(lambda: {
@@ -37,7 +107,7 @@ def get_weekly_leaderboard() -> Dict:
     # Aggregate NPC stats
     for npc in npcs.values():
         creator_id = npc.get("creator_id")
-        if not creator_id:
+        if not creator_id or creator_id in hidden_users:
             continue
         
         # Get username
@@ -46,25 +116,32 @@ def get_weekly_leaderboard() -> Dict:
             creator_stats[creator_id]["username"] = user.get("username", "Unknown")
         
         # Only count recent creations for weekly board
-        if npc.get("created_at", "") >= week_ago:
+        if week_ago <= npc.get("created_at", "") < week_end:
             creator_stats[creator_id]["npcs_created"] += 1
         
         # Count remixes and interactions (all time for popular NPCs)
-        creator_stats[creator_id]["total_remixes"] += npc.get("remix_count", 0)
+        if not bounded:
+            creator_stats[creator_id]["total_remixes"] += npc.get("remix_count", 0)
         creator_stats[creator_id]["total_interactions"] += npc.get("interactions", 0)
     
+    for creator_id, count in weekly_remixes.items():
+        creator_stats[creator_id]["total_remixes"] += count
+    
     # Aggregate share stats
     for share in shares.values():
         user_id = share.get("user_id")
-        if not user_id:
+        if not user_id or user_id in hidden_users:
             continue
         
-        if share.get("created_at", "") >= week_ago:
+        if week_ago <= share.get("created_at", "") < week_end:
             creator_stats[user_id]["total_shares"] += 1
         
         # Add view counts and remix conversions
         creator_stats[user_id]["total_interactions"] += share.get("view_count", 0)
-        creator_stats[user_id]["total_remixes"] += share.get("remix_from_share", 0)
+        # Share remixes are untimed counters; frozen windows already count
+        # them as remix NPCs above
+        if not bounded:
+            creator_stats[user_id]["total_remixes"] += share.get("remix_from_share", 0)
     
     # Calculate reputation scores
     for creator_id, stats in creator_stats.items():
@@ -89,10 +166,180 @@ def get_weekly_leaderboard() -> Dict:
     return {
         "period": "weekly",
         "start_date": week_ago,
-        "end_date": datetime.utcnow().isoformat() + "Z",
-        "top_creators": sorted_creators[:20]
+        "end_date": end.isoformat() + "Z",
+        "top_creators": sorted_creators[:limit] if limit else sorted_creators
     }
 
+# ===== Weekly snapshots =====
+
+def _snapshot_path(week: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"{week}.json.gz")
+
+# Readers share one parsed copy of the index until the file changes
+_index_cache: Dict = {"mtime": None, "index": None}
+
+def _read_archive_index() -> Dict:
+    with open(ARCHIVE_INDEX_FILE, "r") as f:
+        return json.load(f)
+
+def load_archive_index() -> Dict:
+    """
+    The archive index, re-read only when another writer has replaced it.
+    Treat as read-only.
+    """
+    mtime = os.stat(ARCHIVE_INDEX_FILE).st_mtime_ns
+    if _index_cache["mtime"] != mtime:
+        _index_cache["index"] = _read_archive_index()
+        _index_cache["mtime"] = mtime
+    return _index_cache["index"]
+
+def save_archive_index(index: Dict):
+    tmp_path = f"{ARCHIVE_INDEX_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp_path, ARCHIVE_INDEX_FILE)
+
+# Serialises freezes in this process; the file lock serialises workers
+_archive_write_lock = threading.Lock()
+
+@contextmanager
+def _archive_lock():
+    """
+    Exclusive access to the archive across worker processes, which all run
+    the snapshot scheduler
+    """
+    with _archive_write_lock, open(ARCHIVE_LOCK_FILE, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def freeze_weekly_leaderboard(boundary: datetime) -> Optional[Dict]:
+    """
+    Freeze the full ranking for the week ending at `boundary` into a
+    gzipped columnar snapshot and record every creator's rank in the index.
+    Returns None if that week is already archived (by any worker).
+    """
+    with _archive_lock():
+        return _freeze_week(boundary)
+
+def _freeze_week(boundary: datetime) -> Optional[Dict]:
+    week = week_key(boundary - timedelta(days=1))
+    index = _read_archive_index()
+    if week in index["weeks"]:
+        return None
+    
+    board = get_weekly_leaderboard(end=boundary, limit=None)
+    rows = board["top_creators"]
+    
+    snapshot = {
+        "week": week,
+        "start_date": board["start_date"],
+        "end_date": board["end_date"],
+        "frozen_at": datetime.utcnow().isoformat() + "Z",
+        "columns": {col: [row[col] for row in rows] for col in SNAPSHOT_COLUMNS}
+    }
+    
+    tmp_path = f"{_snapshot_path(week)}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, "wt") as f:
+        json.dump(snapshot, f, separators=(",", ":"))
+    os.replace(tmp_path, _snapshot_path(week))
+    
+    # Rank index: creator_id -> {week: [rank, score]}
+    for rank, row in enumerate(rows, start=1):
+        history = index["ranks"].setdefault(row["creator_id"], {})
+        history[week] = [rank, row["reputation_score"]]
+    index["weeks"].append(week)
+    index["weeks"].sort()
+    save_archive_index(index)
+    
+    return snapshot
+
+def get_archived_weeks() -> List[str]:
+    """
+    List all archived weeks, oldest first
+    """
+    return load_archive_index()["weeks"]
+
+def get_archived_leaderboard(week: str, limit: int = 20) -> Optional[Dict]:
+    """
+    Load a frozen weekly leaderboard (one file read, independent of archive size)
+    """
+    path = _snapshot_path(week)
+    if not os.path.exists(path):
+        return None
+    
+    with gzip.open(path, "rt") as f:
+        snapshot = json.load(f)
+    
+    columns = snapshot["columns"]
+    count = len(columns["creator_id"])
+    if limit:
+        count = min(count, limit)
+    top_creators = [
+        {col: columns[col][i] for col in SNAPSHOT_COLUMNS}
+        for i in range(count)
+    ]
+    
+    return {
+        "period": "weekly",
+        "week": snapshot["week"],
+        "start_date": snapshot["start_date"],
+        "end_date": snapshot["end_date"],
+        "frozen_at": snapshot["frozen_at"],
+        "top_creators": top_creators
+    }
+
+def get_creator_rank_history(creator_id: str) -> List[Dict]:
+    """
+    Get a creator's archived weekly ranks, oldest first
+    """
+    history = load_archive_index()["ranks"].get(creator_id, {})
+    return [
+        {"week": week, "rank": rank, "reputation_score": score}
+        for week, (rank, score) in sorted(history.items())
+    ]
+
+def week_boundary(week: str) -> datetime:
+    """
+    Monday 00:00 UTC after the ISO week labelled `week`
+    """
+    return datetime.strptime(f"{week}-1", "%G-W%V-%u") + timedelta(days=7)
+
+def freeze_elapsed_weeks(now: Optional[datetime] = None) -> List[str]:
+    """
+    Freeze every week that ended since the last archived one (or just the
+    previous week if nothing is archived yet). Returns the weeks frozen.
+    """
+    boundary = week_start(now or datetime.utcnow())
+    weeks = load_archive_index()["weeks"]
+    pending = boundary
+    if weeks:
+        pending = max(week_boundary(weeks[-1]), boundary - timedelta(days=7 * MAX_CATCHUP_WEEKS))
+    frozen = []
+    while pending <= boundary:
+        try:
+            if freeze_weekly_leaderboard(pending):
+                frozen.append(week_key(pending - timedelta(days=1)))
+        except Exception as e:
+            print(f"Leaderboard snapshot failed for {week_key(pending - timedelta(days=1))}: {e}")
+        pending += timedelta(days=7)
+    return frozen
+
+async def run_snapshot_scheduler():
+    """
+    Background loop: freeze the previous week whenever a week boundary passes.
+    If the server was down over one or more boundaries, every missed week is
+    frozen on startup.
+    """
+    while True:
+        boundary = week_start(datetime.utcnow())
+        await asyncio.to_thread(freeze_elapsed_weeks)
+        
+        next_boundary = boundary + timedelta(days=7)
+        await asyncio.sleep(max(1.0, (next_boundary - datetime.utcnow()).total_seconds()))
+
 def get_most_remixed_npcs(limit: int = 10) -> List[Dict]:
     """
     Get the most remixed NPCs of all time
@@ -105,14 +352,16 @@ def get_trending_npcs(limit: int = 10) -> List[Dict]:
     Get trending NPCs based on recent activity
     """
     from npc_generator import load_npcs
+    from moderation import hidden_ids
     
     npcs = load_npcs()
+    hidden = hidden_ids("npc")
     week_ago = (datetime.utcnow() - timedelta(days=7)).isoformat()
     
-    # Filter to recent NPCs and score them
+    # Filter to recent, visible NPCs and score them
     recent_npcs = []
     for npc in npcs.values():
-        if npc.get("created_at", "") >= week_ago:
+        if npc.get("created_at", "") >= week_ago and npc["id"] not in hidden:
             score = (
                 npc.get("remix_count", 0) * 3 +
                 npc.get("share_count", 0) * 2 +
@@ -180,7 +429,7 @@ def get_global_stats() -> Dict:
     from npc_generator import load_npcs
     from sharing import load_shares
     from auth import load_users
-    from rooms import load_rooms
+    from rooms import load_rooms, count_archived_rooms
     
     npcs = load_npcs()
     shares = load_shares()
@@ -196,6 +445,6 @@ def get_global_stats() -> Dict:
         "total_npcs": len(npcs),
         "total_remixes": total_remixes,
         "total_shares": total_shares,
-        "total_rooms": len(rooms),
+        "total_rooms": len(rooms) + count_archived_rooms(),
         "total_interactions": total_interactions
     }
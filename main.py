@@ -4,7 +4,7 @@
 #      uvicorn main:app --reload --port 8000
 
 import uvicorn
-from fastapi import FastAPI, Request, Response, HTTPException
+from fastapi import APIRouter, FastAPI, Request, Response, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
@@ -15,7 +15,7 @@ from fastapi.staticfiles import StaticFiles
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-import json, os, random
+import json, os, random, time, threading, asyncio
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
 from actions import attack, flee, encounter, gather
@@ -24,14 +24,23 @@ from fastapi import FastAPI
 from fastapi.responses import JSONResponse
 from actions import attack, flee, encounter, gather, explore
 from game_state import player_state
-
-app = FastAPI()
-
-@app.get("/status")
+from chunks import (CHUNK_SIZE, BIOMES, EFFECTS, Chunk, ChunkStore,
+                    chunks_in_radius, parse_version_map, encode_chunks, chunk_runs_json)
+from worldstream import WorldConnection, world_hub
+from realtime import receive_json
+from spatial import SpatialHash
+from minimap import LOD_FACTORS, TILE_CELLS, UNEXPLORED, Minimap
+
+# Routes defined before the app is created (below, with APP_NAME) go on this
+# router; the app includes it, and static files are mounted last so they
+# never shadow a route
+router = APIRouter()
+
+@router.get("/status")
 def status():
     return JSONResponse(content=player_state)
 
-@app.post("/action/{action_name}")
+@router.post("/action/{action_name}")
 def do_action(action_name: str):
     if action_name == "attack":
         return {"result": attack()}
@@ -45,125 +54,273 @@ def do_action(action_name: str):
         return {"result": explore()}
     return {"result": "Unknown action"}
 
-app = FastAPI()
-
-@app.get("/status")
-def status():
-    return JSONResponse(content=player_state)
-
-@app.post("/action/{action_name}")
-def do_action(action_name: str):
-    if action_name == "attack":
-        return {"result": attack()}
-    elif action_name == "flee":
-        return {"result": flee()}
-    elif action_name == "encounter":
-        return {"result": encounter()}
-    elif action_name == "gather":
-        return {"result": gather()}
-    return {"result": "Unknown action"}
-
-app = FastAPI()
-app.mount("/", StaticFiles(directory="static", html=True), name="static")
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-CHUNK_SIZE = 10
-biomes = ['forest','water','mountain','desert','lava','ice','plains','swamp']
-world_file = "world.json"
-player_file = "players.json"
-
-# Load or create world
-if os.path.exists(world_file):
-    with open(world_file,'r') as f:
-        world = json.load(f)
+# Resolved once at import, so a later chdir can't redirect writes
+world_dir = os.path.abspath("world_regions")
+legacy_world_file = os.path.abspath("world.json")
+player_file = os.path.abspath("players.json")
+# Dirty chunks and players are written at most this often (seconds)
+WORLD_FLUSH_INTERVAL = float(os.getenv("WORLD_FLUSH_INTERVAL", "5"))
+
+# Terrain regenerates from the world seed; only player-changed chunks are
+# stored, in region files. A world.json save from before region files is
+# imported once.
+if not os.path.isdir(world_dir) and os.path.exists(legacy_world_file):
+    with open(legacy_world_file,'r') as f:
+        legacy_chunks = [Chunk.from_json(*(int(v) for v in key.split(",")), tiles) for key, tiles in json.load(f).items()]
+    world = ChunkStore(world_dir)
+    for chunk in legacy_chunks:
+        world.mark_modified(chunk)
+    world.flush()
 else:
-    world = {}
+    world = ChunkStore(world_dir)
 
 if os.path.exists(player_file):
     with open(player_file,'r') as f:
         players = json.load(f)
 else:
     players = {}
+players_dirty = False
+# Held while players (or players_dirty) change and while they're snapshotted
+players_lock = threading.Lock()
+
+# Zoomed-out biome map of every chunk anyone has looked at
+minimap = Minimap(os.path.join(world_dir, "minimap.bin"))
+world.listeners.append(minimap.observe)
+
+# Who is where, by chunk, for nearby-player queries and event fan-out. Only
+# players active since startup: saved positions come back when they next move
+player_index = SpatialHash(CHUNK_SIZE)
 
 def save_world():
-    with open(world_file,'w') as f:
-        json.dump(world,f)
+    world.flush()
 
 def save_players():
-    with open(player_file,'w') as f:
-        json.dump(players,f)
-
-def generate_chunk(cx,cy):
-    chunk = {}
-    for y in range(CHUNK_SIZE):
-        for x in range(CHUNK_SIZE):
-            biome = random.choice(biomes)
-            chunk[f"{x},{y}"] = {"biome":biome,"effect":None}
-    return chunk
-
-@app.get("/get_chunk")
+    global players_dirty
+    # Changes made while the file is written mark it dirty again
+    with players_lock:
+        data = json.dumps(players)
+        players_dirty = False
+    tmp_file = player_file + ".tmp"
+    with open(tmp_file,'w') as f:
+        f.write(data)
+    os.replace(tmp_file, player_file)
+
+def move_player(player_id, cx, cy, x, y):
+    """
+    Record a player's position and tell players nearby
+    """
+    global players_dirty
+    with players_lock:
+        if player_id not in players:
+            return
+        players[player_id].update({"chunk_x":cx,"chunk_y":cy,"x":x,"y":y})
+        players_dirty = True
+    wx, wy = cx*CHUNK_SIZE + x, cy*CHUNK_SIZE + y
+    old = player_index.positions.get(player_id)
+    player_index.update(player_id, wx, wy)
+    if old != (wx, wy):
+        world_hub.publish_nearby({"type":"player","player_id":player_id,"cx":cx,"cy":cy,"x":x,"y":y},
+                                 wx, wy, exclude=player_id)
+
+def leave_world(player_id):
+    """
+    Drop a player from the nearby index and tell players who could see them
+    """
+    position = player_index.positions.get(player_id)
+    player_index.remove(player_id)
+    if position is not None:
+        world_hub.publish_nearby({"type":"player_left","player_id":player_id}, *position, exclude=player_id)
+
+def flush_world():
+    """
+    Write whatever changed since the last tick
+    """
+    save_world()
+    if players_dirty:
+        save_players()
+    if minimap.dirty:
+        minimap.save()
+
+# Set by the app's shutdown hook
+world_flusher_stop = threading.Event()
+
+def run_world_flusher(interval=WORLD_FLUSH_INTERVAL):
+    while not world_flusher_stop.wait(interval):
+        try:
+            flush_world()
+        except Exception as e:
+            print(f"World flush failed: {e}")
+
+@router.get("/get_chunk")
 def get_chunk(cx:int,cy:int):
-    key = f"{cx},{cy}"
-    if key not in world:
-        world[key] = generate_chunk(cx,cy)
-        save_world()
-    return world[key]
-
-@app.get("/gather")
-def gather(player_id:str,cx:int,cy:int,x:int,y:int):
-    # register player if new
+    # Generated on demand, no I/O; tiles are stored compactly and only
+    # converted to JSON at the edge
+    return world.get(cx,cy).to_json()
+
+# Largest view radius /get_chunks serves ((2r+1)^2 chunks)
+MAX_CHUNK_RADIUS = 8
+
+@router.get("/get_chunks")
+def get_chunks(cx:int,cy:int,radius:int=1,known:str="",format:str="binary"):
+    """
+    Every chunk within `radius` of (cx, cy), nearest first, in one response.
+    `known` lists chunks the client already has ("cx,cy,version;...");
+    those whose version hasn't changed are left out.
+    """
+    if not 0 <= radius <= MAX_CHUNK_RADIUS:
+        raise HTTPException(status_code=400, detail=f"radius must be between 0 and {MAX_CHUNK_RADIUS}")
+    if format not in ("binary", "json"):
+        raise HTTPException(status_code=400, detail="format must be binary or json")
+    versions = parse_version_map(known) if known else {}
+    chunks = [c for c in world.get_many(chunks_in_radius(cx,cy,radius)) if versions.get((c.cx,c.cy)) != c.version]
+    if format == "json":
+        return JSONResponse(content={"biomes":BIOMES,"effects":EFFECTS,"chunks":[chunk_runs_json(c) for c in chunks]})
+    return Response(content=encode_chunks(chunks), media_type="application/octet-stream")
+
+@router.get("/minimap")
+def minimap_tile(request:Request,level:int,tx:int,ty:int,format:str="binary"):
+    """
+    A TILE_CELLS x TILE_CELLS map tile of dominant biomes. A cell is one
+    chunk at level 0, 4x4 chunks at level 1 and 16x16 at level 2; binary
+    tiles are one biome id per cell, row-major, UNEXPLORED where nobody has
+    looked yet.
+    """
+    if not 0 <= level < len(LOD_FACTORS):
+        raise HTTPException(status_code=400, detail=f"level must be between 0 and {len(LOD_FACTORS)-1}")
+    if format not in ("binary", "json"):
+        raise HTTPException(status_code=400, detail="format must be binary or json")
+    data, version = minimap.tile(level,tx,ty)
+    etag = f'"{minimap.epoch}-{level}-{tx}-{ty}-{version}-{format}"'
+    headers = {"ETag":etag,"Cache-Control":"no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    if format == "json":
+        rows = [[BIOMES[b] if b != UNEXPLORED else None for b in data[y*TILE_CELLS:(y+1)*TILE_CELLS]] for y in range(TILE_CELLS)]
+        return JSONResponse(content={"level":level,"tx":tx,"ty":ty,"chunks_per_cell":LOD_FACTORS[level],"rows":rows}, headers=headers)
+    return Response(content=data, media_type="application/octet-stream", headers=headers)
+
+# Largest /nearby radius, in tiles
+MAX_NEARBY_RADIUS = 100
+
+@router.get("/nearby")
+def nearby(player_id:str,radius:float=20):
+    """
+    Players within `radius` tiles of this player, nearest first
+    """
+    if not 0 <= radius <= MAX_NEARBY_RADIUS:
+        raise HTTPException(status_code=400, detail=f"radius must be between 0 and {MAX_NEARBY_RADIUS}")
+    position = player_index.positions.get(player_id)
+    if position is None:
+        raise HTTPException(status_code=404, detail="Player not found")
+    found = []
+    for other, wx, wy, distance in player_index.query_radius(*position, radius):
+        if other != player_id:
+            found.append({"player_id":other,"cx":wx//CHUNK_SIZE,"cy":wy//CHUNK_SIZE,
+                          "x":wx%CHUNK_SIZE,"y":wy%CHUNK_SIZE,"distance":round(distance,2)})
+    return {"player_id":player_id,"radius":radius,"players":found}
+
+@router.websocket("/ws/world")
+async def ws_world(websocket: WebSocket, player_id: str, cx: int = 0, cy: int = 0):
+    """
+    Terrain stream. The client sends {"type": "position", "cx", "cy"} as it
+    moves; the server streams chunks entering its radius, nearest first, as
+    binary frames (the /get_chunks layout) and pushes JSON events:
+      {"type": "tiles", "cx", "cy", "version", "tiles": [{x, y, biome, effect}]},
+      {"type": "unload", "chunks": [[cx, cy], ...]},
+      {"type": "player", "player_id", "cx", "cy", "x", "y"} (players moving nearby),
+      {"type": "player_left", "player_id"} (a nearby player disconnected)
+    Positions may include the tile ("x", "y") within the chunk. Only
+    players the world knows (see /gather) may connect.
+    """
     if player_id not in players:
-        players[player_id] = {"inventory":[],"chunk_x":cx,"chunk_y":cy,"x":x,"y":y}
-        save_players()
-    biome = world[f"{cx},{cy}"][f"{x},{y}"]["biome"]
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    world_hub.start(asyncio.get_running_loop(), world, player_index)
+    conn = WorldConnection(websocket, player_id)
+    world_hub.add(conn)
+    world_hub.move(conn, cx, cy)
+    try:
+        while True:
+            data = await receive_json(websocket)
+            kind = data.get("type") if isinstance(data, dict) else None
+            if kind == "position":
+                try:
+                    ncx, ncy = int(data["cx"]), int(data["cy"])
+                    x, y = int(data.get("x", 0)), int(data.get("y", 0))
+                except (KeyError, TypeError, ValueError):
+                    conn.offer({"type": "error", "detail": "position needs integer cx and cy"})
+                    continue
+                if (ncx, ncy) != conn.position:
+                    world_hub.move(conn, ncx, ncy)
+                move_player(player_id, ncx, ncy, x, y)
+            elif kind == "ping":
+                conn.offer({"type": "pong"})
+            else:
+                conn.offer({"type": "error", "detail": "Unknown message type"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        world_hub.remove(conn)
+        # Gone from the world once the player's last socket closes
+        if player_id not in world_hub.by_player:
+            leave_world(player_id)
+
+@router.get("/gather")
+def gather_tile(player_id:str,cx:int,cy:int,x:int,y:int):
+    if not (0 <= x < CHUNK_SIZE and 0 <= y < CHUNK_SIZE):
+        raise HTTPException(status_code=400, detail=f"x and y must be within 0..{CHUNK_SIZE-1}")
+    # register player if new
+    with players_lock:
+        if player_id not in players:
+            players[player_id] = {"inventory":[],"chunk_x":cx,"chunk_y":cy,"x":x,"y":y}
+    move_player(player_id,cx,cy,x,y)
+    chunk = world.get(cx,cy)
+    biome, _ = chunk.get_tile(x,y)
     item = random.choice(['Hydrogen','Oxygen','Carbon','Gold'])
     rarity = random.choices(['common','rare','epic'],[0.7,0.25,0.05])[0]
     effect = "glow" if rarity != 'common' else None
-    world[f"{cx},{cy}"][f"{x},{y}"]["effect"] = effect
-    players[player_id]["inventory"].append(item)
-    save_world()
-    save_players()
+    chunk.set_tile(x,y,effect=effect)
+    world.mark_modified(chunk)
+    world_hub.publish_tiles(chunk, [{"x":x,"y":y,"biome":biome,"effect":effect}])
+    # Written by the flusher on its next tick
+    global players_dirty
+    with players_lock:
+        players[player_id]["inventory"].append(item)
+        players_dirty = True
     return {"item":item,"rarity":rarity,"effect":effect}
 
-@app.get("/craft")
+@router.get("/craft")
 def craft(player_id:str):
-    if player_id not in players: return {"msg":"No player found"}
-    inv = players[player_id]["inventory"]
-    if not inv: return {"msg":"No items to craft"}
-    crafted = "".join(inv[:2]) + " Compound"
-    # spawn new tiles in nearby chunk
-    cx = players[player_id]["chunk_x"]
-    cy = players[player_id]["chunk_y"]
+    global players_dirty
+    with players_lock:
+        if player_id not in players: return {"msg":"No player found"}
+        inv = players[player_id]["inventory"]
+        if not inv: return {"msg":"No items to craft"}
+        crafted = "".join(inv[:2]) + " Compound"
+        players[player_id]["inventory"] = []
+        players_dirty = True
+        # spawn new tiles in nearby chunk
+        cx = players[player_id]["chunk_x"]
+        cy = players[player_id]["chunk_y"]
     new_tiles = []
+    chunk = world.get(cx,cy)
     for _ in range(random.randint(1,3)):
         nx = random.randint(0,CHUNK_SIZE-1)
         ny = random.randint(0,CHUNK_SIZE-1)
-        biome = random.choice(biomes)
-        world[f"{cx},{cy}"][f"{nx},{ny}"] = {"biome":biome,"effect":"glow"}
+        biome = random.choice(BIOMES)
+        chunk.set_tile(nx,ny,biome=biome,effect="glow")
         new_tiles.append({"x":nx,"y":ny,"biome":biome,"effect":"glow"})
-    players[player_id]["inventory"] = []
-    save_world()
-    save_players()
+    world.mark_modified(chunk)
+    world_hub.publish_tiles(chunk, new_tiles)
     return {"item":crafted,"rarity":"rare","new_tiles":new_tiles}
-app = FastAPI()  # ← must be before mounting anything
 
-# Then mount static
-app.mount("/", StaticFiles(directory="static", html=True), name="static")
-
-# Your routes
-@app.get("/hello")
+@router.get("/hello")
 def hello():
     return {"msg":"Hello World"}
 
-
-app.mount("/", StaticFiles(directory="static", html=True), name="static")
 APP_NAME = "Realm of Echoes (Single-Repo Playable Demo)"
-DATA_DIR = ".data"
+DATA_DIR = os.path.abspath(".data")
 PLAYERS_FILE = os.path.join(DATA_DIR, "players.json")
 BLUEPRINTS_FILE = os.path.join(DATA_DIR, "known_blueprints.json")
 WORLD_FILE = os.path.join(DATA_DIR, "world_chronicle.json")
@@ -199,6 +356,25 @@ class ActionPayload(BaseModel):
     payload: dict = {}
 
 app = FastAPI(title=APP_NAME)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.include_router(router)
+
+@app.on_event("startup")
+def start_world_flusher():
+    world_flusher_stop.clear()
+    app.state.world_flusher = threading.Thread(target=run_world_flusher, name="world-flusher", daemon=True)
+    app.state.world_flusher.start()
+
+@app.on_event("shutdown")
+def stop_world_flusher():
+    world_flusher_stop.set()
+    app.state.world_flusher.join()
+    flush_world()
 
 # --- Player management ---
 def make_player(name: str):
@@ -746,6 +922,9 @@ def index():
     except:
         return HTMLResponse(INDEX_HTML)
 
+# After every route: a mount matches its whole prefix
+app.mount("/static", StaticFiles(directory="static", html=True), name="static")
+
 # --- run server (if executed directly) ---
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,108 @@
+# minimap.py
+# Level-of-detail biome pyramid of explored chunks, served as small map tiles
+
+import os
+import struct
+import threading
+from typing import Dict, List, Tuple
+from chunks import BIOMES, Chunk
+
+# Chunks per cell edge at each level: one chunk, 4x4 chunks, 16x16 chunks
+LOD_FACTORS = (1, 4, 16)
+
+# A map tile is TILE_CELLS x TILE_CELLS cells of one level
+TILE_CELLS = 32
+
+# Cell value for areas nobody has explored yet
+UNEXPLORED = 255
+
+# Saved per explored chunk: cx, cy and its tile count per biome
+MINIMAP_RECORD = struct.Struct(f"<ii{len(BIOMES)}B")
+
+Cell = Tuple[int, int]
+
+def dominant(counts: List[int]) -> int:
+    """
+    The most common biome in a histogram (lowest id on ties)
+    """
+    best = max(counts)
+    return counts.index(best) if best else UNEXPLORED
+
+class Minimap:
+    """
+    Biome histograms per cell at every LOD level. When a chunk is seen or
+    changes, only the difference to its last histogram is added to the one
+    cell above it on each level, so upkeep is constant per chunk change.
+    Every map tile has a version that increases whenever one of its cells
+    changes, for ETags.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.levels: List[Dict[Cell, List[int]]] = [{} for _ in LOD_FACTORS]
+        self.tile_versions: Dict[Tuple[int, int, int], int] = {}
+        self.dirty = False
+        # Tile versions restart with the process; the epoch keeps ETags apart
+        self.epoch = os.urandom(4).hex()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        for cx, cy, *counts in MINIMAP_RECORD.iter_unpack(data):
+            self._apply((cx, cy), counts)
+        self.dirty = False
+
+    def observe(self, chunk: Chunk):
+        """
+        Record a chunk's current biomes (use as a ChunkStore listener). The
+        store calls listeners after releasing its lock, and the minimap lock
+        is never held while calling into the store, so the two never nest.
+        """
+        counts = [chunk.biomes.count(i) for i in range(len(BIOMES))]
+        with self._lock:
+            if self.levels[0].get((chunk.cx, chunk.cy)) != counts:
+                self._apply((chunk.cx, chunk.cy), counts)
+
+    def _apply(self, key: Cell, counts: List[int]):
+        old = self.levels[0].get(key)
+        delta = [new - prev for new, prev in zip(counts, old)] if old else counts
+        for level, factor in enumerate(LOD_FACTORS):
+            cell = (key[0] // factor, key[1] // factor)
+            cell_counts = self.levels[level].get(cell)
+            if cell_counts is None:
+                cell_counts = self.levels[level][cell] = [0] * len(BIOMES)
+            before = dominant(cell_counts)
+            for i, d in enumerate(delta):
+                cell_counts[i] += d
+            if dominant(cell_counts) != before:
+                tile = (level, cell[0] // TILE_CELLS, cell[1] // TILE_CELLS)
+                self.tile_versions[tile] = self.tile_versions.get(tile, 0) + 1
+        self.dirty = True
+
+    def tile(self, level: int, tx: int, ty: int) -> Tuple[bytes, int]:
+        """
+        (TILE_CELLS x TILE_CELLS row-major dominant biome ids, tile version)
+        for the tile at (tx, ty) of a level
+        """
+        cells = self.levels[level]
+        x0, y0 = tx * TILE_CELLS, ty * TILE_CELLS
+        with self._lock:
+            data = bytes(
+                dominant(cells[(x0 + x, y0 + y)]) if (x0 + x, y0 + y) in cells else UNEXPLORED
+                for y in range(TILE_CELLS) for x in range(TILE_CELLS)
+            )
+            return data, self.tile_versions.get((level, tx, ty), 0)
+
+    def save(self):
+        with self._lock:
+            records = b"".join(MINIMAP_RECORD.pack(cx, cy, *counts) for (cx, cy), counts in self.levels[0].items())
+            self.dirty = False
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(records)
+        os.replace(tmp_path, self.path)
+
+    def stats(self) -> Dict:
+        return {f"level_{level}_cells": len(cells) for level, cells in enumerate(self.levels)}
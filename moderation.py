@@ -1,11 +1,20 @@
 # moderation.py
 # Content moderation and rate limiting
 
+import fcntl
+import hashlib
 import json
+import math
 import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List
-from collections import defaultdict
+from typing import Callable, Optional, Dict, List, Set
+from broker import broker
+from wordfilter import Blocklist, normalize_text
+from cache import LRUCache
+from dedup import NearDuplicateDetector
 
 DATA_DIR = ".data"
 RATE_LIMITS_FILE = os.path.join(DATA_DIR, "rate_limits.json")
@@ -15,8 +24,23 @@ if not os.path.exists(RATE_LIMITS_FILE):
     with open(RATE_LIMITS_FILE, "w") as f:
         json.dump({}, f)
 
-# In-memory rate limiting (would use Redis in production)
-rate_limit_tracker: Dict[str, List[datetime]] = defaultdict(list)
+# Rate limit window (seconds)
+RATE_LIMIT_WINDOW = 3600
+
+# Sliding-window counter: one integer per fixed window. The count for the
+# trailing hour is estimated as the current window's count plus the previous
+# window's count weighted by how much of it still overlaps the hour, so each
+# user/action costs two counters however high the limit is. Counters expire
+# after two windows, which also evicts idle users.
+
+def rate_limit_key(user_id: str, action: str, window: int) -> str:
+    return f"ratelimit:{user_id}:{action}:{window}"
+
+def _window_position(now: float):
+    window = int(now // RATE_LIMIT_WINDOW)
+    # Fraction of the previous window still inside the sliding hour
+    overlap = 1.0 - (now % RATE_LIMIT_WINDOW) / RATE_LIMIT_WINDOW
+    return window, overlap
 
 # Rate limits (per hour)
 RATE_LIMITS = {
@@ -24,14 +48,41 @@ RATE_LIMITS = {
     "npc_remix": 20,       # 20 remixes per hour
     "share_create": 15,    # 15 shares per hour
     "room_create": 5,      # 5 rooms per hour
-    "chat_message": 100    # 100 messages per hour
+    "chat_message": 100,   # 100 messages per hour
+    "content_report": 30   # 30 reports per hour
 }
 
-# Content filters - simple keyword blocking for MVP
+# Content filters - keyword blocking. BLOCKED_WORDS seeds the wordlist file
+# the first time; after that the file is the source of truth and edits to it
+# are picked up without a restart.
 BLOCKED_WORDS = [
     # Add inappropriate words here
     "spam", "scam", "hack"
 ]
+BLOCKLIST_FILE = os.getenv("BLOCKLIST_FILE", os.path.join(DATA_DIR, "blocklist.txt"))
+
+blocklist = Blocklist(BLOCKLIST_FILE, defaults=BLOCKED_WORDS)
+
+# Bump when filter_content's rules change (the blocklist has its own version)
+FILTER_RULES_VERSION = 1
+
+# filter_content verdicts by hash of the normalised text. Remixes and
+# reposts re-submit identical text; entries are dropped when the blocklist
+# reloads.
+VERDICT_CACHE_SIZE = 50000
+_verdicts = LRUCache(VERDICT_CACHE_SIZE)
+_verdicts_version = blocklist.version
+
+# Near-duplicate spam: reject a text once this many near-copies of it were
+# posted recently. NPC backstories are compared across everyone, so bots
+# rotating accounts are caught too; chat only against the sender's own
+# messages, so a common phrase never blocks other players.
+CHAT_DUPLICATE_LIMIT = 3
+NPC_DUPLICATE_LIMIT = 3
+DUPLICATE_WINDOW = 600  # seconds
+
+chat_duplicates = NearDuplicateDetector(max_entries=20000, max_age=DUPLICATE_WINDOW)
+npc_duplicates = NearDuplicateDetector(max_entries=5000, max_age=DUPLICATE_WINDOW)
 
 def check_rate_limit(user_id: str, action: str) -> tuple[bool, Optional[str]]:
     """
@@ -41,23 +92,18 @@ def check_rate_limit(user_id: str, action: str) -> tuple[bool, Optional[str]]:
     if action not in RATE_LIMITS:
         return True, None
     
-    key = f"{user_id}:{action}"
-    now = datetime.utcnow()
-    
-    # Clean up old entries (older than 1 hour)
-    rate_limit_tracker[key] = [
-        timestamp for timestamp in rate_limit_tracker[key]
-        if now - timestamp < timedelta(hours=1)
-    ]
-    
-    # Check if limit exceeded
+    window, overlap = _window_position(time.time())
     limit = RATE_LIMITS[action]
-    if len(rate_limit_tracker[key]) >= limit:
+    # Checked and counted in one broker operation, so concurrent workers
+    # can't both slip in under the limit
+    allowed = broker.incr_within_limit(
+        rate_limit_key(user_id, action, window),
+        rate_limit_key(user_id, action, window - 1),
+        overlap, limit, ttl=2 * RATE_LIMIT_WINDOW
+    )
+    if not allowed:
         return False, f"Rate limit exceeded. Max {limit} {action} per hour."
     
-    # Add current timestamp
-    rate_limit_tracker[key].append(now)
-    
     return True, None
 
 def filter_content(text: str) -> tuple[bool, Optional[str]]:
@@ -68,19 +114,32 @@ def filter_content(text: str) -> tuple[bool, Optional[str]]:
     if not text:
         return True, None
     
-    text_lower = text.lower()
-    
-    # Check for blocked words
-    for word in BLOCKED_WORDS:
-        if word in text_lower:
-            return False, f"Content contains inappropriate word: {word}"
-    
     # Check length limits
     if len(text) > 5000:
         return False, "Content too long (max 5000 characters)"
     
+    global _verdicts_version
+    blocklist.refresh()
+    if blocklist.version != _verdicts_version:
+        _verdicts.clear()
+        _verdicts_version = blocklist.version
+    
+    normalized = normalize_text(text)
+    key = (FILTER_RULES_VERSION, blocklist.version, hashlib.blake2b(normalized.encode(), digest_size=16).digest())
+    verdict = _verdicts.get(key)
+    if verdict is None:
+        verdict = _filter_normalized(normalized)
+        _verdicts.set(key, verdict)
+    return verdict
+
+def _filter_normalized(normalized: str) -> tuple[bool, Optional[str]]:
+    # Check for blocked words (one pass over normalised text)
+    word = blocklist.filter.find_normalized(normalized)
+    if word:
+        return False, f"Content contains inappropriate word: {word}"
+    
     # Check for excessive repetition (simple check)
-    words = text_lower.split()
+    words = normalized.split()
     if len(words) > 10:
         unique_ratio = len(set(words)) / len(words)
         if unique_ratio < 0.3:
@@ -88,49 +147,291 @@ def filter_content(text: str) -> tuple[bool, Optional[str]]:
     
     return True, None
 
-def report_content(user_id: str, content_type: str, content_id: str, reason: str):
+def get_filter_stats() -> Dict:
+    return {
+        "rules_version": FILTER_RULES_VERSION,
+        "blocklist_version": blocklist.version,
+        "blocklist_terms": blocklist.filter.size,
+        "verdict_cache": _verdicts.stats(),
+    }
+
+# ===== Report queue =====
+# Reports go to an append-only event log (.data/moderation/queue.jsonl) and
+# an in-memory index rebuilt from it at startup. Reports of the same item
+# collapse into one queue entry with a count of distinct reporters. Events
+# are published through the broker so every worker's index agrees; only the
+# worker that handled the request appends to the log.
+
+MODERATION_DIR = os.path.join(DATA_DIR, "moderation")
+QUEUE_LOG = os.path.join(MODERATION_DIR, "queue.jsonl")
+QUEUE_LOCK_FILE = QUEUE_LOG + ".lock"
+
+REPORTABLE_TYPES = ("npc", "share", "room", "chat", "user")
+
+# Distinct reporters after which content is hidden pending review
+AUTO_HIDE_THRESHOLD = 5
+
+# Claims not resolved within this many seconds return to the open pool
+CLAIM_TTL = 900
+
+# Extra moderators besides users flagged "moderator": true in users.json
+MODERATOR_IDS = {uid for uid in os.getenv("MODERATOR_IDS", "").split(",") if uid}
+
+os.makedirs(MODERATION_DIR, exist_ok=True)
+
+# The log is the source of truth shared by all workers. Each worker folds it
+# into an in-memory index and catches up on the tail before every read, and
+# appends only while holding an exclusive lock on QUEUE_LOCK_FILE after
+# catching up, so decisions such as claims see every earlier event.
+_queue_lock = threading.Lock()
+_queue_offset = 0                            # bytes of the log applied
+_queue_items: Dict[str, Dict] = {}           # item_id -> item
+_queue_by_status: Dict[str, set] = {"open": set(), "claimed": set(), "resolved": set()}
+_hidden: Dict[str, Set[str]] = {}            # content_type -> hidden content ids
+
+# callback(content_type, content_id, hidden), called when content is hidden
+# or restored (on every worker, with _queue_lock held: keep it cheap)
+_visibility_listeners: List[Callable[[str, str, bool], None]] = []
+
+def on_visibility_change(callback: Callable[[str, str, bool], None]):
+    _visibility_listeners.append(callback)
+
+def _set_hidden(item: Dict, hidden: bool):
+    if item["hidden"] == hidden:
+        return
+    item["hidden"] = hidden
+    if hidden:
+        _hidden.setdefault(item["content_type"], set()).add(item["content_id"])
+    else:
+        _hidden.get(item["content_type"], set()).discard(item["content_id"])
+    for callback in _visibility_listeners:
+        callback(item["content_type"], item["content_id"], hidden)
+
+def report_item_id(content_type: str, content_id: str) -> str:
+    return f"{content_type}:{content_id}"
+
+def _set_status(item: Dict, status: str):
+    _queue_by_status[item["status"]].discard(item["id"])
+    item["status"] = status
+    _queue_by_status[status].add(item["id"])
+
+def _apply_queue_event(event: Dict):
     """
-    Report inappropriate content for review
-    In production, this would create a moderation queue
+    Fold one log event into the index (caller holds _queue_lock)
     """
-    from auth import load_users, save_users
-    
-    users = load_users()
-    
-    # Track reports
-    if "reports" not in users[user_id]:
-        users[user_id]["reports"] = []
-    
-    report = {
-        "content_type": content_type,
-        "content_id": content_id,
-        "reason": reason,
-        "timestamp": datetime.utcnow().isoformat() + "Z"
-    }
-    
-    users[user_id]["reports"].append(report)
-    save_users(users)
-    
-    # In production: send to moderation queue, alert admins, etc.
-    return report
+    op = event["op"]
+    if op == "report":
+        item_id = report_item_id(event["content_type"], event["content_id"])
+        item = _queue_items.get(item_id)
+        if item is None:
+            item = _queue_items[item_id] = {
+                "id": item_id,
+                "content_type": event["content_type"],
+                "content_id": event["content_id"],
+                "status": "open",
+                "report_count": 0,
+                "reporters": set(),
+                "reasons": {},
+                "first_reported_at": event["timestamp"],
+                "hidden": False,
+            }
+            _queue_by_status["open"].add(item_id)
+        elif item["status"] == "resolved":
+            # New reports after a decision reopen the item
+            _set_status(item, "open")
+        if event["user_id"] not in item["reporters"]:
+            item["reporters"].add(event["user_id"])
+            item["report_count"] += 1
+            item["reasons"][event["reason"]] = item["reasons"].get(event["reason"], 0) + 1
+        item["last_reported_at"] = event["timestamp"]
+        if item["report_count"] >= AUTO_HIDE_THRESHOLD and item.get("resolution") != "dismiss":
+            _set_hidden(item, True)
+    elif op == "claim":
+        for item_id in event["item_ids"]:
+            item = _queue_items.get(item_id)
+            if item and _claimable(item, event["at"]):
+                _set_status(item, "claimed")
+                item["claimed_by"] = event["moderator_id"]
+                item["claimed_at"] = event["at"]
+    elif op == "resolve":
+        for item_id in event["item_ids"]:
+            item = _queue_items.get(item_id)
+            if item:
+                _set_status(item, "resolved")
+                item["resolution"] = event["action"]
+                item["resolved_by"] = event["moderator_id"]
+                item["resolved_at"] = event["at"]
+                item["note"] = event.get("note")
+                _set_hidden(item, event["action"] == "remove")
+
+def _claimable(item: Dict, now: float) -> bool:
+    """
+    Open, or claimed by someone whose lease ran out
+    """
+    if item["status"] == "open":
+        return True
+    return item["status"] == "claimed" and now - item.get("claimed_at", 0) > CLAIM_TTL
+
+def _catch_up():
+    """
+    Apply events appended to the log since we last read it (caller holds
+    _queue_lock). Only whole lines are applied.
+    """
+    global _queue_offset
+    try:
+        size = os.path.getsize(QUEUE_LOG)
+    except FileNotFoundError:
+        return
+    if size <= _queue_offset:
+        return
+    with open(QUEUE_LOG, "rb") as f:
+        f.seek(_queue_offset)
+        data = f.read(size - _queue_offset)
+    end = data.rfind(b"\n") + 1
+    for line in data[:end].splitlines():
+        if line.strip():
+            _apply_queue_event(json.loads(line))
+    _queue_offset += end
+
+@contextmanager
+def _queue_transaction():
+    """
+    Exclusive access to the queue across workers, caught up with the log
+    """
+    with _queue_lock, open(QUEUE_LOCK_FILE, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            _catch_up()
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _record_queue_event(event: Dict):
+    """
+    Apply and append an event (caller is inside _queue_transaction)
+    """
+    global _queue_offset
+    _apply_queue_event(event)
+    with open(QUEUE_LOG, "a") as f:
+        f.write(json.dumps(event) + "\n")
+    _queue_offset = os.path.getsize(QUEUE_LOG)
+
+with _queue_lock:
+    _catch_up()
+
+def _public_item(item: Dict) -> Dict:
+    return {**item, "reporters": list(item["reporters"]), "reasons": dict(item["reasons"])}
+
+def is_moderator(user: Dict) -> bool:
+    return bool(user.get("moderator")) or user["id"] in MODERATOR_IDS
+
+def is_hidden(content_type: str, content_id: str) -> bool:
+    """
+    True while reported content is auto-hidden or was removed by a moderator
+    """
+    with _queue_lock:
+        _catch_up()
+        return content_id in _hidden.get(content_type, ())
+
+def hidden_ids(content_type: str) -> Set[str]:
+    """
+    Ids of all hidden content of a type, for filtering listings
+    """
+    with _queue_lock:
+        _catch_up()
+        return set(_hidden.get(content_type, ()))
+
+def report_content(user_id: str, content_type: str, content_id: str, reason: str) -> Dict:
+    """
+    Report content for review. Callers check that the content exists.
+    A user's repeat reports of the same content are dropped without
+    touching the log. Returns the queue item.
+    """
+    item_id = report_item_id(content_type, content_id)
+    with _queue_transaction():
+        item = _queue_items.get(item_id)
+        if item is None or user_id not in item["reporters"]:
+            _record_queue_event({
+                "op": "report",
+                "content_type": content_type,
+                "content_id": content_id,
+                "user_id": user_id,
+                "reason": reason,
+                "timestamp": datetime.utcnow().isoformat() + "Z"
+            })
+        return _public_item(_queue_items[item_id])
+
+def get_report(content_type: str, content_id: str) -> Optional[Dict]:
+    with _queue_lock:
+        _catch_up()
+        item = _queue_items.get(report_item_id(content_type, content_id))
+        return _public_item(item) if item else None
+
+def _release_stale_claims(now: float):
+    for item_id in list(_queue_by_status["claimed"]):
+        item = _queue_items[item_id]
+        if now - item.get("claimed_at", 0) > CLAIM_TTL:
+            _set_status(item, "open")
+
+def get_report_queue(status: str = "open", content_type: Optional[str] = None, limit: int = 50) -> List[Dict]:
+    """
+    Queue items with a status, most-reported first
+    """
+    with _queue_lock:
+        _catch_up()
+        return [_public_item(item) for item in _items_with_status(status, content_type, limit)]
+
+def _items_with_status(status: str, content_type: Optional[str], limit: int) -> List[Dict]:
+    _release_stale_claims(time.time())
+    items = [_queue_items[item_id] for item_id in _queue_by_status.get(status, ())]
+    if content_type:
+        items = [item for item in items if item["content_type"] == content_type]
+    items.sort(key=lambda item: (-item["report_count"], item["first_reported_at"]))
+    return items[:limit]
+
+def claim_reports(moderator_id: str, limit: int = 20, content_type: Optional[str] = None) -> List[Dict]:
+    """
+    Claim up to `limit` open items (most-reported first) for review. Picking
+    and claiming happen under the queue lock, so two moderators never get
+    the same item while its claim lease is live.
+    """
+    with _queue_transaction():
+        item_ids = [item["id"] for item in _items_with_status("open", content_type, limit)]
+        if not item_ids:
+            return []
+        _record_queue_event({"op": "claim", "item_ids": item_ids, "moderator_id": moderator_id, "at": time.time()})
+        return [_public_item(_queue_items[item_id]) for item_id in item_ids]
+
+def resolve_reports(moderator_id: str, item_ids: List[str], action: str, note: Optional[str] = None) -> List[Dict]:
+    """
+    Close items in one batch: "remove" keeps the content hidden,
+    "dismiss" restores it. Unknown ids are skipped.
+    """
+    with _queue_transaction():
+        known = [item_id for item_id in item_ids if item_id in _queue_items]
+        if known:
+            _record_queue_event({
+                "op": "resolve", "item_ids": known, "moderator_id": moderator_id,
+                "action": action, "note": note, "at": time.time()
+            })
+        return [_public_item(_queue_items[item_id]) for item_id in known]
+
+def get_report_queue_stats() -> Dict:
+    with _queue_lock:
+        _catch_up()
+        return {status: len(ids) for status, ids in _queue_by_status.items()}
 
 def get_user_rate_limit_status(user_id: str) -> Dict:
     """
     Get current rate limit status for a user
     """
-    now = datetime.utcnow()
+    window, overlap = _window_position(time.time())
     status = {}
     
+    # Pure read: nothing is pruned or written
     for action, limit in RATE_LIMITS.items():
-        key = f"{user_id}:{action}"
-        
-        # Clean up old entries
-        rate_limit_tracker[key] = [
-            timestamp for timestamp in rate_limit_tracker[key]
-            if now - timestamp < timedelta(hours=1)
-        ]
-        
-        current = len(rate_limit_tracker[key])
+        previous = broker.get_counter(rate_limit_key(user_id, action, window - 1))
+        current = math.ceil(previous * overlap + broker.get_counter(rate_limit_key(user_id, action, window)))
         status[action] = {
             "current": current,
             "limit": limit,
@@ -139,9 +440,10 @@ def get_user_rate_limit_status(user_id: str) -> Dict:
     
     return status
 
-def validate_npc_content(name: str, trait: str, backstory: str) -> tuple[bool, Optional[str]]:
+def validate_npc_content(name: str, trait: str, backstory: str, remix_of: Optional[Dict] = None) -> tuple[bool, Optional[str]]:
     """
-    Validate NPC content before creation
+    Validate NPC content before creation. For remixes pass the original NPC:
+    a backstory carried over unchanged isn't counted as a duplicate.
     """
     # Check name
     if name:
@@ -169,12 +471,16 @@ def validate_npc_content(name: str, trait: str, backstory: str) -> tuple[bool, O
         
         if len(backstory) > 1000:
             return False, "Backstory too long (max 1000 characters)"
+        
+        inherited = remix_of is not None and backstory == remix_of.get("backstory")
+        if not inherited and npc_duplicates.check(backstory, stop_at=NPC_DUPLICATE_LIMIT) >= NPC_DUPLICATE_LIMIT:
+            return False, "Backstory appears to be spam (near-duplicate of recent content)"
     
     return True, None
 
-def validate_message(message: str) -> tuple[bool, Optional[str]]:
+def validate_message(message: str, user_id: str = "") -> tuple[bool, Optional[str]]:
     """
-    Validate chat message
+    Validate chat message. Call record_message once it has been posted.
     """
     if not message or len(message.strip()) == 0:
         return False, "Message cannot be empty"
@@ -182,4 +488,17 @@ def validate_message(message: str) -> tuple[bool, Optional[str]]:
     if len(message) > 500:
         return False, "Message too long (max 500 characters)"
     
-    return filter_content(message)
+    passed, reason = filter_content(message)
+    if not passed:
+        return False, reason
+    
+    if chat_duplicates.count(message, scope=user_id, stop_at=CHAT_DUPLICATE_LIMIT) >= CHAT_DUPLICATE_LIMIT:
+        return False, "Message appears to be spam (near-duplicate of recent messages)"
+    
+    return True, None
+
+def record_message(message: str, user_id: str = ""):
+    """
+    Count an accepted chat message towards the sender's duplicate window
+    """
+    chat_duplicates.add(message, scope=user_id)
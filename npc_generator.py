@@ -7,6 +7,7 @@ import uuid
 from datetime import datetime
 from typing import Optional, List, Dict
 import random
+from moderation import hidden_ids
 
 DATA_DIR = ".data"
 NPCS_FILE = os.path.join(DATA_DIR, "npcs.json")
@@ -199,7 +200,8 @@ def get_popular_npcs(limit: int = 10) -> List[Dict]:
     Get most remixed/shared NPCs for leaderboard
     """
     npcs = load_npcs()
-    npc_list = list(npcs.values())
+    hidden = hidden_ids("npc")
+    npc_list = [npc for npc in npcs.values() if npc["id"] not in hidden]
     
     # Sort by remix_count + share_count
     sorted_npcs = sorted(
@@ -0,0 +1,155 @@
+# realtime.py
+# WebSocket fan-out for room events (chat, presence, NPC interactions)
+
+import asyncio
+import json
+from typing import Any, Dict, Optional, Set
+from fastapi import WebSocket, WebSocketDisconnect
+from broker import broker
+
+# Max events buffered per connection before it is considered too slow
+SEND_QUEUE_SIZE = 64
+
+# Close code sent to clients that fell too far behind (RFC 6455 "try again later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+# Close code sent when a room moved to another shard; clients should reconnect
+ROOM_MOVED_CLOSE_CODE = 1012
+
+async def receive_json(websocket: WebSocket) -> Optional[Any]:
+    """
+    Next client message parsed as JSON, or None for binary frames and
+    malformed text. Raises WebSocketDisconnect when the client goes away.
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    text = message.get("text")
+    if text is None:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+class RoomConnection:
+    """
+    One client socket subscribed to a room, with its own bounded send queue.
+    A dedicated sender task drains the queue so a slow socket only ever
+    blocks itself, never the publisher.
+    """
+    def __init__(self, websocket: WebSocket, room_id: str, user_id: str):
+        self.websocket = websocket
+        self.room_id = room_id
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.sender: Optional[asyncio.Task] = None
+        self.dropped = False
+
+    def start(self):
+        self.sender = asyncio.create_task(self._send_loop())
+
+    async def _send_loop(self):
+        try:
+            while True:
+                event = await self.queue.get()
+                await self.websocket.send_json(event)
+        except Exception:
+            # Socket went away; the receive loop handles cleanup
+            pass
+
+    def offer(self, event: Dict) -> bool:
+        """
+        Queue an event without waiting. Returns False if the queue is full.
+        """
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def close(self, code: int = 1000, flush_timeout: float = 0.0):
+        # Give the sender a moment to deliver already-queued events
+        deadline = asyncio.get_running_loop().time() + flush_timeout
+        while not self.queue.empty() and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.01)
+        if self.sender:
+            self.sender.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+def room_channel(room_id: str) -> str:
+    return f"room:{room_id}"
+
+class RoomHub:
+    """
+    Tracks open room sockets in this process. Events are published through
+    the broker so every worker delivers them to its own sockets.
+    """
+    def __init__(self):
+        self.connections: Dict[str, Set[RoomConnection]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """
+        Subscribe to room events; call once from the app's startup hook
+        """
+        if self.loop is None:
+            broker.subscribe(room_channel("*"), self._on_broker_message)
+        self.loop = loop
+
+    def _on_broker_message(self, channel: str, event: Dict):
+        # May run on the broker's listener thread; nothing to deliver to
+        # before startup or after the loop shut down
+        if self.loop is None or self.loop.is_closed():
+            return
+        room_id = channel.split(":", 1)[1]
+        self.loop.call_soon_threadsafe(self._deliver, room_id, event)
+
+    def add(self, conn: RoomConnection):
+        self.connections.setdefault(conn.room_id, set()).add(conn)
+        conn.start()
+
+    def remove(self, conn: RoomConnection):
+        room_conns = self.connections.get(conn.room_id)
+        if room_conns is None:
+            return
+        room_conns.discard(conn)
+        if not room_conns:
+            del self.connections[conn.room_id]
+
+    def publish(self, room_id: str, event: Dict):
+        """
+        Broadcast an event to the room's sockets on every worker
+        """
+        broker.publish(room_channel(room_id), event)
+
+    def _deliver(self, room_id: str, event: Dict):
+        """
+        Push an event to this worker's sockets in the room. Never awaits:
+        clients whose queue is full are disconnected and must resync over REST.
+        """
+        if event.get("type") == "closed":
+            asyncio.create_task(self.close_room(room_id))
+        for conn in list(self.connections.get(room_id, ())):
+            if conn.dropped:
+                continue
+            if not conn.offer(event):
+                conn.dropped = True
+                self.remove(conn)
+                asyncio.create_task(conn.close(SLOW_CONSUMER_CLOSE_CODE))
+
+    async def close_room(self, room_id: str, code: int = 1000):
+        """
+        Disconnect every socket in a room (e.g. when the room is closed)
+        """
+        for conn in list(self.connections.get(room_id, ())):
+            self.remove(conn)
+            await conn.close(code, flush_timeout=1.0)
+
+    def connection_count(self, room_id: str) -> int:
+        return len(self.connections.get(room_id, ()))
+
+room_hub = RoomHub()
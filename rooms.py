@@ -1,38 +1,495 @@
 # rooms.py
 # Room-based play sessions and real-time interactions
 
+import asyncio
+import bisect
+import fcntl
+import gzip
 import json
 import os
+import struct
+import threading
+import time
 import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, List, Dict, Set
+from typing import Optional, List, Dict, Set, Tuple
 import random
+from broker import broker
+from moderation import hidden_ids, is_hidden
+from realtime import room_channel
 
 DATA_DIR = ".data"
 ROOMS_FILE = os.path.join(DATA_DIR, "rooms.json")
+ROOMS_LOCK_FILE = ROOMS_FILE + ".lock"
+ROOM_LOGS_DIR = os.path.join(DATA_DIR, "room_logs")
+ROOMS_ARCHIVE_DIR = os.path.join(DATA_DIR, "rooms_archive")
+ROOMS_ARCHIVE_INDEX = os.path.join(ROOMS_ARCHIVE_DIR, "index.tsv")
+
+# Recent entries kept in memory per room; older ones are paged from disk
+CHAT_BUFFER_SIZE = 100
+INTERACTION_BUFFER_SIZE = 50
 
 os.makedirs(DATA_DIR, exist_ok=True)
+os.makedirs(ROOM_LOGS_DIR, exist_ok=True)
+os.makedirs(ROOMS_ARCHIVE_DIR, exist_ok=True)
 if not os.path.exists(ROOMS_FILE):
     with open(ROOMS_FILE, "w") as f:
         json.dump({}, f)
 
-# In-memory active sessions (would use Redis in production)
-active_sessions: Dict[str, Set[str]] = {}  # room_id -> set of user_ids
+# Presence lapses unless refreshed by a heartbeat within this many seconds
+PRESENCE_TTL = 60
 
-def load_rooms():
+# Broker sorted set of "room_id|user_id" -> expiry time, across all rooms
+PRESENCE_EXPIRY_KEY = "presence:expiry"
+
+def presence_key(room_id: str) -> str:
+    # Broker sorted set of user_id -> expiry time for one room
+    return f"presence:{room_id}"
+
+_OFFSET = struct.Struct("<Q")
+
+class RoomLog:
+    """
+    Fixed-capacity ring buffer of a room's recent entries, backed by an
+    append-only JSON-lines file. Every entry gets a monotonically increasing
+    `seq` (starting at 1); a sidecar .idx file stores one 8-byte file offset
+    per seq so any older page can be read with a single seek.
+
+    The .idx file is the source of truth for seqs: appends take an exclusive
+    file lock and number the entry from the index length, so several worker
+    processes can share a log. Readers pick up entries written by other
+    processes whenever the index has grown.
+    """
+    def __init__(self, path: str, capacity: int):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.lock_path = path + ".lock"
+        self.buffer: deque = deque(maxlen=capacity)
+        self.next_seq = 1
+        self._lock = threading.Lock()
+        self._refresh()
+
+    def _indexed_count(self) -> int:
+        try:
+            return os.path.getsize(self.index_path) // _OFFSET.size
+        except FileNotFoundError:
+            return 0
+
+    def _refresh(self):
+        """
+        Bring the buffer up to date with entries appended by other processes
+        """
+        with self._lock:
+            count = self._indexed_count()
+            if count + 1 == self.next_seq:
+                return
+            first = max(self.next_seq, count - self.buffer.maxlen + 1, 1)
+            entries = self._read_range(first, count + 1)
+            if first > self.next_seq:
+                self.buffer.clear()
+            self.buffer.extend(entries)
+            self.next_seq = count + 1
+
+    def _offset(self, index_file, seq: int) -> int:
+        index_file.seek((seq - 1) * _OFFSET.size)
+        return _OFFSET.unpack(index_file.read(_OFFSET.size))[0]
+
+    def _read_range(self, start: int, end: int) -> List[Dict]:
+        """
+        Read entries with start <= seq < end from disk
+        """
+        if start >= end:
+            return []
+        with open(self.index_path, "rb") as index_file:
+            begin = self._offset(index_file, start)
+            stop = self._offset(index_file, end) if end <= self._indexed_count() else None
+        with open(self.path, "rb") as f:
+            f.seek(begin)
+            data = f.read() if stop is None else f.read(stop - begin)
+        # Past the last indexed entry there may be another writer's line
+        lines = data.splitlines()[:end - start]
+        return [json.loads(line) for line in lines]
+
+    @contextmanager
+    def _locked(self):
+        """
+        Exclusive access to the log files across processes. A write cut short
+        by a crash is trimmed first: a partial index record, or log bytes
+        after the last indexed entry.
+        """
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(self.path, "ab+") as f, open(self.index_path, "ab+") as index_file:
+                    count = self._indexed_count()
+                    index_file.truncate(count * _OFFSET.size)
+                    end = 0
+                    if count:
+                        f.seek(self._offset(index_file, count))
+                        end = f.tell() + len(f.readline())
+                    f.truncate(end)
+                    yield f, index_file, count
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def append(self, entry: Dict) -> Dict:
+        return self.extend([entry])[0]
+
+    def extend(self, entries: List[Dict], only_if_empty: bool = False) -> List[Dict]:
+        """
+        Append entries atomically, numbering them after the last stored one.
+        With only_if_empty, nothing is written unless the log is empty.
+        """
+        with self._locked() as (f, index_file, count):
+            if only_if_empty and count:
+                entries = []
+            added = []
+            records = []
+            offsets = []
+            offset = f.seek(0, os.SEEK_END)
+            for seq, entry in enumerate(entries, count + 1):
+                entry = {"seq": seq, **entry}
+                record = json.dumps(entry, separators=(",", ":")).encode() + b"\n"
+                offsets.append(_OFFSET.pack(offset))
+                records.append(record)
+                offset += len(record)
+                added.append(entry)
+            # The log before the index, so every indexed entry is complete
+            f.write(b"".join(records))
+            f.flush()
+            index_file.write(b"".join(offsets))
+        self._refresh()
+        return added
+
+    def last_seq(self) -> int:
+        self._refresh()
+        return self.next_seq - 1
+
+    def recent(self) -> List[Dict]:
+        self._refresh()
+        return list(self.buffer)
+
+    def since(self, seq: int, limit: int) -> List[Dict]:
+        """
+        Entries with seq > `seq`, oldest first (at most `limit`)
+        """
+        self._refresh()
+        with self._lock:
+            start = max(seq + 1, 1)
+            end = min(start + limit, self.next_seq)
+            oldest_buffered = self.buffer[0]["seq"] if self.buffer else self.next_seq
+            if start >= oldest_buffered:
+                return [e for e in self.buffer if start <= e["seq"] < end]
+        return self._read_range(start, end)
+
+    def before(self, seq: Optional[int], limit: int) -> List[Dict]:
+        """
+        Page of older entries with seq < `seq` (or the newest ones when seq
+        is None), oldest first (at most `limit`)
+        """
+        self._refresh()
+        end = self.next_seq if seq is None else min(seq, self.next_seq)
+        start = max(1, end - limit)
+        return self._read_range(start, end)
+
+# Most room logs held open at once; the least recently used are released
+# and reopen from disk on their next use
+MAX_OPEN_ROOM_LOGS = 2000
+
+# (room_id, kind) -> RoomLog, opened lazily, least recently used first
+_room_logs: "OrderedDict[Tuple[str, str], RoomLog]" = OrderedDict()
+
+LOG_CAPACITY = {"chat": CHAT_BUFFER_SIZE, "interactions": INTERACTION_BUFFER_SIZE}
+LEGACY_LOG_FIELDS = {"chat": "chat_log", "interactions": "interactions"}
+
+def get_room_log(room_id: str, kind: str, room: Optional[Dict] = None, keep: bool = True) -> RoomLog:
+    """
+    Get the chat or interaction log for a room. With keep=False (e.g. for
+    archived rooms) a log that isn't already open is read without being held.
+    """
+    key = (room_id, kind)
+    log = _room_logs.get(key)
+    if log is not None:
+        _room_logs.move_to_end(key)
+        return log
+    log = RoomLog(os.path.join(ROOM_LOGS_DIR, f"{room_id}.{kind}.jsonl"), LOG_CAPACITY[kind])
+    # Rooms created before append logs kept their history inline
+    if log.next_seq == 1 and room and room.get(LEGACY_LOG_FIELDS[kind]):
+        log.extend(room[LEGACY_LOG_FIELDS[kind]], only_if_empty=True)
+    if keep:
+        _room_logs[key] = log
+        while len(_room_logs) > MAX_OPEN_ROOM_LOGS:
+            _room_logs.popitem(last=False)
+    return log
+
+def touch_presence(room_id: str, user_id: str):
+    """
+    Mark a user present in a room for another PRESENCE_TTL seconds
+    """
+    expires_at = time.time() + PRESENCE_TTL
+    broker.zadd(presence_key(room_id), user_id, expires_at)
+    broker.zadd(PRESENCE_EXPIRY_KEY, f"{room_id}|{user_id}", expires_at)
+
+def drop_presence(room_id: str, user_id: str) -> bool:
+    """
+    Remove a user's presence. Returns True if the room is now empty.
+    """
+    broker.zrem(presence_key(room_id), user_id)
+    broker.zrem(PRESENCE_EXPIRY_KEY, f"{room_id}|{user_id}")
+    update_open_index(room_id)
+    
+    if broker.zcount(presence_key(room_id)) == 0:
+        idle_room(room_id)
+        return True
+    return False
+
+def expire_presence(now: Optional[float] = None) -> List[Dict]:
+    """
+    Drop presence entries whose heartbeat lapsed and broadcast a "leave"
+    event for each. Only due entries are touched (popped from the expiry
+    set), never a scan over all rooms.
+    Returns: [{"room_id", "user_id", "room_idle"}] for each expired user
+    """
+    now = now or time.time()
+    expired = []
+    batch_size = 100
+    
+    while True:
+        due = broker.zpop_due(PRESENCE_EXPIRY_KEY, now, batch_size)
+        for member, _ in due:
+            room_id, user_id = member.split("|", 1)
+            # Skip users who sent a heartbeat after this entry was popped
+            score = broker.zscore(presence_key(room_id), user_id)
+            if score is None or score > now:
+                continue
+            room_idle = drop_presence(room_id, user_id)
+            broker.publish(room_channel(room_id), {
+                "type": "leave",
+                "room_id": room_id,
+                "user_id": user_id,
+                "reason": "timeout"
+            })
+            expired.append({"room_id": room_id, "user_id": user_id, "room_idle": room_idle})
+        if len(due) < batch_size:
+            break
+    
+    return expired
+
+def idle_room(room_id: str):
+    """
+    Release in-memory state for a room nobody is in. Its logs reopen
+    from disk on the next read or write.
+    """
+    _room_logs.pop((room_id, "chat"), None)
+    _room_logs.pop((room_id, "interactions"), None)
+
+def loaded_room_ids() -> Set[str]:
+    """
+    Rooms whose logs are currently held in this process
+    """
+    return {room_id for room_id, _ in _room_logs}
+
+def get_presence_count(room_id: str) -> int:
+    """
+    Number of users with a live heartbeat in a room
+    """
+    expire_presence()
+    return broker.zcount(presence_key(room_id))
+
+# Hot room set, reloaded only when rooms.json changes on disk
+_rooms_cache: Dict = {"mtime": None, "rooms": {}}
+
+# Serialises writers in this process; the file lock serialises processes
+_rooms_write_lock = threading.Lock()
+
+def _read_rooms() -> Dict:
+    mtime = os.stat(ROOMS_FILE).st_mtime_ns
     with open(ROOMS_FILE, "r") as f:
-        return json.load(f)
+        rooms = json.load(f)
+    previous = _rooms_cache["rooms"]
+    first_load = _rooms_cache["mtime"] is None
+    _rooms_cache["rooms"] = rooms
+    _rooms_cache["mtime"] = mtime
+    # Another process changed the file and may not share our broker:
+    # re-check only the rooms that changed
+    if first_load:
+        _rebuild_open_index(rooms)
+    else:
+        for room_id in previous.keys() | rooms.keys():
+            if previous.get(room_id) != rooms.get(room_id):
+                _sync_open_index(room_id, rooms.get(room_id))
+    return rooms
+
+def load_rooms():
+    if os.stat(ROOMS_FILE).st_mtime_ns != _rooms_cache["mtime"]:
+        return _read_rooms()
+    return _rooms_cache["rooms"]
+
+@contextmanager
+def edit_rooms():
+    """
+    Read-modify-write of rooms.json under an exclusive file lock, so shards
+    changing different rooms at once don't drop each other's updates.
+    Yields the freshly read room set; it is saved when the block exits.
+    """
+    with _rooms_write_lock, open(ROOMS_LOCK_FILE, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            rooms = _read_rooms()
+            try:
+                yield rooms
+            except BaseException:
+                # Discard partial edits; re-read on next access
+                _rooms_cache["mtime"] = None
+                raise
+            save_rooms(rooms)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def get_cached_room(room_id: str) -> Optional[Dict]:
+    """
+    A hot room from the in-memory set; rooms.json is only re-read on a miss
+    """
+    room = _rooms_cache["rooms"].get(room_id)
+    if room is None:
+        room = load_rooms().get(room_id)
+    return room
 
 def save_rooms(rooms):
-    with open(ROOMS_FILE, "w") as f:
+    """
+    Write the room set (use inside edit_rooms() when other processes may write)
+    """
+    tmp_path = f"{ROOMS_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
         json.dump(rooms, f, indent=2)
+    os.replace(tmp_path, ROOMS_FILE)
+    _rooms_cache["rooms"] = rooms
+    _rooms_cache["mtime"] = os.stat(ROOMS_FILE).st_mtime_ns
+
+# ===== Open-room index =====
+# Joinable rooms ordered by created_at, so listing newest rooms is O(limit).
+# Updates are published through the broker so every worker's index agrees.
+
+OPEN_INDEX_CHANNEL = "rooms:index"
+
+_open_rooms: List[Tuple[str, str]] = []  # sorted (created_at, room_id)
+_open_room_keys: Dict[str, Tuple[str, str]] = {}
+_open_lock = threading.Lock()
+
+def _apply_open_index(channel: str, update: Dict):
+    key = (update["created_at"], update["room_id"])
+    with _open_lock:
+        current = _open_room_keys.get(update["room_id"])
+        if update["joinable"] and current is None:
+            bisect.insort(_open_rooms, key)
+            _open_room_keys[update["room_id"]] = key
+        elif not update["joinable"] and current is not None:
+            i = bisect.bisect_left(_open_rooms, current)
+            if i < len(_open_rooms) and _open_rooms[i] == current:
+                del _open_rooms[i]
+            del _open_room_keys[update["room_id"]]
+
+broker.subscribe(OPEN_INDEX_CHANNEL, _apply_open_index)
+
+def _is_joinable(room: Dict) -> bool:
+    return room.get("active", False) and broker.zcount(presence_key(room["id"])) < room["max_players"]
+
+def _rebuild_open_index(rooms: Dict):
+    with _open_lock:
+        _open_rooms[:] = sorted(
+            (room.get("created_at", ""), room["id"])
+            for room in rooms.values() if _is_joinable(room)
+        )
+        _open_room_keys.clear()
+        _open_room_keys.update((room_id, (created_at, room_id)) for created_at, room_id in _open_rooms)
+
+def _sync_open_index(room_id: str, room: Optional[Dict]) -> Optional[Dict]:
+    """
+    Re-check one room in this process's index. Returns the applied update,
+    or None if the room wasn't listed and isn't joinable.
+    """
+    joinable = bool(room) and _is_joinable(room)
+    update = {"room_id": room_id, "created_at": room.get("created_at", "") if room else "", "joinable": joinable}
+    if not joinable:
+        # Removal only needs the id; use the locally known key
+        with _open_lock:
+            known = _open_room_keys.get(room_id)
+        if known is None:
+            return None
+        update["created_at"] = known[0]
+    _apply_open_index(OPEN_INDEX_CHANNEL, update)
+    return update
+
+def update_open_index(room_id: str, room: Optional[Dict] = None):
+    """
+    Re-check whether a room is joinable after create/join/leave/close
+    """
+    if room is None:
+        room = load_rooms().get(room_id)
+    update = _sync_open_index(room_id, room)
+    if update is not None:
+        broker.publish(OPEN_INDEX_CHANNEL, update)
+
+# ===== Archive of closed rooms =====
+# Closed rooms leave rooms.json and are appended to a gzip segment per month.
+# index.tsv maps room_id -> segment so archived rooms can still be looked up.
+
+_archive_index: Optional[Dict[str, str]] = None
+
+def _load_archive_index() -> Dict[str, str]:
+    global _archive_index
+    if _archive_index is None:
+        _archive_index = {}
+        if os.path.exists(ROOMS_ARCHIVE_INDEX):
+            with open(ROOMS_ARCHIVE_INDEX, "r") as f:
+                for line in f:
+                    room_id, _, segment = line.rstrip("\n").partition("\t")
+                    _archive_index[room_id] = segment
+    return _archive_index
+
+def archive_room(room: Dict):
+    """
+    Append a closed room to this month's compressed archive segment
+    """
+    segment = f"rooms-{datetime.utcnow():%Y-%m}.jsonl.gz"
+    # Each append is its own gzip member; readers see one continuous stream
+    with gzip.open(os.path.join(ROOMS_ARCHIVE_DIR, segment), "ab") as f:
+        f.write(json.dumps(room, separators=(",", ":")).encode() + b"\n")
+    with open(ROOMS_ARCHIVE_INDEX, "a") as f:
+        f.write(f"{room['id']}\t{segment}\n")
+    _load_archive_index()[room["id"]] = segment
+
+def get_archived_room(room_id: str) -> Optional[Dict]:
+    segment = _load_archive_index().get(room_id)
+    if not segment:
+        return None
+    with gzip.open(os.path.join(ROOMS_ARCHIVE_DIR, segment), "rb") as f:
+        for line in f:
+            room = json.loads(line)
+            if room["id"] == room_id:
+                return room
+    return None
+
+def count_archived_rooms() -> int:
+    return len(_load_archive_index())
+
+def archive_closed_rooms():
+    """
+    Move rooms closed before the archive existed out of the hot set
+    """
+    if all(room.get("active", False) for room in load_rooms().values()):
+        return
+    with edit_rooms() as rooms:
+        for room in [room for room in rooms.values() if not room.get("active", False)]:
+            archive_room(room)
+            del rooms[room["id"]]
 
 def create_room(creator_id: str, name: str, npc_id: Optional[str] = None, max_players: int = 4) -> Dict:
     """
     Create a new play session room
     """
-    rooms = load_rooms()
-    
     room_id = str(uuid.uuid4())
     
     room = {
@@ -43,22 +500,67 @@ def create_room(creator_id: str, name: str, npc_id: Optional[str] = None, max_pl
         "max_players": max_players,
         "created_at": datetime.utcnow().isoformat() + "Z",
         "active": True,
-        "players": [creator_id],
-        "chat_log": [],
-        "interactions": []
+        "players": [creator_id]
     }
     
-    rooms[room_id] = room
-    save_rooms(rooms)
+    with edit_rooms() as rooms:
+        rooms[room_id] = room
     
     # Track active session
-    active_sessions[room_id] = {creator_id}
+    touch_presence(room_id, creator_id)
+    update_open_index(room_id, room)
     
-    return room
+    return {**room, "chat_log": [], "interactions": []}
+
+def chat_content_id(room_id: str, seq: int) -> str:
+    # How chat messages are identified in reports
+    return f"{room_id}:{seq}"
+
+def _visible_entries(room_id: str, kind: str, entries: List[Dict]) -> List[Dict]:
+    """
+    Drop chat messages hidden by moderation
+    """
+    if kind != "chat":
+        return entries
+    hidden = hidden_ids("chat")
+    if not hidden:
+        return entries
+    return [e for e in entries if chat_content_id(room_id, e["seq"]) not in hidden]
 
 def get_room(room_id: str) -> Optional[Dict]:
+    """
+    Get a room with its most recent chat and interactions. Rooms hidden by
+    moderation read as missing.
+    """
+    if is_hidden("room", room_id):
+        return None
     rooms = load_rooms()
-    return rooms.get(room_id)
+    hot = room_id in rooms
+    room = rooms[room_id] if hot else get_archived_room(room_id)
+    
+    if not room:
+        return None
+    
+    # Archived rooms are read without reopening logs idle_room released
+    return {
+        **room,
+        "chat_log": _visible_entries(room_id, "chat", get_room_log(room_id, "chat", room, keep=hot).recent()),
+        "interactions": get_room_log(room_id, "interactions", room, keep=hot).recent()
+    }
+
+def room_exists(room_id: str) -> bool:
+    """
+    True for open and archived rooms
+    """
+    return room_id in load_rooms() or room_id in _load_archive_index()
+
+def chat_message_exists(room_id: str, seq: int) -> bool:
+    """
+    True if a room's chat log has an entry with this seq
+    """
+    if not room_exists(room_id):
+        return False
+    return 1 <= seq <= get_room_log(room_id, "chat", keep=False).last_seq()
 
 def join_room(room_id: str, user_id: str) -> Optional[Dict]:
     """
@@ -70,44 +572,63 @@ def join_room(room_id: str, user_id: str) -> Optional[Dict]:
     if not room:
         return None
     
-    if not room.get("active", False):
+    if not room.get("active", False) or is_hidden("room", room_id):
         return None
     
-    if len(room["players"]) >= room["max_players"]:
+    # Capacity counts live participants, not everyone who ever joined, and
+    # only limits newcomers: members rejoin even if their presence lapsed
+    member = user_id in room["players"] or broker.zscore(presence_key(room_id), user_id) is not None
+    if not member and get_presence_count(room_id) >= room["max_players"]:
         return None
     
     if user_id not in room["players"]:
-        room["players"].append(user_id)
-        rooms[room_id] = room
-        save_rooms(rooms)
+        with edit_rooms() as rooms:
+            room = rooms.get(room_id)
+            if not room or not room.get("active", False):
+                return None
+            if user_id not in room["players"]:
+                room["players"].append(user_id)
     
     # Track active session
-    if room_id not in active_sessions:
-        active_sessions[room_id] = set()
-    active_sessions[room_id].add(user_id)
+    touch_presence(room_id, user_id)
+    update_open_index(room_id, room)
     
     return room
 
-def leave_room(room_id: str, user_id: str):
+def heartbeat(room_id: str, user_id: str) -> bool:
+    """
+    Refresh a participant's presence. Returns False if they are no longer
+    in the room (e.g. their presence already expired and the room filled up).
+    """
+    rooms = load_rooms()
+    room = rooms.get(room_id)
+    
+    if not room or not room.get("active", False):
+        return False
+    
+    if broker.zscore(presence_key(room_id), user_id) is None:
+        return join_room(room_id, user_id) is not None
+    
+    touch_presence(room_id, user_id)
+    return True
+
+def leave_room(room_id: str, user_id: str) -> bool:
     """
     Remove a player from a room
+    Returns: True if the room is now empty (and was idled)
     """
-    if room_id in active_sessions:
-        active_sessions[room_id].discard(user_id)
-        
-        # Clean up empty rooms
-        if len(active_sessions[room_id]) == 0:
-            del active_sessions[room_id]
+    return drop_presence(room_id, user_id)
 
-def add_chat_message(room_id: str, user_id: str, message: str):
+def add_chat_message(room_id: str, user_id: str, message: str) -> Optional[Dict]:
     """
     Add a chat message to the room log
+    Returns: the stored entry, or None if the room doesn't exist or the
+    user isn't a member
     """
-    rooms = load_rooms()
-    room = rooms.get(room_id)
+    room = get_cached_room(room_id)
     
-    if not room:
-        return False
+    if not room or user_id not in room["players"] or is_hidden("room", room_id):
+        return None
     
     chat_entry = {
         "user_id": user_id,
@@ -115,25 +636,18 @@ def add_chat_message(room_id: str, user_id: str, message: str):
         "timestamp": datetime.utcnow().isoformat() + "Z"
     }
     
-    room["chat_log"].append(chat_entry)
-    
-    # Keep last 100 messages
-    room["chat_log"] = room["chat_log"][-100:]
-    
-    rooms[room_id] = room
-    save_rooms(rooms)
-    
-    return True
+    return get_room_log(room_id, "chat", room).append(chat_entry)
 
-def add_npc_interaction(room_id: str, user_id: str, npc_id: str, dialogue_id: str, response_text: str):
+def add_npc_interaction(room_id: str, user_id: str, npc_id: str, dialogue_id: str, response_text: str) -> Optional[Dict]:
     """
     Record an NPC interaction in the room
+    Returns: the stored interaction, or None if the room doesn't exist
     """
     rooms = load_rooms()
     room = rooms.get(room_id)
     
     if not room:
-        return False
+        return None
     
     interaction = {
         "user_id": user_id,
@@ -143,53 +657,88 @@ def add_npc_interaction(room_id: str, user_id: str, npc_id: str, dialogue_id: st
         "timestamp": datetime.utcnow().isoformat() + "Z"
     }
     
-    room["interactions"].append(interaction)
+    return get_room_log(room_id, "interactions", room).append(interaction)
+
+def get_room_entries_since(room_id: str, kind: str, since_seq: int = 0, limit: int = 100) -> Optional[List[Dict]]:
+    """
+    Get chat or interaction entries newer than `since_seq`
+    """
+    rooms = load_rooms()
+    room = rooms.get(room_id)
+    
+    if not room or is_hidden("room", room_id):
+        return None
     
-    # Keep last 50 interactions
-    room["interactions"] = room["interactions"][-50:]
+    return _visible_entries(room_id, kind, get_room_log(room_id, kind, room).since(since_seq, limit))
+
+def get_room_history(room_id: str, kind: str, before_seq: Optional[int] = None, limit: int = 100) -> Optional[List[Dict]]:
+    """
+    Page backwards through a room's full chat or interaction history
+    """
+    rooms = load_rooms()
+    room = rooms.get(room_id)
     
-    rooms[room_id] = room
-    save_rooms(rooms)
+    if not room or is_hidden("room", room_id):
+        return None
     
-    return True
+    log = get_room_log(room_id, kind, room)
+    return _visible_entries(room_id, kind, log.before(before_seq, limit))
 
 def get_active_rooms(limit: int = 20) -> List[Dict]:
     """
-    Get list of active rooms
+    Get list of joinable rooms, most recent first
     """
     rooms = load_rooms()
+    hidden = hidden_ids("room")
+    expire_presence()
     
-    active_rooms = [
-        room for room in rooms.values()
-        if room.get("active", False) and len(room["players"]) < room["max_players"]
-    ]
+    active_rooms = []
+    seen = 0
+    window = limit
+    # Usually the newest `limit` entries are all joinable; widen the window
+    # only if some went stale in between index updates
+    while len(active_rooms) < limit:
+        with _open_lock:
+            total = len(_open_rooms)
+            batch = _open_rooms[max(0, total - seen - window):total - seen]
+        if not batch:
+            break
+        seen += len(batch)
+        window *= 2
+        for _, room_id in reversed(batch):
+            room = rooms.get(room_id)
+            if not room or room_id in hidden:
+                continue
+            count = broker.zcount(presence_key(room_id))
+            if room.get("active", False) and count < room["max_players"]:
+                active_rooms.append({**room, "presence_count": count})
+                if len(active_rooms) >= limit:
+                    break
     
-    # Sort by most recent
-    sorted_rooms = sorted(
-        active_rooms,
-        key=lambda x: x.get("created_at", ""),
-        reverse=True
-    )
-    
-    return sorted_rooms[:limit]
+    return active_rooms
 
 def close_room(room_id: str, user_id: str) -> bool:
     """
     Close a room (only creator can do this)
     """
-    rooms = load_rooms()
-    room = rooms.get(room_id)
+    room = load_rooms().get(room_id)
     
     if not room or room["creator_id"] != user_id:
         return False
     
-    room["active"] = False
-    rooms[room_id] = room
-    save_rooms(rooms)
+    # Move the room out of the hot set into the archive
+    with edit_rooms() as rooms:
+        room = rooms.pop(room_id, None)
+        if not room:
+            return False
+        room["active"] = False
+        room["closed_at"] = datetime.utcnow().isoformat() + "Z"
+        archive_room(room)
     
-    # Clean up active sessions
-    if room_id in active_sessions:
-        del active_sessions[room_id]
+    # Clean up active sessions (stale expiry entries are skipped by the sweeper)
+    broker.delete(presence_key(room_id))
+    update_open_index(room_id, room)
+    idle_room(room_id)
     
     return True
 
@@ -197,4 +746,17 @@ def get_room_participants(room_id: str) -> Set[str]:
     """
     Get current active participants in a room
     """
-    return active_sessions.get(room_id, set())
+    expire_presence()
+    return broker.zmembers(presence_key(room_id))
+
+async def run_presence_sweeper(interval: float = 5.0):
+    """
+    Background loop expiring lapsed presence, so leave events go out even
+    when nothing reads the room
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            expire_presence()
+        except Exception as e:
+            print(f"Presence sweep failed: {e}")
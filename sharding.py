@@ -0,0 +1,227 @@
+# sharding.py
+# Consistent-hash assignment of rooms to worker shards
+#
+# Each worker is a shard with its own URL. Rooms are owned by exactly one
+# shard (chosen by hashing room_id onto a ring), and room-scoped HTTP requests
+# and WebSockets that land on another shard are forwarded to the owner, so a
+# room's hot state (ring buffers, sockets) lives in one process.
+#
+# Configuration (all optional; without SHARD_URL sharding is disabled):
+#   SHARD_ID     - this worker's name (default: hostname-pid)
+#   SHARD_URL    - base URL other shards use to reach this worker
+#   SHARD_PEERS  - static peers, "id=url,id=url" (for runs without Redis)
+# With REDIS_URL set, shards also register themselves in the broker and the
+# ring follows workers as they come and go.
+
+import asyncio
+import bisect
+import hashlib
+import os
+import re
+import socket
+import time
+from typing import Callable, Dict, Optional, Tuple
+from broker import broker
+
+SHARD_ID = os.getenv("SHARD_ID") or f"{socket.gethostname()}-{os.getpid()}"
+SHARD_URL = os.getenv("SHARD_URL")
+SHARD_PEERS = os.getenv("SHARD_PEERS", "")
+
+# Virtual nodes per shard; more points give a more even spread
+RING_REPLICAS = 64
+
+# Shards re-register every interval and drop out after the TTL
+SHARD_HEARTBEAT_INTERVAL = 5.0
+SHARD_TTL = 15.0
+SHARD_REGISTRY_KEY = "shards"
+
+# Set on forwarded requests so the owner never forwards them again
+FORWARDED_HEADER = "x-shard-forwarded"
+
+# Room-scoped paths: /api/rooms/<uuid>/... and /ws/rooms/<uuid>
+ROOM_PATH = re.compile(r"^/(?:api|ws)/rooms/([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(?:/|$)")
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+class HashRing:
+    """
+    Consistent hash ring: adding or removing a shard only moves the keys
+    that hashed to that shard's points
+    """
+    def __init__(self, shards: Dict[str, str], replicas: int = RING_REPLICAS):
+        self.shards = dict(shards)  # shard_id -> url
+        points = sorted(
+            (_hash(f"{shard_id}#{i}"), shard_id)
+            for shard_id in shards
+            for i in range(replicas)
+        )
+        self._hashes = [h for h, _ in points]
+        self._owners = [shard_id for _, shard_id in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        i = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[i]
+
+def parse_peers(value: str) -> Dict[str, str]:
+    peers = {}
+    for item in value.split(","):
+        shard_id, _, url = item.strip().partition("=")
+        if shard_id and url:
+            peers[shard_id] = url.rstrip("/")
+    return peers
+
+class ShardRouter:
+    """
+    Tracks live shards and answers "who owns this room?"
+    """
+    def __init__(self, shard_id: str = SHARD_ID, url: Optional[str] = SHARD_URL, peers: str = SHARD_PEERS):
+        self.shard_id = shard_id
+        self.url = url.rstrip("/") if url else None
+        self.static_peers = parse_peers(peers)
+        self.ring = HashRing(self._static_members())
+        self._client = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.url is not None
+
+    def _static_members(self) -> Dict[str, str]:
+        members = dict(self.static_peers)
+        if self.url:
+            members[self.shard_id] = self.url
+        return members
+
+    def register(self):
+        if self.enabled:
+            broker.zadd(SHARD_REGISTRY_KEY, f"{self.shard_id}|{self.url}", time.time() + SHARD_TTL)
+
+    def refresh(self) -> bool:
+        """
+        Rebuild the ring from static peers plus registered shards.
+        Returns True if membership changed.
+        """
+        broker.zremrangebyscore(SHARD_REGISTRY_KEY, time.time())
+        members = self._static_members()
+        for member in broker.zmembers(SHARD_REGISTRY_KEY):
+            shard_id, _, url = member.partition("|")
+            members[shard_id] = url
+        if members == self.ring.shards:
+            return False
+        self.ring = HashRing(members)
+        return True
+
+    def owner(self, room_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        (shard_id, url) owning a room, or (None, None) if sharding is off
+        """
+        if not self.enabled:
+            return None, None
+        shard_id = self.ring.owner(room_id)
+        return shard_id, self.ring.shards.get(shard_id)
+
+    def is_local(self, room_id: str) -> bool:
+        shard_id, _ = self.owner(room_id)
+        return shard_id is None or shard_id == self.shard_id
+
+    def remote_owner_url(self, path: str, headers, room_id: Optional[str] = None) -> Optional[str]:
+        """
+        Owner URL for a room-scoped request that should be forwarded, else None.
+        `room_id` covers endpoints that carry it in the body instead of the path.
+        """
+        if not self.enabled or headers.get(FORWARDED_HEADER):
+            return None
+        if room_id is None:
+            match = ROOM_PATH.match(path)
+            room_id = match.group(1) if match else None
+        if not room_id or self.is_local(room_id):
+            return None
+        return self.owner(room_id)[1]
+
+    async def forward(self, request, owner_url: str):
+        """
+        Replay an HTTP request against the owning shard
+        """
+        import httpx
+        from fastapi.responses import Response
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=10.0)
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in ("host", "content-length")}
+        headers[FORWARDED_HEADER] = self.shard_id
+        upstream = await self._client.request(
+            request.method,
+            owner_url + request.url.path,
+            params=request.query_params,
+            headers=headers,
+            content=await request.body()
+        )
+        passthrough = {k: v for k, v in upstream.headers.items() if k.lower() in ("content-type", "cache-control", "etag")}
+        return Response(upstream.content, status_code=upstream.status_code, headers=passthrough)
+
+    async def proxy_websocket(self, websocket, owner_url: str):
+        """
+        Bridge a client socket to the owning shard's socket
+        """
+        from websockets.asyncio.client import connect
+        from websockets.exceptions import InvalidStatus
+
+        ws_url = re.sub(r"^http", "ws", owner_url) + websocket.url.path
+        if websocket.url.query:
+            ws_url += "?" + websocket.url.query
+        headers = {FORWARDED_HEADER: self.shard_id}
+        if websocket.headers.get("authorization"):
+            headers["authorization"] = websocket.headers["authorization"]
+
+        try:
+            upstream = await connect(ws_url, additional_headers=headers)
+        except (InvalidStatus, OSError):
+            await websocket.close(code=1008)
+            return
+
+        await websocket.accept()
+
+        async def client_to_upstream():
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                text = message.get("text")
+                await upstream.send(text if text is not None else message.get("bytes"))
+
+        async def upstream_to_client():
+            async for message in upstream:
+                if isinstance(message, bytes):
+                    await websocket.send_bytes(message)
+                else:
+                    await websocket.send_text(message)
+
+        tasks = [asyncio.create_task(client_to_upstream()), asyncio.create_task(upstream_to_client())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await upstream.close()
+            try:
+                await websocket.close(code=upstream.close_code or 1000)
+            except Exception:
+                pass
+
+    async def run(self, on_rebalance: Callable[[], None]):
+        """
+        Background loop: heartbeat this shard and rebuild the ring when
+        shards join or leave; `on_rebalance` lets callers shed moved rooms
+        """
+        while True:
+            try:
+                self.register()
+                if self.refresh():
+                    on_rebalance()
+            except Exception as e:
+                print(f"Shard refresh failed: {e}")
+            await asyncio.sleep(SHARD_HEARTBEAT_INTERVAL)
+
+shard_router = ShardRouter()
@@ -1,18 +1,57 @@
 # sharing.py
 # Content sharing with OG images and social features
 
+import asyncio
+import atexit
+import hashlib
+import html
 import json
 import os
+import threading
+import time
 import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Callable, Optional, Dict
 from PIL import Image, ImageDraw, ImageFont
+from cache import LRUCache
+from moderation import hidden_ids
 import io
 import base64
 
 DATA_DIR = ".data"
 SHARES_FILE = os.path.join(DATA_DIR, "shares.json")
 IMAGES_DIR = os.path.join(DATA_DIR, "share_images")
+PLACEHOLDER_IMAGE = os.path.join(IMAGES_DIR, "placeholder.png")
+
+# OG images are rendered off the request path by a small process pool
+OG_RENDER_WORKERS = int(os.getenv("OG_RENDER_WORKERS", "2"))
+
+# How long the image endpoint waits for a pending render before falling back
+# to the placeholder
+OG_IMAGE_WAIT = 2.0
+
+# A share's image never changes once rendered, but moderation can take the
+# share down: caches keep it briefly, then revalidate against the ETag
+SHARE_IMAGE_CACHE_CONTROL = "public, max-age=300"
+
+# Rendered landing pages kept in memory (crawler bursts hit the same shares)
+SHARE_PAGE_CACHE_ITEMS = 5000
+SHARE_PAGE_CACHE_BYTES = 32 * 1024 * 1024
+
+# Views are counted in memory and written to shares.json in one batch
+SHARE_VIEW_FLUSH_INTERVAL = 10.0
+
+# Disk budget for rendered images; evicted images re-render on next request
+OG_IMAGE_BUDGET_BYTES = int(os.getenv("OG_IMAGE_BUDGET_MB", "512")) * 1024 * 1024
+OG_IMAGE_EVICTION = os.getenv("OG_IMAGE_EVICTION", "lru")  # "lru" or "lfu"
+OG_IMAGE_SWEEP_INTERVAL = 600.0
+
+# Files younger than this are never treated as orphans (a share may be
+# mid-creation) and stale .tmp files older than it are removed
+OG_IMAGE_ORPHAN_GRACE = 600.0
 
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(IMAGES_DIR, exist_ok=True)
@@ -21,41 +60,93 @@ if not os.path.exists(SHARES_FILE):
     with open(SHARES_FILE, "w") as f:
         json.dump({}, f)
 
+# Shares, reloaded only when shares.json changes on disk
+_shares_cache: Dict = {"mtime": None, "shares": {}}
+
 def load_shares():
-    with open(SHARES_FILE, "r") as f:
-        return json.load(f)
+    mtime = os.stat(SHARES_FILE).st_mtime_ns
+    if mtime != _shares_cache["mtime"]:
+        with open(SHARES_FILE, "r") as f:
+            _shares_cache["shares"] = json.load(f)
+        _shares_cache["mtime"] = mtime
+    return _shares_cache["shares"]
 
 def save_shares(shares):
     with open(SHARES_FILE, "w") as f:
         json.dump(shares, f, indent=2)
+    _shares_cache["shares"] = shares
+    _shares_cache["mtime"] = os.stat(SHARES_FILE).st_mtime_ns
+
+# Bump when the card layout changes so cached images are re-rendered
+TEMPLATE_VERSION = 1
 
-def generate_og_image(npc_name: str, trait: str, backstory: str) -> str:
+OG_WIDTH, OG_HEIGHT = 1200, 630
+OG_BG_COLOR = (11, 16, 32)  # Dark blue from the game theme
+OG_TEXT_COLOR = (223, 231, 255)  # Light blue
+OG_ACCENT_COLOR = (37, 99, 235)  # Blue accent
+
+# Loaded once per process (each render worker warms its own copy)
+_fonts = None
+_base_canvas = None
+
+def _get_fonts():
+    global _fonts
+    if _fonts is None:
+        # Try to use default font, fallback to basic
+        try:
+            _fonts = (
+                ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 48),
+                ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 32),
+                ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 24),
+            )
+        except OSError:
+            default = ImageFont.load_default()
+            _fonts = (default, default, default)
+    return _fonts
+
+def _get_base_canvas() -> Image.Image:
+    """
+    Background, border and footer: everything that doesn't depend on the NPC
+    """
+    global _base_canvas
+    if _base_canvas is None:
+        _, _, text_font = _get_fonts()
+        canvas = Image.new('RGB', (OG_WIDTH, OG_HEIGHT), OG_BG_COLOR)
+        draw = ImageDraw.Draw(canvas)
+        draw.rectangle([20, 20, OG_WIDTH-20, OG_HEIGHT-20], outline=OG_ACCENT_COLOR, width=3)
+        draw.text((60, OG_HEIGHT - 80), "Realm of Echoes • Living World", fill=(159, 176, 255), font=text_font)
+        _base_canvas = canvas
+    return _base_canvas
+
+def warm_og_renderer():
+    """
+    Preload fonts and the base canvas (render pool initializer)
+    """
+    _get_base_canvas()
+
+def og_image_key(npc_name: str, trait: str, backstory: str) -> str:
+    """
+    Content hash of everything that affects the rendered card
+    """
+    payload = "\0".join([str(TEMPLATE_VERSION), npc_name, trait, backstory])
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+def og_image_path(npc_name: str, trait: str, backstory: str) -> str:
+    return os.path.join(IMAGES_DIR, f"{og_image_key(npc_name, trait, backstory)}.png")
+
+def generate_og_image(npc_name: str, trait: str, backstory: str, image_path: Optional[str] = None) -> str:
     """
     Generate an Open Graph preview image for sharing
     Returns: path to the generated image
     """
-    # Create image
-    width, height = 1200, 630
-    bg_color = (11, 16, 32)  # Dark blue from the game theme
-    text_color = (223, 231, 255)  # Light blue
-    accent_color = (37, 99, 235)  # Blue accent
+    title_font, trait_font, text_font = _get_fonts()
+    width = OG_WIDTH
+    text_color = OG_TEXT_COLOR
+    accent_color = OG_ACCENT_COLOR
     
-    image = Image.new('RGB', (width, height), bg_color)
+    image = _get_base_canvas().copy()
     draw = ImageDraw.Draw(image)
     
-    # Try to use default font, fallback to basic
-    try:
-        title_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 48)
-        trait_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 32)
-        text_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 24)
-    except:
-        title_font = ImageFont.load_default()
-        trait_font = ImageFont.load_default()
-        text_font = ImageFont.load_default()
-    
-    # Draw border
-    draw.rectangle([20, 20, width-20, height-20], outline=accent_color, width=3)
-    
     # Draw title
     title_y = 80
     draw.text((60, title_y), npc_name, fill=text_color, font=title_font)
@@ -93,17 +184,282 @@ def generate_og_image(npc_name: str, trait: str, backstory: str) -> str:
     for i, line in enumerate(lines):
         draw.text((60, backstory_y + i * 35), line, fill=text_color, font=text_font)
     
-    # Draw footer
-    footer_y = height - 80
-    draw.text((60, footer_y), "Realm of Echoes • Living World", fill=(159, 176, 255), font=text_font)
-    
-    # Save image
-    image_id = str(uuid.uuid4())
-    image_path = os.path.join(IMAGES_DIR, f"{image_id}.png")
-    image.save(image_path, "PNG")
+    # Save image; write-then-rename so a file on disk is always complete
+    if image_path is None:
+        image_path = og_image_path(npc_name, trait, backstory)
+    tmp_path = f"{image_path}.{os.getpid()}.tmp"
+    image.save(tmp_path, "PNG")
+    os.replace(tmp_path, image_path)
     
     return image_path
 
+def _render_og_image(image_path: str, npc_name: str, trait: str, backstory: str) -> float:
+    """
+    Pool task: render one image, returning the render time in seconds
+    """
+    start = time.perf_counter()
+    generate_og_image(npc_name, trait, backstory, image_path)
+    return time.perf_counter() - start
+
+# ===== Background rendering =====
+
+_render_pool: Optional[ProcessPoolExecutor] = None
+_pending: Dict[str, Future] = {}  # image_path -> in-flight render
+_render_lock = threading.Lock()
+_render_stats = {
+    "submitted": 0,
+    "rendered": 0,
+    "failed": 0,
+    "render_ms": deque(maxlen=500),   # time spent drawing in the worker
+    "latency_ms": deque(maxlen=500),  # submit -> file ready, including queueing
+}
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(max_workers=OG_RENDER_WORKERS, initializer=warm_og_renderer)
+    return _render_pool
+
+def shutdown_render_pool():
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+def queue_og_image(image_path: str, npc_name: str, trait: str, backstory: str) -> Future:
+    """
+    Render an OG image in the background. Repeat calls for an image that is
+    already being rendered share the same future.
+    """
+    global _render_pool
+    with _render_lock:
+        future = _pending.get(image_path)
+        if future is not None:
+            return future
+        args = (_render_og_image, image_path, npc_name, trait, backstory)
+        try:
+            future = _get_render_pool().submit(*args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool
+            _render_pool = None
+            future = _get_render_pool().submit(*args)
+        _pending[image_path] = future
+        _render_stats["submitted"] += 1
+
+    submitted_at = time.perf_counter()
+
+    def on_done(done: Future):
+        with _render_lock:
+            _pending.pop(image_path, None)
+            if done.cancelled() or done.exception() is not None:
+                _render_stats["failed"] += 1
+                return
+            _render_stats["rendered"] += 1
+            _render_stats["render_ms"].append(done.result() * 1000)
+            _render_stats["latency_ms"].append((time.perf_counter() - submitted_at) * 1000)
+
+    future.add_done_callback(on_done)
+    return future
+
+def get_pending_render(image_path: str) -> Optional[Future]:
+    return _pending.get(image_path)
+
+def get_placeholder_image() -> str:
+    """
+    Generic card served while a share's own image is still rendering
+    """
+    if not os.path.exists(PLACEHOLDER_IMAGE):
+        generate_og_image("Realm of Echoes", "a new echo", "This NPC's portrait is still being painted. Check back in a moment.", PLACEHOLDER_IMAGE)
+    return PLACEHOLDER_IMAGE
+
+# ===== Image delivery =====
+
+def image_etag(image_path: str) -> str:
+    """
+    Strong ETag: image files are named by content hash (or a one-off id)
+    and never rewritten, so the file name identifies the bytes
+    """
+    return f'"{os.path.basename(image_path)}"'
+
+def open_share_image(image_path: str) -> Optional[io.BufferedReader]:
+    """
+    Open an image for serving, or None if it's gone. The open file stays
+    readable even if the sweeper removes it mid-response.
+    """
+    try:
+        return open(image_path, "rb")
+    except FileNotFoundError:
+        return None
+
+def webp_variant_path(image_path: str) -> str:
+    return os.path.splitext(image_path)[0] + ".webp"
+
+def get_webp_variant(image_path: str) -> Optional[str]:
+    """
+    WebP copy of a PNG card (about a third of the bytes), created on first
+    request. Returns None if Pillow lacks WebP support.
+    """
+    webp_path = webp_variant_path(image_path)
+    if os.path.exists(webp_path):
+        return webp_path
+    try:
+        with Image.open(image_path) as image:
+            tmp_path = f"{webp_path}.{os.getpid()}.tmp"
+            image.save(tmp_path, "WEBP", quality=85, method=4)
+    except (OSError, KeyError):
+        return None
+    os.replace(tmp_path, webp_path)
+    return webp_path
+
+# ===== Image store =====
+# Images (a PNG plus an optional WebP variant sharing its stem) are bounded
+# by OG_IMAGE_BUDGET_BYTES. Access stats are kept in memory per worker and
+# seeded from file mtimes, so a restart degrades to "oldest first".
+
+_image_access: Dict[str, list] = {}  # stem -> [last_access, hits]
+_last_sweep: Dict = {}
+
+def _image_stem(path: str) -> str:
+    return os.path.basename(path).split(".", 1)[0]
+
+def record_image_access(image_path: str):
+    entry = _image_access.setdefault(_image_stem(image_path), [0.0, 0])
+    entry[0] = time.time()
+    entry[1] += 1
+
+def _remove_image_file(path: str) -> bool:
+    """
+    Delete a file the sweeper chose; False if another worker's sweep got there first
+    """
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def _eviction_order(stems, files_by_stem):
+    def last_access(stem):
+        entry = _image_access.get(stem)
+        return entry[0] if entry else max(f.stat().st_mtime for f in files_by_stem[stem])
+
+    def hits(stem):
+        entry = _image_access.get(stem)
+        return entry[1] if entry else 0
+
+    if OG_IMAGE_EVICTION == "lfu":
+        return sorted(stems, key=lambda stem: (hits(stem), last_access(stem)))
+    return sorted(stems, key=last_access)
+
+def sweep_share_images(budget: int = OG_IMAGE_BUDGET_BYTES) -> Dict:
+    """
+    Reconcile the image directory with shares.json: delete orphaned and
+    stale temp files, then evict cold images until usage is under 90% of
+    the budget. Blocking; run it off the event loop.
+    """
+    now = time.time()
+    referenced = {_image_stem(share["image_path"]) for share in load_shares().values()}
+    in_flight = {_image_stem(path) for path in list(_pending)}
+    placeholder = _image_stem(PLACEHOLDER_IMAGE)
+
+    files_by_stem: Dict[str, list] = {}
+    removed = {"orphans": 0, "tmp": 0, "evicted": 0}
+    for entry in os.scandir(IMAGES_DIR):
+        if not entry.is_file():
+            continue
+        try:
+            # Caches the stat for the size and eviction checks below
+            age = now - entry.stat().st_mtime
+        except FileNotFoundError:
+            continue  # removed by a concurrent sweep
+        if entry.name.endswith(".tmp"):
+            if age > OG_IMAGE_ORPHAN_GRACE and _remove_image_file(entry.path):
+                removed["tmp"] += 1
+            continue
+        stem = _image_stem(entry.name)
+        if stem == placeholder or stem in in_flight:
+            continue
+        if stem not in referenced and age > OG_IMAGE_ORPHAN_GRACE:
+            if _remove_image_file(entry.path):
+                removed["orphans"] += 1
+            continue
+        files_by_stem.setdefault(stem, []).append(entry)
+
+    usage = sum(f.stat().st_size for files in files_by_stem.values() for f in files)
+    if usage > budget:
+        target = int(budget * 0.9)
+        for stem in _eviction_order(list(files_by_stem), files_by_stem):
+            if usage <= target:
+                break
+            for f in files_by_stem.pop(stem):
+                usage -= f.stat().st_size
+                _remove_image_file(f.path)
+            _image_access.pop(stem, None)
+            removed["evicted"] += 1
+
+    # Forget stats for images that no longer exist
+    for stem in list(_image_access):
+        if stem not in files_by_stem:
+            del _image_access[stem]
+
+    _last_sweep.clear()
+    _last_sweep.update({"at": now, "images": len(files_by_stem), "bytes": usage, **removed})
+    return dict(_last_sweep)
+
+async def run_image_sweeper(interval: float = OG_IMAGE_SWEEP_INTERVAL):
+    """
+    Background loop running sweep_share_images in a worker thread
+    """
+    while True:
+        try:
+            await asyncio.to_thread(sweep_share_images)
+        except Exception as e:
+            print(f"Share image sweep failed: {e}")
+        await asyncio.sleep(interval)
+
+def get_image_store_stats() -> Dict:
+    return {
+        "budget_bytes": OG_IMAGE_BUDGET_BYTES,
+        "eviction": OG_IMAGE_EVICTION,
+        "tracked_images": len(_image_access),
+        "last_sweep": dict(_last_sweep),
+    }
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 1)
+
+def get_render_stats() -> Dict:
+    """
+    Queue depth and render timings for the OG image pool
+    """
+    with _render_lock:
+        render_ms = list(_render_stats["render_ms"])
+        latency_ms = list(_render_stats["latency_ms"])
+        return {
+            "workers": OG_RENDER_WORKERS,
+            "queue_depth": len(_pending),
+            "submitted": _render_stats["submitted"],
+            "rendered": _render_stats["rendered"],
+            "failed": _render_stats["failed"],
+            "render_ms": {"p50": _percentile(render_ms, 0.5), "p95": _percentile(render_ms, 0.95)},
+            "latency_ms": {"p50": _percentile(latency_ms, 0.5), "p95": _percentile(latency_ms, 0.95)},
+        }
+
+def ensure_og_image(share: Dict, npc_data: Optional[Dict]) -> Optional[Future]:
+    """
+    Future for a share's image if it is (now) rendering, None if it's on disk
+    or can't be rendered. Re-queues images lost to a restart mid-render.
+    """
+    image_path = share["image_path"]
+    if os.path.exists(image_path):
+        return None
+    future = get_pending_render(image_path)
+    if future is None and npc_data:
+        future = queue_og_image(image_path, npc_data["name"], npc_data["trait"], npc_data["backstory"])
+    return future
+
 def create_share(user_id: str, npc_id: str, npc_data: Dict) -> Dict:
     """
     Create a shareable link for an NPC
@@ -112,12 +468,16 @@ def create_share(user_id: str, npc_id: str, npc_data: Dict) -> Dict:
     
     share_id = str(uuid.uuid4())
     
-    # Generate OG image
-    image_path = generate_og_image(
-        npc_data["name"],
-        npc_data["trait"],
-        npc_data["backstory"]
-    )
+    # Shares of identical NPC content reuse one image; otherwise queue a
+    # render and hand the share back before it finishes
+    image_path = og_image_path(npc_data["name"], npc_data["trait"], npc_data["backstory"])
+    if not os.path.exists(image_path):
+        queue_og_image(
+            image_path,
+            npc_data["name"],
+            npc_data["trait"],
+            npc_data["backstory"]
+        )
     
     share = {
         "id": share_id,
@@ -133,18 +493,226 @@ def create_share(user_id: str, npc_id: str, npc_data: Dict) -> Dict:
     shares[share_id] = share
     save_shares(shares)
     
-    return share
+    return {**share, "image_status": get_image_status(share)}
+
+def get_image_status(share: Dict) -> str:
+    """
+    "ready" once the image is on disk, "pending" while it renders
+    """
+    if os.path.exists(share["image_path"]):
+        return "ready"
+    return "pending" if get_pending_render(share["image_path"]) else "missing"
+
+def find_share(share_id: str) -> Optional[Dict]:
+    """
+    Look up a share without counting a view (read-only)
+    """
+    return load_shares().get(share_id)
 
 def get_share(share_id: str) -> Optional[Dict]:
+    """
+    Look up a share and count a view. Views are buffered and flushed by
+    run_view_flusher; the returned view_count includes unflushed views.
+    """
+    share = load_shares().get(share_id)
+    
+    if not share:
+        return None
+    
+    with _views_lock:
+        pending = _pending_views[share_id] = _pending_views.get(share_id, 0) + 1
+    
+    return {**share, "view_count": share.get("view_count", 0) + pending}
+
+# ===== View counting =====
+
+_pending_views: Dict[str, int] = {}
+_views_lock = threading.Lock()
+
+def flush_share_views() -> int:
+    """
+    Write buffered views to shares.json, returning how many were written
+    """
+    with _views_lock:
+        pending = dict(_pending_views)
+        _pending_views.clear()
+    if not pending:
+        return 0
+    
     shares = load_shares()
-    share = shares.get(share_id)
+    for share_id, views in pending.items():
+        if share_id in shares:
+            shares[share_id]["view_count"] = shares[share_id].get("view_count", 0) + views
+    save_shares(shares)
+    return sum(pending.values())
+
+# Views still buffered when the process exits are written, not dropped
+atexit.register(flush_share_views)
+
+async def run_view_flusher(interval: float = SHARE_VIEW_FLUSH_INTERVAL):
+    """
+    Background loop flushing buffered share views
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            flush_share_views()
+        except Exception as e:
+            print(f"Share view flush failed: {e}")
+
+# ===== Landing pages =====
+
+# Stands in for the view count in cached pages
+VIEWS_MARKER = "\x00views\x00"
+
+# share_id -> (version, html before views, html after views)
+_share_pages = LRUCache(
+    SHARE_PAGE_CACHE_ITEMS,
+    SHARE_PAGE_CACHE_BYTES,
+    sizeof=lambda page: len(page[1]) + len(page[2])
+)
+
+# Bumped when content is hidden, restored or deleted; part of every page
+# version, so no page rendered before the change is served after it
+_pages_epoch = 0
+
+def invalidate_share_pages(*_):
+    """
+    Drop every cached landing page (call when NPCs or shares are hidden,
+    restored or deleted)
+    """
+    global _pages_epoch
+    _pages_epoch += 1
+    _share_pages.clear()
+
+def render_share_page(share: Dict, npc: Dict) -> str:
+    """
+    Landing page HTML with OG meta tags; the view count is left as VIEWS_MARKER
+    """
+    # HTML escape user content to prevent XSS
+    safe_name = html.escape(npc['name'])
+    safe_trait = html.escape(npc['trait'])
+    safe_backstory = html.escape(npc['backstory'])
+    safe_npc_id = html.escape(npc['id'])
+    safe_share_id = html.escape(share['id'])
     
-    if share:
-        # Increment view count
-        shares[share_id]["view_count"] = share.get("view_count", 0) + 1
-        save_shares(shares)
+    # Simple share page with OG meta tags
+    return f"""
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>{safe_name} - Realm of Echoes</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    
+    <!-- Open Graph / Facebook -->
+    <meta property="og:type" content="website">
+    <meta property="og:title" content="{safe_name} - {safe_trait}">
+    <meta property="og:description" content="{safe_backstory[:200]}">
+    <meta property="og:image" content="/api/share/{safe_share_id}/image">
     
-    return share
+    <!-- Twitter -->
+    <meta name="twitter:card" content="summary_large_image">
+    <meta name="twitter:title" content="{safe_name} - {safe_trait}">
+    <meta name="twitter:description" content="{safe_backstory[:200]}">
+    <meta name="twitter:image" content="/api/share/{safe_share_id}/image">
+    
+    <style>
+        body {{
+            font-family: system-ui, -apple-system, sans-serif;
+            background: #0b1020;
+            color: #dfe7ff;
+            padding: 40px 20px;
+            margin: 0;
+        }}
+        .container {{
+            max-width: 800px;
+            margin: 0 auto;
+            background: #0f1724;
+            border: 1px solid #1f2a44;
+            border-radius: 12px;
+            padding: 40px;
+        }}
+        h1 {{
+            color: #2563eb;
+            margin-top: 0;
+        }}
+        .trait {{
+            background: #14203a;
+            padding: 8px 16px;
+            border-radius: 999px;
+            display: inline-block;
+            margin: 12px 0;
+            font-weight: 600;
+        }}
+        .backstory {{
+            line-height: 1.6;
+            margin: 24px 0;
+        }}
+        .actions {{
+            margin-top: 32px;
+        }}
+        button {{
+            background: #2563eb;
+            color: white;
+            border: none;
+            padding: 12px 24px;
+            border-radius: 8px;
+            cursor: pointer;
+            font-size: 16px;
+            margin-right: 12px;
+        }}
+        button:hover {{
+            background: #1d4ed8;
+        }}
+        .secondary {{
+            background: #1f2a44;
+        }}
+        .secondary:hover {{
+            background: #2a3a54;
+        }}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>{safe_name}</h1>
+        <div class="trait">• {safe_trait.upper()} •</div>
+        <div class="backstory">{safe_backstory}</div>
+        
+        <div class="actions">
+            <button onclick="window.location.href='/api/npcs/{safe_npc_id}'">View Full NPC</button>
+            <button class="secondary" onclick="window.location.href='/'">Create Your Own</button>
+        </div>
+        
+        <div style="margin-top: 32px; padding-top: 32px; border-top: 1px solid #1f2a44; color: #9fb0ff; font-size: 14px;">
+            <p>Shared by a player in Realm of Echoes</p>
+            <p>Views: {VIEWS_MARKER} | Remixes: {share.get('remix_from_share', 0)}</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+def get_share_page(share: Dict, load_npc: Callable[[str], Optional[Dict]]) -> Optional[bytes]:
+    """
+    Landing page for a share, rendered once per content version and cached.
+    NPC content never changes after creation, so the version is the remix
+    count plus the moderation epoch; the view count is spliced in per request.
+    Returns None if the NPC is gone.
+    """
+    version = (share.get("remix_from_share", 0), _pages_epoch)
+    page = _share_pages.get(share["id"])
+    if page is None or page[0] != version:
+        npc = load_npc(share["npc_id"])
+        if not npc:
+            return None
+        head, tail = render_share_page(share, npc).split(VIEWS_MARKER)
+        page = (version, head.encode(), tail.encode())
+        _share_pages.set(share["id"], page)
+    return page[1] + str(share.get("view_count", 0)).encode() + page[2]
+
+def get_share_page_stats() -> Dict:
+    return _share_pages.stats()
 
 def increment_remix_from_share(share_id: str):
     """
@@ -155,15 +723,23 @@ def increment_remix_from_share(share_id: str):
         shares[share_id]["remix_from_share"] = shares[share_id].get("remix_from_share", 0) + 1
         save_shares(shares)
 
+def _listable_filter() -> Callable[[Dict], bool]:
+    """
+    Predicate excluding shares that are hidden or point at a hidden NPC
+    """
+    hidden_shares, hidden_npcs = hidden_ids("share"), hidden_ids("npc")
+    return lambda share: share["id"] not in hidden_shares and share["npc_id"] not in hidden_npcs
+
 def get_user_shares(user_id: str, limit: int = 20) -> list:
     """
     Get all shares created by a user
     """
     shares = load_shares()
+    listable = _listable_filter()
     
     user_shares = [
         share for share in shares.values()
-        if share["user_id"] == user_id
+        if share["user_id"] == user_id and listable(share)
     ]
     
     # Sort by most recent
@@ -181,7 +757,7 @@ def get_popular_shares(limit: int = 10) -> list:
     """
     shares = load_shares()
     
-    share_list = list(shares.values())
+    share_list = list(filter(_listable_filter(), shares.values()))
     
     # Sort by view_count + remix_from_share
     sorted_shares = sorted(
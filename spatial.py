@@ -0,0 +1,89 @@
+# spatial.py
+# Spatial hash of player positions for nearby-player queries
+
+import math
+import threading
+from typing import Dict, List, Set, Tuple
+
+class SpatialHash:
+    """
+    Players bucketed by grid cell (one cell per chunk). Positions are world
+    tile coordinates; queries only visit the cells overlapping the query
+    area, so they cost the local population, not the total.
+    """
+    def __init__(self, cell_size: int):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], Set[str]] = {}
+        self.positions: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def _cell(self, x: int, y: int) -> Tuple[int, int]:
+        return x // self.cell_size, y // self.cell_size
+
+    def update(self, member: str, x: int, y: int):
+        """
+        Insert or move a member
+        """
+        with self._lock:
+            old = self.positions.get(member)
+            self.positions[member] = (x, y)
+            cell = self._cell(x, y)
+            if old is not None:
+                old_cell = self._cell(*old)
+                if old_cell == cell:
+                    return
+                self._discard(old_cell, member)
+            self.cells.setdefault(cell, set()).add(member)
+
+    def remove(self, member: str):
+        with self._lock:
+            old = self.positions.pop(member, None)
+            if old is not None:
+                self._discard(self._cell(*old), member)
+
+    def _discard(self, cell: Tuple[int, int], member: str):
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(member)
+            if not members:
+                del self.cells[cell]
+
+    def query_aabb(self, min_x: int, min_y: int, max_x: int, max_y: int) -> List[Tuple[str, int, int]]:
+        """
+        (member, x, y) for members inside the box (inclusive)
+        """
+        c0x, c0y = self._cell(min_x, min_y)
+        c1x, c1y = self._cell(max_x, max_y)
+        found = []
+        with self._lock:
+            for cy in range(c0y, c1y + 1):
+                for cx in range(c0x, c1x + 1):
+                    for member in self.cells.get((cx, cy), ()):
+                        x, y = self.positions[member]
+                        if min_x <= x <= max_x and min_y <= y <= max_y:
+                            found.append((member, x, y))
+        return found
+
+    def query_radius(self, x: int, y: int, radius: float) -> List[Tuple[str, int, int, float]]:
+        """
+        (member, x, y, distance) within `radius` of (x, y), nearest first
+        """
+        r = math.ceil(radius)
+        found = []
+        for member, mx, my in self.query_aabb(x - r, y - r, x + r, y + r):
+            distance = math.hypot(mx - x, my - y)
+            if distance <= radius:
+                found.append((member, mx, my, distance))
+        found.sort(key=lambda item: item[3])
+        return found
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "members": len(self.positions),
+                "cells": len(self.cells),
+                "max_cell_population": max((len(m) for m in self.cells.values()), default=0),
+            }
@@ -0,0 +1,105 @@
+# terrain.py
+# Seeded, vectorised biome generation from layered value noise
+
+from typing import List, Sequence, Tuple
+import numpy as np
+
+# Each field (elevation, moisture) is OCTAVES layers of value noise, each at
+# half the cell size and half the weight of the one before
+OCTAVES = 3
+ELEVATION_SCALE = 48.0  # tiles per noise cell at the coarsest octave
+MOISTURE_SCALE = 64.0
+
+# A chunk edge spans at most two cells of the finest octave (its cells are
+# wider than a chunk minus one tile), so 3x3 lattice points cover it
+LATTICE_POINTS = 3
+
+# Biome ids (see chunks.BIOMES) by elevation band (rows) and moisture band
+# (columns)
+ELEVATION_BANDS = [0.36, 0.55, 0.66, 0.72]
+MOISTURE_BANDS = [0.38, 0.5, 0.62]
+WATER, FOREST, MOUNTAIN, DESERT, LAVA, ICE, PLAINS, SWAMP = 1, 0, 2, 3, 4, 5, 6, 7
+BIOME_TABLE = np.array([
+    [WATER, WATER, WATER, WATER],          # sea
+    [DESERT, PLAINS, FOREST, SWAMP],       # lowland
+    [DESERT, PLAINS, FOREST, FOREST],      # upland
+    [MOUNTAIN, MOUNTAIN, MOUNTAIN, MOUNTAIN],
+    [LAVA, MOUNTAIN, ICE, ICE],            # peaks
+], dtype=np.uint8)
+
+_SCALES = np.array([ELEVATION_SCALE / 2 ** o for o in range(OCTAVES)] +
+                   [MOISTURE_SCALE / 2 ** o for o in range(OCTAVES)])
+_WEIGHTS = [0.5 ** o for o in range(OCTAVES)]
+
+# 64-bit mixing constants (splitmix64 / murmur3 finaliser)
+_PRIME_X = np.uint64(0x9E3779B97F4A7C15)
+_PRIME_Y = np.uint64(0xC2B2AE3D27D4EB4F)
+_MIX_1 = np.uint64(0xFF51AFD7ED558CCD)
+_MIX_2 = np.uint64(0xC4CEB9FE1A85EC53)
+_SHIFT = np.uint64(33)
+
+def _lattice(ix: np.ndarray, iy: np.ndarray, salt: np.ndarray) -> np.ndarray:
+    """
+    Hash integer lattice points to values in [0, 1)
+    """
+    h = ix.astype(np.uint64) * _PRIME_X ^ iy.astype(np.uint64) * _PRIME_Y ^ salt
+    h ^= h >> _SHIFT
+    h *= _MIX_1
+    h ^= h >> _SHIFT
+    h *= _MIX_2
+    h ^= h >> _SHIFT
+    return (h >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+def _layer_salts(seed: int) -> np.ndarray:
+    return np.array([(seed * 2 + field) * 31 + octave for field in (1, 2) for octave in range(OCTAVES)],
+                    dtype=np.uint64)[:, None]
+
+def _axis(origins: np.ndarray, chunk_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per layer and chunk: the first lattice cell along an axis, and each
+    tile's smoothed position relative to it (layers x chunks x tiles)
+    """
+    f = (origins[None, :, None] + np.arange(chunk_size)) / _SCALES[:, None, None]
+    cell = np.floor(f)
+    t = f - cell
+    first = cell[:, :, :1]
+    return first[:, :, 0].astype(np.int64), (cell - first) + t * t * (3 - 2 * t)
+
+def noise_fields(coords: Sequence[Tuple[int, int]], seed: int, chunk_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Elevation and moisture in [0, 1) for each chunk: two arrays of shape
+    (chunks, chunk_size, chunk_size), indexed [chunk, y, x].
+
+    Only elementwise operations, in a fixed order, so a chunk comes out
+    bit-identical whether it's generated alone or in a batch.
+    """
+    c = np.asarray(coords, dtype=np.int64).reshape(-1, 2)
+    x0, px = _axis((c[:, 0] * chunk_size).astype(np.float64), chunk_size)
+    y0, py = _axis((c[:, 1] * chunk_size).astype(np.float64), chunk_size)
+    salts = _layer_salts(seed)
+
+    # Bilinear interpolation as a sum over lattice points weighted by
+    # "hat" functions of the smoothed positions
+    layers = 0.0
+    for j in range(LATTICE_POINTS):
+        row = 0.0
+        for i in range(LATTICE_POINTS):
+            value = _lattice(x0 + i, y0 + j, salts)
+            row = row + value[:, :, None] * np.maximum(0.0, 1.0 - np.abs(px - i))
+        layers = layers + np.maximum(0.0, 1.0 - np.abs(py - j))[:, :, :, None] * row[:, :, None, :]
+
+    fields = []
+    for field in range(2):
+        total = layers[field * OCTAVES] * _WEIGHTS[0]
+        for octave in range(1, OCTAVES):
+            total = total + layers[field * OCTAVES + octave] * _WEIGHTS[octave]
+        fields.append(total / sum(_WEIGHTS))
+    return fields[0], fields[1]
+
+def generate_biomes(coords: Sequence[Tuple[int, int]], seed: int, chunk_size: int) -> List[bytes]:
+    """
+    Row-major biome ids for each chunk in `coords`
+    """
+    elevation, moisture = noise_fields(coords, seed, chunk_size)
+    biomes = BIOME_TABLE[np.digitize(elevation, ELEVATION_BANDS), np.digitize(moisture, MOISTURE_BANDS)]
+    return [row.tobytes() for row in biomes]
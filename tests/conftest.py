@@ -0,0 +1,14 @@
+# conftest.py
+# Run the suite from a scratch directory: modules keep their data under
+# relative paths (.data/, world_regions/) and create them on import
+
+import os
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_workdir = tempfile.mkdtemp(prefix="npc-tests-")
+os.symlink(os.path.join(REPO_DIR, "static"), os.path.join(_workdir, "static"))
+os.chdir(_workdir)
+sys.path.insert(0, REPO_DIR)
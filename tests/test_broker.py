@@ -0,0 +1,70 @@
+# test_broker.py
+# Broker behaviour against the in-memory stand-in
+
+import time
+import pytest
+from broker import Broker, InProcessBroker, RedisBroker
+import moderation
+
+def test_sorted_set_pop_due_returns_each_member_once():
+    broker = InProcessBroker()
+    broker.zadd("z", "a", 1.0)
+    broker.zadd("z", "b", 2.0)
+    broker.zadd("z", "c", 5.0)
+    assert broker.zpop_due("z", 2.0) == [("a", 1.0), ("b", 2.0)]
+    assert broker.zpop_due("z", 2.0) == []
+    assert broker.zmembers("z") == {"c"}
+
+def test_rescored_member_is_not_popped_at_old_score():
+    broker = InProcessBroker()
+    broker.zadd("z", "a", 1.0)
+    broker.zadd("z", "a", 10.0)
+    assert broker.zpop_due("z", 5.0) == []
+    assert broker.zscore("z", "a") == 10.0
+
+def test_counter_expires():
+    broker = InProcessBroker()
+    broker.incr("c", 3, ttl=0.01)
+    assert broker.get_counter("c") == 3
+    time.sleep(0.02)
+    assert broker.get_counter("c") == 0
+
+def test_incr_within_limit_weights_previous_window():
+    broker = InProcessBroker()
+    broker.incr("prev", 4)
+    # 4 * 0.5 = 2 carried over, so one more hit fits under a limit of 3
+    assert broker.incr_within_limit("cur", "prev", 0.5, 3, ttl=60)
+    assert not broker.incr_within_limit("cur", "prev", 0.5, 3, ttl=60)
+    assert broker.get_counter("cur") == 1
+
+def test_denied_hits_still_expire_idle_keys():
+    broker = InProcessBroker()
+    for i in range(10):
+        broker.incr(f"idle-{i}", ttl=0.01)
+    broker.incr("cur", 3)
+    time.sleep(0.02)
+    assert not broker.incr_within_limit("cur", "prev", 0.5, 3, ttl=60)
+    assert broker.key_count() == 1
+
+def test_publish_matches_patterns_and_round_trips_json():
+    broker = InProcessBroker()
+    received = []
+    broker.subscribe("room:*", lambda channel, message: received.append((channel, message)))
+    broker.publish("room:1", {"type": "chat", "tiles": (1, 2)})
+    broker.publish("world:tiles", {"type": "ignored"})
+    assert received == [("room:1", {"type": "chat", "tiles": [1, 2]})]
+
+def test_check_rate_limit_stops_at_limit(monkeypatch):
+    monkeypatch.setattr(moderation, "broker", InProcessBroker())
+    limit = moderation.RATE_LIMITS["room_create"]
+    results = [moderation.check_rate_limit("user", "room_create")[0] for _ in range(limit + 3)]
+    assert results == [True] * limit + [False] * 3
+
+def test_incomplete_brokers_fail_at_construction():
+    class PartialBroker(Broker):
+        def publish(self, channel, message):
+            pass
+    with pytest.raises(TypeError):
+        PartialBroker()
+    # Both real brokers implement the whole interface
+    assert not InProcessBroker.__abstractmethods__ and not RedisBroker.__abstractmethods__
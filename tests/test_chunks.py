@@ -0,0 +1,131 @@
+# test_chunks.py
+# Tile-world chunks: tile access, generation and wire encoding
+
+import threading
+import pytest
+from chunks import (CHUNK_SIZE, BIOMES, RECORD_ALIGN, REGION_DATA_OFFSET, REGION_ENTRY, REGION_TABLE_OFFSET, ChunkStore,
+                    chunk_diff, chunks_in_radius, encode_chunks, generate_chunk, generate_chunks, region_of)
+
+def test_set_tile_round_trips():
+    chunk = generate_chunk(0, 0, seed=7)
+    chunk.set_tile(CHUNK_SIZE - 1, CHUNK_SIZE - 1, biome="lava", effect="glow")
+    assert chunk.get_tile(CHUNK_SIZE - 1, CHUNK_SIZE - 1) == ("lava", "glow")
+
+@pytest.mark.parametrize("x, y", [(-1, 0), (-1, 1), (CHUNK_SIZE, 0), (0, CHUNK_SIZE), (0, -1)])
+def test_out_of_range_tiles_are_rejected(x, y):
+    chunk = generate_chunk(0, 0, seed=7)
+    before = bytes(chunk.biomes)
+    with pytest.raises(ValueError):
+        chunk.set_tile(x, y, biome="lava", effect="glow")
+    with pytest.raises(ValueError):
+        chunk.get_tile(x, y)
+    assert bytes(chunk.biomes) == before and chunk.effects is None
+    # The chunk still encodes and has nothing to persist
+    encode_chunks([chunk])
+    assert chunk_diff(chunk, generate_chunk(0, 0, seed=7)) == chunk_diff(generate_chunk(0, 0, seed=7), generate_chunk(0, 0, seed=7))
+
+def test_store_listeners_run_outside_the_store_lock(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    held = []
+    store.listeners.append(lambda chunk: held.append(store._lock._is_owned()))
+    chunk = store.get(0, 0)
+    store.get_many([(0, 1), (5, 5)])
+    store.mark_modified(chunk)
+    assert held == [False, False, False, False]
+
+@pytest.mark.parametrize("terrain", [1, 2])
+def test_batch_generation_matches_single_chunks(terrain):
+    coords = chunks_in_radius(-3, 5, 2) + [(1000003, -77)]
+    batch = generate_chunks(coords, seed=11, terrain=terrain)
+    for (cx, cy), chunk in zip(coords, batch):
+        single = generate_chunk(cx, cy, seed=11, terrain=terrain)
+        assert (chunk.cx, chunk.cy) == (cx, cy)
+        assert chunk.biomes == single.biomes
+
+def test_stored_chunks_read_back_in_a_batch(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    changed = {}
+    for chunk in store.get_many([(0, 0), (1, 0), (40, -3)]):
+        chunk.set_tile(2, 3, biome="lava", effect="glow")
+        store.mark_modified(chunk)
+        changed[(chunk.cx, chunk.cy)] = bytes(chunk.biomes)
+    store.flush()
+    fresh = ChunkStore(str(tmp_path))
+    chunks = fresh.get_many([(0, 0), (5, 5), (1, 0), (40, -3)])
+    assert fresh.reads == 3
+    for chunk in chunks:
+        if (chunk.cx, chunk.cy) in changed:
+            assert bytes(chunk.biomes) == changed[(chunk.cx, chunk.cy)]
+            assert chunk.get_tile(2, 3) == ("lava", "glow") and chunk.version > 0
+        else:
+            assert chunk.biomes == generate_chunk(5, 5, seed=fresh.seed).biomes
+
+def test_region_offset_table_reuses_and_grows_records(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    chunk = store.get(33, 2)
+    chunk.set_tile(0, 0, biome="lava")
+    store.mark_modified(chunk)
+    store.flush()
+    region, slot = region_of(33, 2)
+    first = store._tables[region][slot]
+    assert first[0] == REGION_DATA_OFFSET and first[2] % RECORD_ALIGN == 0
+    # A record that still fits is rewritten in place; a bigger one moves to the end
+    chunk.set_tile(1, 0, biome="lava")
+    store.mark_modified(chunk)
+    store.flush()
+    assert store._tables[region][slot][0] == first[0]
+    for i in range(CHUNK_SIZE * CHUNK_SIZE):
+        chunk.set_tile(i % CHUNK_SIZE, i // CHUNK_SIZE, biome=BIOMES[i % len(BIOMES)], effect="glow")
+    store.mark_modified(chunk)
+    store.flush()
+    grown = store._tables[region][slot]
+    assert grown[0] >= first[0] + first[2] and grown[1] > first[2]
+    with open(store._region_path(region), "rb") as f:
+        raw = f.read()
+    assert REGION_ENTRY.unpack_from(raw, REGION_TABLE_OFFSET + slot * REGION_ENTRY.size) == grown
+    assert ChunkStore(str(tmp_path)).get(33, 2).biomes == chunk.biomes
+
+def test_flush_writes_outside_the_store_lock(tmp_path):
+    store = ChunkStore(str(tmp_path), max_resident=1)
+    chunk = store.get(0, 0)
+    chunk.set_tile(0, 0, biome="lava")
+    store.mark_modified(chunk)
+    writing, release = threading.Event(), threading.Event()
+    write_region = store._write_region
+    def slow_write(region, chunks):
+        writing.set()
+        release.wait(5)
+        write_region(region, chunks)
+    store._write_region = slow_write
+    flusher = threading.Thread(target=store.flush)
+    flusher.start()
+    assert writing.wait(5)
+    # Reads go on mid-write, a chunk changed meanwhile stays dirty and the
+    # one being written is never evicted
+    store.get_many([(9, 9), (10, 9)])
+    assert (0, 0) in store._resident
+    store.mark_modified(chunk)
+    release.set()
+    flusher.join()
+    assert store.stats()["dirty"] == 1
+    assert store.flush() == 1 and store.stats()["dirty"] == 0
+
+def test_eviction_drops_least_recently_used_clean_chunks(tmp_path):
+    store = ChunkStore(str(tmp_path), max_resident=4)
+    store.GENERATE_BLOCK = 1
+    dirty = store.get(0, 0)
+    store.mark_modified(dirty)
+    for cx in range(1, 6):
+        store.get(cx, 0)
+    assert set(store._resident) == {(0, 0), (3, 0), (4, 0), (5, 0)}
+    assert store.evictions == 2
+
+def test_only_changed_chunks_are_stored_against_the_saved_seed(tmp_path):
+    store = ChunkStore(str(tmp_path), seed=5)
+    store.get_many(chunks_in_radius(0, 0, 3))
+    assert store.flush() == 0
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["world.meta"]
+    # The seed a world was created with wins over the one passed in
+    reopened = ChunkStore(str(tmp_path), seed=6)
+    assert reopened.seed == 5
+    assert reopened.get(2, -1).biomes == generate_chunk(2, -1, seed=5).biomes
@@ -0,0 +1,37 @@
+# test_dedup.py
+# SimHash fingerprints and the LSH window of recent texts
+
+import random
+from dedup import FINGERPRINT_BITS, MAX_DISTANCE, NearDuplicateDetector, _bands, simhash, tokenize
+
+BACKSTORY = ("Born under a red moon in the marsh villages, Orla learned to read the tides before she "
+             "could walk, and now guides lost travellers through the fog for a price nobody remembers agreeing to.")
+
+def test_fingerprints_are_stable_and_close_for_small_edits():
+    a = simhash(tokenize(BACKSTORY))
+    assert a == simhash(tokenize(BACKSTORY))
+    edited = simhash(tokenize(BACKSTORY.replace("red moon", "pale moon")))
+    unrelated = simhash(tokenize("A retired clockmaker who collects broken music boxes and sings to them at night."))
+    assert (a ^ edited).bit_count() <= MAX_DISTANCE < (a ^ unrelated).bit_count()
+
+def test_bands_never_miss_fingerprints_within_max_distance():
+    rng = random.Random(3)
+    for _ in range(2000):
+        fingerprint = rng.getrandbits(FINGERPRINT_BITS)
+        other = fingerprint
+        for bit in rng.sample(range(FINGERPRINT_BITS), MAX_DISTANCE):
+            other ^= 1 << bit
+        assert set(_bands(fingerprint, "")) & set(_bands(other, ""))
+
+def test_scopes_are_counted_separately():
+    detector = NearDuplicateDetector()
+    detector.add(BACKSTORY, scope="a")
+    detector.add(BACKSTORY.replace("Orla", "Mira"), scope="a")
+    assert detector.count(BACKSTORY, scope="a") == 2
+    assert detector.count(BACKSTORY, scope="b") == 0
+    assert detector.count(BACKSTORY, scope="a", stop_at=1) == 1
+
+def test_short_texts_are_ignored():
+    detector = NearDuplicateDetector(min_tokens=4)
+    assert detector.check("hi there") == 0
+    assert len(detector) == 0
@@ -0,0 +1,55 @@
+# test_leaderboard.py
+# Weekly leaderboard snapshots: freezing, catch-up and concurrent workers
+
+import json
+import multiprocessing
+from datetime import datetime, timedelta
+import pytest
+import leaderboard
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    index_file = tmp_path / "index.json"
+    index_file.write_text(json.dumps({"weeks": [], "ranks": {}}))
+    monkeypatch.setattr(leaderboard, "ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(leaderboard, "ARCHIVE_INDEX_FILE", str(index_file))
+    monkeypatch.setattr(leaderboard, "ARCHIVE_LOCK_FILE", str(index_file) + ".lock")
+    monkeypatch.setattr(leaderboard, "_index_cache", {"mtime": None, "index": None})
+    return tmp_path
+
+MONDAY = datetime(2024, 3, 4)
+
+def test_freezing_a_week_is_done_once(archive):
+    snapshot = leaderboard.freeze_weekly_leaderboard(MONDAY)
+    assert snapshot["week"] == "2024-W09"
+    assert leaderboard.freeze_weekly_leaderboard(MONDAY) is None
+    assert leaderboard.get_archived_weeks() == ["2024-W09"]
+    assert leaderboard.get_archived_leaderboard("2024-W09")["week"] == "2024-W09"
+
+def test_elapsed_weeks_are_caught_up(archive):
+    leaderboard.freeze_weekly_leaderboard(MONDAY)
+    # Down for three boundaries: each missed week is frozen, in order
+    frozen = leaderboard.freeze_elapsed_weeks(MONDAY + timedelta(days=7 * 3 + 2))
+    assert frozen == ["2024-W10", "2024-W11", "2024-W12"]
+    assert leaderboard.get_archived_weeks() == ["2024-W09", "2024-W10", "2024-W11", "2024-W12"]
+    assert leaderboard.freeze_elapsed_weeks(MONDAY + timedelta(days=7 * 3 + 2)) == []
+
+def test_first_run_freezes_only_the_previous_week(archive):
+    assert leaderboard.freeze_elapsed_weeks(MONDAY + timedelta(days=3)) == ["2024-W09"]
+
+def _catch_up(queue, now):
+    queue.put(leaderboard.freeze_elapsed_weeks(now))
+
+def test_concurrent_workers_freeze_each_week_once(archive):
+    leaderboard.freeze_weekly_leaderboard(MONDAY)
+    now = MONDAY + timedelta(days=7 * 4 + 1)
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_catch_up, args=(results, now)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    frozen = [week for _ in workers for week in results.get(timeout=30)]
+    for worker in workers:
+        worker.join()
+    assert sorted(frozen) == ["2024-W10", "2024-W11", "2024-W12", "2024-W13"]
+    assert leaderboard.get_archived_weeks() == ["2024-W09", "2024-W10", "2024-W11", "2024-W12", "2024-W13"]
@@ -0,0 +1,118 @@
+# test_main.py
+# Tile-world routes served by the app uvicorn runs (main:app)
+
+import json
+import os
+import subprocess
+import sys
+import pytest
+from fastapi import WebSocketDisconnect
+from fastapi.testclient import TestClient
+import main
+from chunks import CHUNK_SIZE, ChunkStore
+from conftest import REPO_DIR
+from minimap import TILE_CELLS, UNEXPLORED
+
+client = TestClient(main.app)
+
+def test_tile_routes_are_served():
+    assert client.get("/get_chunk", params={"cx": 0, "cy": 0}).status_code == 200
+    r = client.get("/get_chunks", params={"cx": 0, "cy": 0, "radius": 1})
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/octet-stream"
+    assert client.get("/get_chunks", params={"cx": 0, "cy": 0, "radius": 1, "format": "json"}).json()["chunks"]
+
+def test_gather_rejects_out_of_range_tiles():
+    r = client.get("/gather", params={"player_id": "p-range", "cx": 0, "cy": 0, "x": CHUNK_SIZE, "y": 0})
+    assert r.status_code == 400
+
+def test_gather_then_craft():
+    r = client.get("/gather", params={"player_id": "p-craft", "cx": 0, "cy": 0, "x": 1, "y": 2})
+    assert r.status_code == 200 and r.json()["item"]
+    assert client.get("/craft", params={"player_id": "p-craft"}).status_code == 200
+
+def test_static_files_do_not_shadow_routes():
+    assert client.get("/static/index.html").status_code == 200
+    assert client.get("/status").status_code == 200
+
+def test_world_socket_rejects_unknown_players():
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect("/ws/world?player_id=nobody") as ws:
+            ws.receive_bytes()
+    assert exc.value.code == 1008
+    assert "nobody" not in main.player_index.positions
+
+def test_world_socket_streams_and_forgets_player_on_disconnect():
+    client.get("/gather", params={"player_id": "p-ws", "cx": 0, "cy": 0, "x": 1, "y": 1})
+    with client.websocket_connect("/ws/world?player_id=p-ws&cx=0&cy=0") as ws:
+        assert ws.receive_bytes()
+        # Binary and malformed frames get an error, not a dropped socket
+        ws.send_bytes(b"\x00")
+        ws.send_text("not json")
+        ws.send_json({"type": "ping"})
+        replies = []
+        while len(replies) < 3:
+            message = ws.receive()
+            if message.get("text"):
+                replies.append(json.loads(message["text"]))
+        assert [r["type"] for r in replies] == ["error", "error", "pong"]
+        ws.send_json({"type": "position", "cx": 2, "cy": 0, "x": 3, "y": 4})
+        ws.send_json({"type": "ping"})
+        while json.loads(ws.receive().get("text") or "{}").get("type") != "pong":
+            pass
+        assert main.player_index.positions["p-ws"] == (2 * CHUNK_SIZE + 3, 4)
+    assert "p-ws" not in main.player_index.positions
+
+def test_nearby_lists_players_until_they_leave():
+    for pid, x in (("p-near-a", 1), ("p-near-b", 5)):
+        client.get("/gather", params={"player_id": pid, "cx": 40, "cy": 40, "x": x, "y": 0})
+    with client.websocket_connect("/ws/world?player_id=p-near-a&cx=40&cy=40") as watcher:
+        with client.websocket_connect("/ws/world?player_id=p-near-b&cx=40&cy=40"):
+            r = client.get("/nearby", params={"player_id": "p-near-a", "radius": 10})
+            assert r.status_code == 200
+            assert [p["player_id"] for p in r.json()["players"]] == ["p-near-b"]
+        while json.loads(watcher.receive().get("text") or "{}").get("type") != "player_left":
+            pass
+        assert client.get("/nearby", params={"player_id": "p-near-a"}).json()["players"] == []
+    assert client.get("/nearby", params={"player_id": "p-near-a"}).status_code == 404
+
+def test_minimap_tiles_show_explored_chunks():
+    client.get("/get_chunk", params={"cx": 3, "cy": 3})
+    r = client.get("/minimap", params={"level": 0, "tx": 0, "ty": 0})
+    assert r.status_code == 200 and len(r.content) == TILE_CELLS * TILE_CELLS
+    assert r.content[3 * TILE_CELLS + 3] != UNEXPLORED
+    assert client.get("/minimap", params={"level": 0, "tx": 0, "ty": 0},
+                      headers={"If-None-Match": r.headers["etag"]}).status_code == 304
+
+def test_world_is_flushed_on_shutdown():
+    assert not main.world_flusher_stop.is_set()
+    with TestClient(main.app) as app_client:
+        assert main.app.state.world_flusher.is_alive()
+        app_client.get("/gather", params={"player_id": "p-flush", "cx": 7, "cy": 7, "x": 0, "y": 0})
+    assert not main.app.state.world_flusher.is_alive()
+    with open(main.player_file) as f:
+        assert "p-flush" in json.load(f)
+    assert os.path.isabs(main.world_dir) and os.path.isabs(main.player_file)
+
+def test_players_changed_during_a_save_stay_dirty(monkeypatch):
+    client.get("/gather", params={"player_id": "p-save", "cx": 0, "cy": 0, "x": 0, "y": 0})
+    real_open = open
+    def open_and_move(path, *args, **kwargs):
+        # Another request lands while the snapshot is being written
+        if path == main.player_file + ".tmp":
+            main.move_player("p-save", 1, 1, 1, 1)
+        return real_open(path, *args, **kwargs)
+    monkeypatch.setattr(main, "open", open_and_move, raising=False)
+    main.save_players()
+    assert main.players_dirty
+
+def test_world_json_save_is_imported_once(tmp_path):
+    tiles = {f"{x},{y}": {"biome": "lava", "effect": "glow" if x == y else None}
+             for y in range(CHUNK_SIZE) for x in range(CHUNK_SIZE)}
+    (tmp_path / "world.json").write_text(json.dumps({"3,-2": tiles}))
+    os.symlink(os.path.join(REPO_DIR, "static"), tmp_path / "static")
+    subprocess.run([sys.executable, "-c", "import main"], cwd=tmp_path, check=True,
+                   env={**os.environ, "PYTHONPATH": REPO_DIR})
+    chunk = ChunkStore(str(tmp_path / "world_regions")).get(3, -2)
+    assert chunk.get_tile(1, 1) == ("lava", "glow")
+    assert chunk.get_tile(1, 0) == ("lava", None)
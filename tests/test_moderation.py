@@ -0,0 +1,103 @@
+# test_moderation.py
+# Chat validation, near-duplicate spam detection, the content filter and the
+# report queue
+
+import multiprocessing
+import os
+from fastapi.testclient import TestClient
+import api
+import auth
+import moderation
+import npc_generator
+from leaderboard import get_trending_npcs
+from wordfilter import Blocklist
+from moderation import (AUTO_HIDE_THRESHOLD, CHAT_DUPLICATE_LIMIT, claim_reports, filter_content, record_message,
+                        report_content, validate_message)
+
+SPAM = "buy cheap gold coins at my shop today"
+
+def test_duplicate_window_is_per_user():
+    for _ in range(CHAT_DUPLICATE_LIMIT):
+        assert validate_message(SPAM, "spammer")[0]
+        record_message(SPAM, "spammer")
+    assert not validate_message(SPAM + "!", "spammer")[0]
+    # Someone else saying the same thing isn't affected
+    assert validate_message(SPAM, "bystander")[0]
+
+def test_rejected_or_unposted_messages_do_not_count():
+    text = "see you all at the harbour tonight"
+    for _ in range(CHAT_DUPLICATE_LIMIT + 2):
+        # Validated but never posted: nothing recorded
+        assert validate_message(text, "quiet")[0]
+
+def test_filter_verdicts_are_cached_per_normalised_text(monkeypatch):
+    scans = []
+    scan = moderation._filter_normalized
+    monkeypatch.setattr(moderation, "_filter_normalized", lambda text: scans.append(text) or scan(text))
+    assert filter_content("Free 5CAM inside")[0] is False
+    # Leetspeak and case variants normalise to the same text: one scan
+    assert filter_content("free scam inside") == filter_content("FREE $CAM INSIDE")
+    assert len(scans) == 1
+    assert filter_content("a friendly hello")[0]
+    assert len(scans) == 2
+
+def test_blocklist_reload_drops_cached_verdicts(tmp_path, monkeypatch):
+    words = tmp_path / "blocklist.txt"
+    words.write_text("spam\n")
+    monkeypatch.setattr(moderation, "blocklist", Blocklist(str(words)))
+    text = "my favourite word is marmalade"
+    assert filter_content(text)[0]
+    words.write_text("spam\nmarmalade\n")
+    moderation.blocklist.reload()
+    assert filter_content(text) == (False, "Content contains inappropriate word: marmalade")
+
+def test_repeat_reports_are_deduplicated():
+    report_content("reporter", "room", "room-dedupe", "spam")
+    size = os.path.getsize(moderation.QUEUE_LOG)
+    item = report_content("reporter", "room", "room-dedupe", "spam again")
+    assert item["report_count"] == 1
+    assert os.path.getsize(moderation.QUEUE_LOG) == size
+
+def test_claimed_items_are_not_handed_out_twice(monkeypatch):
+    report_content("reporter", "user", "claim-target", "abuse")
+    first = claim_reports("mod-a", limit=100, content_type="user")
+    assert "user:claim-target" in {item["id"] for item in first}
+    assert claim_reports("mod-b", limit=100, content_type="user") == []
+    # Once the lease runs out the item can be claimed again
+    later = moderation.time.time() + moderation.CLAIM_TTL + 1
+    monkeypatch.setattr(moderation.time, "time", lambda: later)
+    second = claim_reports("mod-b", limit=100, content_type="user")
+    assert [item["claimed_by"] for item in second if item["id"] == "user:claim-target"] == ["mod-b"]
+
+def _claim_into(queue, moderator_id):
+    queue.put([item["id"] for item in claim_reports(moderator_id, limit=100, content_type="share")])
+
+def test_concurrent_workers_claim_disjoint_items():
+    for i in range(20):
+        report_content("reporter", "share", f"race-{i}", "spam")
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_claim_into, args=(results, f"mod-{n}")) for n in range(4)]
+    for worker in workers:
+        worker.start()
+    claimed = [results.get(timeout=10) for _ in workers]
+    for worker in workers:
+        worker.join()
+    flat = [item_id for ids in claimed for item_id in ids]
+    assert len(flat) == len(set(flat)) == 20
+
+def test_hidden_npcs_are_left_out_of_listings():
+    npc = npc_generator.create_npc(creator_id="creator", name="Hidden", trait="sly", custom_backstory="Lurks.")
+    assert npc["id"] in {n["id"] for n in npc_generator.get_popular_npcs(1000)}
+    for i in range(AUTO_HIDE_THRESHOLD):
+        report_content(f"reporter-{i}", "npc", npc["id"], "spam")
+    assert npc["id"] not in {n["id"] for n in npc_generator.get_popular_npcs(1000)}
+    assert npc["id"] not in {n["id"] for n in get_trending_npcs(1000)}
+
+def test_reporting_missing_content_is_rejected():
+    user, _ = auth.create_user("reporter@example.com", "pw", "reporter")
+    token = auth.create_access_token({"user_id": user["id"]})
+    with TestClient(api.app) as client:
+        response = client.post("/api/moderation/report", headers={"Authorization": f"Bearer {token}"},
+                               json={"content_type": "npc", "content_id": "no-such-npc", "reason": "spam"})
+    assert response.status_code == 404
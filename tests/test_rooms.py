@@ -0,0 +1,169 @@
+# test_rooms.py
+# Room presence and events through the in-process broker
+
+import json
+import multiprocessing
+import os
+import time
+import rooms
+from realtime import room_channel
+from broker import broker
+from moderation import AUTO_HIDE_THRESHOLD, report_content
+
+def test_join_and_leave_track_presence():
+    room = rooms.create_room("alice", "presence", max_players=2)
+    assert rooms.join_room(room["id"], "bob")
+    assert rooms.get_presence_count(room["id"]) == 2
+    assert not rooms.leave_room(room["id"], "bob")
+    assert rooms.get_presence_count(room["id"]) == 1
+
+def test_full_room_rejects_newcomers():
+    room = rooms.create_room("alice", "full", max_players=1)
+    assert rooms.join_room(room["id"], "bob") is None
+    assert rooms.join_room(room["id"], "alice")
+
+def test_expired_presence_is_dropped():
+    room = rooms.create_room("alice", "expiry")
+    expired = rooms.expire_presence(time.time() + rooms.PRESENCE_TTL + 1)
+    assert {"room_id": room["id"], "user_id": "alice", "room_idle": True} in expired
+    assert rooms.get_presence_count(room["id"]) == 0
+
+def test_events_reach_room_subscribers():
+    received = []
+    broker.subscribe(room_channel("events-test"), lambda channel, message: received.append(message))
+    broker.publish(room_channel("events-test"), {"type": "join", "user_id": "alice"})
+    assert received == [{"type": "join", "user_id": "alice"}]
+
+def test_expiry_from_any_reader_publishes_leave(monkeypatch):
+    room = rooms.create_room("alice", "leave-on-expiry")
+    left = []
+    broker.subscribe(room_channel(room["id"]), lambda channel, message: left.append(message))
+    # Readers such as get_presence_count expire lapsed users too
+    later = time.time() + rooms.PRESENCE_TTL + 1
+    monkeypatch.setattr(rooms.time, "time", lambda: later)
+    assert rooms.get_presence_count(room["id"]) == 0
+    assert [event["user_id"] for event in left if event["type"] == "leave"] == ["alice"]
+
+def _create_rooms(count: int):
+    for i in range(count):
+        rooms.create_room("writer", f"concurrent-{i}")
+
+def test_concurrent_writers_keep_every_room():
+    before = len(rooms.load_rooms())
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_create_rooms, args=(10,)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert len(rooms.load_rooms()) == before + 40
+
+def test_foreign_change_updates_open_index():
+    room = rooms.create_room("alice", "foreign")
+    listed = lambda: room["id"] in {r["id"] for r in rooms.get_active_rooms(limit=1000)}
+    assert listed()
+    # Another process closes the room without sharing our broker
+    data = dict(rooms.load_rooms())
+    data[room["id"]] = {**data[room["id"]], "active": False}
+    with open(rooms.ROOMS_FILE, "w") as f:
+        json.dump(data, f)
+    assert not listed()
+
+def test_room_log_writers_share_seqs(tmp_path):
+    path = str(tmp_path / "room.chat.jsonl")
+    first, second = rooms.RoomLog(path, 10), rooms.RoomLog(path, 10)
+    assert first.append({"message": "a"})["seq"] == 1
+    assert second.append({"message": "b"})["seq"] == 2
+    assert first.append({"message": "c"})["seq"] == 3
+    # Each sees the other's entries, and a fresh reader sees them in order
+    assert [e["message"] for e in second.since(0, 10)] == ["a", "b", "c"]
+    assert [e["seq"] for e in rooms.RoomLog(path, 10).recent()] == [1, 2, 3]
+
+def test_room_log_ring_buffer_wraps_and_pages_from_disk(tmp_path):
+    log = rooms.RoomLog(str(tmp_path / "room.chat.jsonl"), 3)
+    for i in range(1, 8):
+        log.append({"message": str(i)})
+    # Only the newest `capacity` entries stay in memory
+    assert [e["seq"] for e in log.recent()] == [5, 6, 7]
+    assert [e["seq"] for e in log.since(5, 10)] == [6, 7]
+    # Older ones are read back through the index
+    assert [e["message"] for e in log.since(0, 4)] == ["1", "2", "3", "4"]
+    assert [e["seq"] for e in log.before(5, 2)] == [3, 4]
+    assert [e["seq"] for e in log.before(None, 3)] == [5, 6, 7]
+    assert log.before(1, 10) == []
+
+def test_room_log_recovers_from_a_cut_short_write(tmp_path):
+    path = str(tmp_path / "room.chat.jsonl")
+    log = rooms.RoomLog(path, 10)
+    log.extend([{"message": "a"}, {"message": "b"}])
+    # A crash mid-append: half an index record and an unindexed line
+    with open(path, "ab") as f:
+        f.write(b'{"seq":3,"message":"lost"}\n{"seq":4,"mess')
+    with open(path + ".idx", "ab") as f:
+        f.write(b"\x00\x01\x02")
+    fresh = rooms.RoomLog(path, 10)
+    assert fresh.last_seq() == 2
+    assert fresh.append({"message": "c"})["seq"] == 3
+    assert os.path.getsize(path + ".idx") == 3 * 8
+    assert [e["message"] for e in rooms.RoomLog(path, 10).since(0, 10)] == ["a", "b", "c"]
+
+def _append_chat(path: str, count: int):
+    log = rooms.RoomLog(path, 10)
+    for i in range(count):
+        log.append({"message": str(i)})
+
+def test_room_log_processes_never_reuse_seqs(tmp_path):
+    path = str(tmp_path / "room.chat.jsonl")
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_append_chat, args=(path, 25)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    log = rooms.RoomLog(path, 10)
+    assert [e["seq"] for e in log.before(None, 1000)] == list(range(1, 101))
+
+def test_open_index_lists_joinable_rooms_newest_first():
+    older = rooms.create_room("alice", "index-older", max_players=2)
+    newer = rooms.create_room("carol", "index-newer", max_players=2)
+    listed = lambda: [r["id"] for r in rooms.get_active_rooms(limit=1000) if r["id"] in (older["id"], newer["id"])]
+    assert listed() == [newer["id"], older["id"]]
+    # A full room drops out and comes back once someone leaves
+    rooms.join_room(older["id"], "bob")
+    assert listed() == [newer["id"]]
+    rooms.leave_room(older["id"], "bob")
+    assert listed() == [newer["id"], older["id"]]
+
+def test_closed_rooms_are_archived_and_still_readable():
+    room = rooms.create_room("alice", "archived")
+    rooms.add_chat_message(room["id"], "alice", "goodbye")
+    archived = rooms.count_archived_rooms()
+    assert not rooms.close_room(room["id"], "bob")
+    assert rooms.close_room(room["id"], "alice")
+    assert room["id"] not in rooms.load_rooms()
+    assert rooms.count_archived_rooms() == archived + 1
+    # Found through index.tsv after a restart as well
+    rooms._archive_index = None
+    closed = rooms.get_room(room["id"])
+    assert closed["active"] is False and closed["closed_at"]
+    assert [e["message"] for e in closed["chat_log"]] == ["goodbye"]
+    assert rooms.room_exists(room["id"])
+    assert room["id"] not in {r["id"] for r in rooms.get_active_rooms(limit=1000)}
+
+def test_hidden_rooms_and_messages_are_not_served():
+    room = rooms.create_room("alice", "hidden-content")
+    kept = rooms.add_chat_message(room["id"], "alice", "hello")
+    spam = rooms.add_chat_message(room["id"], "alice", "buy gold")
+    for i in range(AUTO_HIDE_THRESHOLD):
+        report_content(f"reporter-{i}", "chat", rooms.chat_content_id(room["id"], spam["seq"]), "spam")
+    assert [e["seq"] for e in rooms.get_room(room["id"])["chat_log"]] == [kept["seq"]]
+    assert [e["seq"] for e in rooms.get_room_entries_since(room["id"], "chat")] == [kept["seq"]]
+    assert [e["seq"] for e in rooms.get_room_history(room["id"], "chat")] == [kept["seq"]]
+
+    for i in range(AUTO_HIDE_THRESHOLD):
+        report_content(f"reporter-{i}", "room", room["id"], "abuse")
+    assert rooms.get_room(room["id"]) is None
+    assert rooms.get_room_entries_since(room["id"], "chat") is None
+    assert room["id"] not in {r["id"] for r in rooms.get_active_rooms(limit=1000)}
+    assert rooms.join_room(room["id"], "bob") is None
+    assert rooms.add_chat_message(room["id"], "alice", "still here?") is None
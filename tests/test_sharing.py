@@ -0,0 +1,136 @@
+# test_sharing.py
+# Share pages, background-rendered OG images and their delivery
+
+import os
+import time
+from concurrent.futures import Future
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import api  # registers the moderation listener
+import sharing
+from api import OpenFileResponse, etag_matches
+from moderation import AUTO_HIDE_THRESHOLD, report_content
+
+NPC = {"id": "npc-1", "name": "Ada", "trait": "curious", "backstory": "Keeps the lighthouse."}
+
+def test_share_page_is_cached_until_invalidated():
+    share = {"id": "share-cache", "npc_id": "npc-1", "view_count": 3}
+    loads = []
+    def load_npc(npc_id):
+        loads.append(npc_id)
+        return NPC if len(loads) == 1 else None
+    
+    page = sharing.get_share_page(share, load_npc)
+    assert b"Ada" in page and b"3" in page
+    assert sharing.get_share_page({**share, "view_count": 4}, load_npc).count(b"Ada") == page.count(b"Ada")
+    assert len(loads) == 1
+    
+    # After a hide/delete the page is rendered again and the NPC is gone
+    sharing.invalidate_share_pages()
+    assert sharing.get_share_page(share, load_npc) is None
+
+def test_hiding_content_invalidates_pages():
+    share = {"id": "share-hide", "npc_id": "npc-1", "view_count": 0}
+    sharing.get_share_page(share, lambda npc_id: NPC)
+    epoch = sharing._pages_epoch
+    for i in range(AUTO_HIDE_THRESHOLD):
+        report_content(f"reporter-{i}", "share", "share-hide", "spam")
+    assert sharing._pages_epoch > epoch
+
+def test_sweep_tolerates_files_removed_by_another_sweep(monkeypatch):
+    old = time.time() - sharing.OG_IMAGE_ORPHAN_GRACE - 60
+    paths = [os.path.join(sharing.IMAGES_DIR, name) for name in ("orphan-a.png", "orphan-b.png", "stale.png.tmp")]
+    for path in paths:
+        with open(path, "wb") as f:
+            f.write(b"x")
+        os.utime(path, (old, old))
+    real_remove = os.remove
+    def racing_remove(path):
+        # Another worker deletes the file just before we do
+        real_remove(path)
+        real_remove(path)
+    monkeypatch.setattr(sharing.os, "remove", racing_remove)
+    result = sharing.sweep_share_images()
+    assert result["orphans"] == 0 and result["tmp"] == 0
+    assert not any(os.path.exists(path) for path in paths)
+
+def test_open_share_image_missing_file():
+    assert sharing.open_share_image("/nonexistent/image.png") is None
+
+def test_hidden_share_image_is_not_served():
+    share = sharing.create_share("sharer", "npc-image", {**NPC, "id": "npc-image"})
+    with TestClient(api.app) as client:
+        url = f"/api/share/{share['id']}/image"
+        response = client.get(url)
+        assert response.status_code == 200
+        assert "immutable" not in response.headers["cache-control"]
+        for i in range(AUTO_HIDE_THRESHOLD):
+            report_content(f"reporter-{i}", "share", share["id"], "spam")
+        assert client.get(url).status_code == 404
+
+def test_open_file_response_survives_removal_and_closes(tmp_path):
+    path = tmp_path / "card.png"
+    path.write_bytes(b"0123456789" * 10000)
+    opened = []
+    app = FastAPI()
+    @app.get("/card")
+    def card():
+        f = open(path, "rb")
+        opened.append(f)
+        # Swept between the open and the response
+        path.unlink()
+        return OpenFileResponse(f, media_type="image/png")
+    response = TestClient(app).get("/card")
+    assert response.status_code == 200
+    assert response.content == b"0123456789" * 10000
+    assert response.headers["content-length"] == "100000"
+    assert opened[0].closed
+
+def _wait_for_image(share):
+    pending = sharing.get_pending_render(share["image_path"])
+    if pending is not None:
+        pending.result(timeout=30)
+
+def test_identical_npc_content_shares_one_render(monkeypatch):
+    submitted = []
+    class HeldPool:
+        # Renders stay in flight until the test finishes them
+        def submit(self, *args):
+            submitted.append(args)
+            return Future()
+    monkeypatch.setattr(sharing, "_get_render_pool", lambda: HeldPool())
+    npc = {**NPC, "id": "npc-same", "backstory": "Counts the waves for the harbour master."}
+    first = sharing.create_share("sharer", npc["id"], npc)
+    second = sharing.create_share("other", npc["id"], npc)
+    assert first["image_status"] == second["image_status"] == "pending"
+    assert second["image_path"] == first["image_path"] and len(submitted) == 1
+    assert sharing.og_image_path(npc["name"], npc["trait"], npc["backstory"] + " Badly.") != first["image_path"]
+    # The render's result lands at the content-hash path
+    render, *args = submitted[0]
+    sharing.get_pending_render(first["image_path"]).set_result(render(*args))
+    assert sharing.get_pending_render(first["image_path"]) is None
+    assert sharing.get_image_status(first) == "ready"
+
+def test_share_images_revalidate_and_negotiate_webp():
+    share = sharing.create_share("sharer", "npc-webp", {**NPC, "id": "npc-webp", "name": "Webb"})
+    _wait_for_image(share)
+    url = f"/api/share/{share['id']}/image"
+    with TestClient(api.app) as client:
+        png = client.get(url)
+        assert png.headers["content-type"] == "image/png" and png.content.startswith(b"\x89PNG")
+        assert "Accept" in png.headers["vary"]
+        webp = client.get(url, headers={"Accept": "image/webp,image/*"})
+        assert webp.headers["content-type"] == "image/webp" and webp.content[8:12] == b"WEBP"
+        assert webp.headers["etag"] != png.headers["etag"]
+        assert len(webp.content) < len(png.content)
+        # Each variant revalidates against its own tag
+        assert client.get(url, headers={"If-None-Match": png.headers["etag"]}).status_code == 304
+        assert client.get(url, headers={"If-None-Match": png.headers["etag"], "Accept": "image/webp"}).status_code == 200
+        assert client.get(url, headers={"If-None-Match": webp.headers["etag"], "Accept": "image/webp"}).status_code == 304
+
+def test_etag_matching():
+    assert etag_matches('"a.png"', '"a.png"')
+    assert etag_matches('"b.png", W/"a.png"', '"a.png"')
+    assert etag_matches("*", '"a.png"')
+    assert not etag_matches('"a.webp"', '"a.png"')
+    assert not etag_matches(None, '"a.png"')
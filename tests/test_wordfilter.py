@@ -0,0 +1,50 @@
+# test_wordfilter.py
+# Aho–Corasick blocklist matching and text normalisation
+
+import random
+import pytest
+from wordfilter import Blocklist, WordFilter, normalize_text
+
+def naive_find(terms, text):
+    # Every normalised term found anywhere in the normalised text
+    text = normalize_text(text)
+    return {term for term in terms if normalize_text(term) in text}
+
+def test_matches_agree_with_a_naive_search():
+    rng = random.Random(5)
+    # Small alphabet and overlapping terms so fail links get exercised
+    terms = ["he", "she", "his", "hers", "ahe", "aaab", "ba", "sheb"]
+    automaton = WordFilter(terms)
+    for _ in range(3000):
+        text = "".join(rng.choice("abehirs ") for _ in range(rng.randint(0, 12)))
+        expected = naive_find(terms, text)
+        found = automaton.find(text)
+        assert (found is not None) == bool(expected), text
+        assert found is None or found in expected
+
+@pytest.mark.parametrize("text", [
+    "total SCAM",
+    "5c4m artist",              # leetspeak
+    "ѕсаm",                     # Cyrillic look-alikes
+    "sc\u200bam",               # zero-width space
+    "ｓｃａｍ",                  # full-width letters
+])
+def test_disguised_terms_are_found(text):
+    assert WordFilter(["scam"]).find(text) == "scam"
+    assert naive_find(["scam"], text) == {"scam"}
+
+def test_clean_text_passes():
+    automaton = WordFilter(["scam", "hack"])
+    assert automaton.find("a scary cat on a haystack") is None
+    assert automaton.size == 2
+
+def test_blocklist_reloads_when_the_file_changes(tmp_path):
+    path = tmp_path / "blocklist.txt"
+    blocklist = Blocklist(str(path), defaults=["spam"], check_interval=0)
+    assert blocklist.find("sp4m") == "spam"
+    version = blocklist.version
+    path.write_text("# comment\nmarmalade\n")
+    blocklist._mtime = None  # mtime granularity may hide a same-tick edit
+    assert blocklist.find("spam") is None
+    assert blocklist.find("MARMALADE") == "marmalade"
+    assert blocklist.version == version + 1
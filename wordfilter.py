@@ -0,0 +1,163 @@
+# wordfilter.py
+# Multi-pattern blocklist matching (Aho–Corasick) with text normalisation
+
+import os
+import threading
+import time
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+# Look-alike characters folded onto the ASCII letter they imitate
+HOMOGLYPHS = {
+    # Cyrillic
+    "а": "a", "в": "b", "е": "e", "ё": "e", "к": "k", "м": "m", "н": "h", "о": "o",
+    "р": "p", "с": "c", "т": "t", "у": "y", "х": "x", "і": "i", "ј": "j", "ѕ": "s",
+    # Greek
+    "α": "a", "β": "b", "ε": "e", "η": "n", "ι": "i", "κ": "k", "ν": "v", "ο": "o",
+    "ρ": "p", "τ": "t", "υ": "u", "χ": "x",
+}
+
+LEETSPEAK = {
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b", "9": "g",
+    "@": "a", "$": "s", "!": "i", "|": "l", "+": "t",
+}
+
+# Invisible characters used to split words past a filter
+ZERO_WIDTH = "\u200b\u200c\u200d\u2060\ufeff\u00ad"
+
+FOLD_TABLE = str.maketrans({**HOMOGLYPHS, **LEETSPEAK, **{c: None for c in ZERO_WIDTH}})
+
+def normalize_text(text: str) -> str:
+    """
+    Canonical form for matching: NFKC (full-width and styled letters to
+    plain ones), lowercase, homoglyphs and leetspeak folded, zero-width
+    characters removed
+    """
+    return unicodedata.normalize("NFKC", text).lower().translate(FOLD_TABLE)
+
+class WordFilter:
+    """
+    Aho–Corasick automaton over a set of blocked terms. Built once; `find`
+    scans normalised text in a single pass whatever the number of terms.
+    """
+    def __init__(self, terms: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._match: List[Optional[str]] = [None]  # a term ending here (incl. via fail links)
+        self.size = 0
+
+        for term in terms:
+            pattern = normalize_text(term.strip())
+            if pattern:
+                self._add(pattern, term.strip())
+        self._link()
+
+    def _add(self, pattern: str, term: str):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._match.append(None)
+                self._goto[node][ch] = nxt
+            node = nxt
+        if self._match[node] is None:
+            self._match[node] = term
+            self.size += 1
+
+    def _link(self):
+        # Breadth-first so every fail target is finished before it's used
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                if self._match[child] is None:
+                    self._match[child] = self._match[self._fail[child]]
+                queue.append(child)
+
+    def find(self, text: str) -> Optional[str]:
+        """
+        First blocked term found in the text, or None
+        """
+        return self.find_normalized(normalize_text(text))
+
+    def find_normalized(self, text: str) -> Optional[str]:
+        """
+        Like find, for text already passed through normalize_text
+        """
+        goto, fail, match = self._goto, self._fail, self._match
+        node = 0
+        for ch in text:
+            nxt = goto[node].get(ch)
+            while nxt is None and node:
+                node = fail[node]
+                nxt = goto[node].get(ch)
+            node = nxt or 0
+            if match[node] is not None:
+                return match[node]
+        return None
+
+def load_terms(path: str) -> List[str]:
+    """
+    One term per line; blank lines and #-comments are ignored
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+class Blocklist:
+    """
+    A WordFilter built from a wordlist file and rebuilt when the file
+    changes. The file is checked at most every `check_interval` seconds;
+    `version` increases on every reload.
+    """
+    def __init__(self, path: str, defaults: Iterable[str] = (), check_interval: float = 5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.version = 0
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        if not os.path.exists(path):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("# Blocked terms, one per line. Matching ignores case, leetspeak and look-alike letters.\n")
+                f.writelines(f"{term}\n" for term in defaults)
+        self.reload()
+
+    def reload(self) -> int:
+        """
+        Rebuild from the file; returns the number of terms loaded
+        """
+        with self._lock:
+            mtime = os.stat(self.path).st_mtime_ns
+            self.filter = WordFilter(load_terms(self.path))
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+            self.version += 1
+            return self.filter.size
+
+    def refresh(self):
+        """
+        Reload if the file changed (checked at most every check_interval)
+        """
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            changed = os.stat(self.path).st_mtime_ns != self._mtime
+        except OSError:
+            return
+        if changed:
+            self.reload()
+
+    def find(self, text: str) -> Optional[str]:
+        self.refresh()
+        return self.filter.find(text)
@@ -0,0 +1,232 @@
+# worldstream.py
+# Streams tile-world chunks over WebSocket by interest radius, and pushes tile
+# changes and nearby player events
+
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import WebSocket
+from broker import broker
+from chunks import Chunk, ChunkStore, chunks_in_radius, encode_chunks
+from realtime import SEND_QUEUE_SIZE, SLOW_CONSUMER_CLOSE_CODE
+from spatial import SpatialHash
+
+# Chunks within STREAM_RADIUS of the player are streamed; they're forgotten
+# (and the client told to unload them) once beyond STREAM_RADIUS + 1, so
+# walking back and forth over a border doesn't resend them
+STREAM_RADIUS = 3
+UNLOAD_MARGIN = 1
+
+# Chunks per binary frame; small frames let a position change reprioritise
+# the rest of the stream quickly
+STREAM_BATCH = 8
+
+TILES_CHANNEL = "world:tiles"
+NEARBY_CHANNEL = "world:nearby"
+
+# How far (in tiles) player events such as movement carry
+NEARBY_RADIUS = 30
+
+ChunkKey = Tuple[int, int]
+
+class WorldConnection:
+    """
+    One client socket. `sent` is the interest set: every chunk the client
+    holds and the version it has. A sender task first drains pushed events
+    (tile changes, unloads), then streams missing chunks nearest first.
+    """
+    def __init__(self, websocket: WebSocket, player_id: str, radius: int = STREAM_RADIUS):
+        self.websocket = websocket
+        self.player_id = player_id
+        self.radius = radius
+        self.position: Optional[ChunkKey] = None
+        self.sent: Dict[ChunkKey, int] = {}
+        self.pending: List[ChunkKey] = []
+        self.events: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.wake = asyncio.Event()
+        self.sender: Optional[asyncio.Task] = None
+        self.dropped = False
+
+    def offer(self, event: Dict) -> bool:
+        """
+        Queue a JSON event without waiting. Returns False if the queue is full.
+        """
+        try:
+            self.events.put_nowait(event)
+        except asyncio.QueueFull:
+            return False
+        self.wake.set()
+        return True
+
+class WorldHub:
+    """
+    Open world sockets in this process, with an index from chunk to the
+    connections holding it so tile changes only reach clients that can see
+    them, and a spatial index of players so player events only reach those
+    nearby. Events go through the broker so every worker delivers them.
+    """
+    def __init__(self):
+        self.store: Optional[ChunkStore] = None
+        self.index: Optional[SpatialHash] = None
+        self.connections: Set[WorldConnection] = set()
+        self.by_player: Dict[str, Set[WorldConnection]] = {}
+        self.watchers: Dict[ChunkKey, Set[WorldConnection]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.chunks_streamed = 0
+
+    def start(self, loop: asyncio.AbstractEventLoop, store: ChunkStore, index: Optional[SpatialHash] = None):
+        if self.loop is None:
+            broker.subscribe(TILES_CHANNEL, self._on_broker_message)
+            broker.subscribe(NEARBY_CHANNEL, self._on_broker_message)
+        self.loop = loop
+        self.store = store
+        self.index = index
+
+    def _on_broker_message(self, channel: str, event: Dict):
+        # May run on the broker's listener thread; nothing to deliver to
+        # before startup or after the loop shut down
+        if self.loop is None or self.loop.is_closed():
+            return
+        deliver = self._deliver_nearby if channel == NEARBY_CHANNEL else self._deliver
+        self.loop.call_soon_threadsafe(deliver, event)
+
+    # --- connections ---
+
+    def add(self, conn: WorldConnection):
+        self.connections.add(conn)
+        self.by_player.setdefault(conn.player_id, set()).add(conn)
+        conn.sender = asyncio.create_task(self._send_loop(conn))
+
+    def remove(self, conn: WorldConnection):
+        self.connections.discard(conn)
+        player_conns = self.by_player.get(conn.player_id)
+        if player_conns is not None:
+            player_conns.discard(conn)
+            if not player_conns:
+                del self.by_player[conn.player_id]
+        for key in conn.sent:
+            self._unwatch(key, conn)
+        conn.sent.clear()
+        if conn.sender:
+            conn.sender.cancel()
+
+    def _watch(self, key: ChunkKey, conn: WorldConnection):
+        self.watchers.setdefault(key, set()).add(conn)
+
+    def _unwatch(self, key: ChunkKey, conn: WorldConnection):
+        watching = self.watchers.get(key)
+        if watching is not None:
+            watching.discard(conn)
+            if not watching:
+                del self.watchers[key]
+
+    def move(self, conn: WorldConnection, cx: int, cy: int):
+        """
+        The client moved: queue chunks entering its radius (nearest first)
+        and unload those that left it
+        """
+        conn.position = (cx, cy)
+        conn.pending = [key for key in chunks_in_radius(cx, cy, conn.radius) if key not in conn.sent]
+        keep = conn.radius + UNLOAD_MARGIN
+        gone = [key for key in conn.sent if abs(key[0] - cx) > keep or abs(key[1] - cy) > keep]
+        for key in gone:
+            del conn.sent[key]
+            self._unwatch(key, conn)
+        if gone:
+            conn.offer({"type": "unload", "chunks": [list(key) for key in gone]})
+        conn.wake.set()
+
+    async def _send_loop(self, conn: WorldConnection):
+        try:
+            while True:
+                await conn.wake.wait()
+                conn.wake.clear()
+                while True:
+                    # Pushed events first: they're small and about chunks the client is looking at
+                    while not conn.events.empty():
+                        await conn.websocket.send_json(conn.events.get_nowait())
+                    if not conn.pending:
+                        break
+                    batch, conn.pending = conn.pending[:STREAM_BATCH], conn.pending[STREAM_BATCH:]
+                    chunks = await asyncio.to_thread(self.store.get_many, batch)
+                    for chunk in chunks:
+                        key = (chunk.cx, chunk.cy)
+                        conn.sent[key] = chunk.version
+                        self._watch(key, conn)
+                    await conn.websocket.send_bytes(encode_chunks(chunks))
+                    self.chunks_streamed += len(chunks)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket went away; the receive loop handles cleanup
+            pass
+
+    # --- tile changes ---
+
+    def publish_tiles(self, chunk: Chunk, tiles: List[Dict]):
+        """
+        Announce changed tiles of a chunk to every worker's sockets. Safe to
+        call from request threads.
+        """
+        broker.publish(TILES_CHANNEL, {
+            "type": "tiles",
+            "cx": chunk.cx,
+            "cy": chunk.cy,
+            "version": chunk.version,
+            "tiles": tiles,
+        })
+
+    def _deliver(self, event: Dict):
+        key = (event["cx"], event["cy"])
+        for conn in list(self.watchers.get(key, ())):
+            if conn.sent.get(key, -1) >= event["version"]:
+                continue
+            if self._offer(conn, event):
+                conn.sent[key] = event["version"]
+
+    def _offer(self, conn: WorldConnection, event: Dict) -> bool:
+        """
+        Queue an event for a connection, never awaiting: clients whose queue
+        is full are disconnected and must reconnect
+        """
+        if conn.dropped:
+            return False
+        if conn.offer(event):
+            return True
+        conn.dropped = True
+        self.remove(conn)
+        asyncio.create_task(self._close(conn, SLOW_CONSUMER_CLOSE_CODE))
+        return False
+
+    # --- player events ---
+
+    def publish_nearby(self, event: Dict, x: int, y: int, radius: float = NEARBY_RADIUS, exclude: Optional[str] = None):
+        """
+        Send an event to players within `radius` tiles of (x, y) on every
+        worker. Safe to call from request threads.
+        """
+        broker.publish(NEARBY_CHANNEL, {"event": event, "x": x, "y": y, "radius": radius, "exclude": exclude})
+
+    def _deliver_nearby(self, message: Dict):
+        if self.index is None:
+            return
+        for player_id, _, _, _ in self.index.query_radius(message["x"], message["y"], message["radius"]):
+            if player_id == message["exclude"]:
+                continue
+            for conn in list(self.by_player.get(player_id, ())):
+                self._offer(conn, message["event"])
+
+    async def _close(self, conn: WorldConnection, code: int):
+        try:
+            await conn.websocket.close(code=code)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict:
+        return {
+            "connections": len(self.connections),
+            "watched_chunks": len(self.watchers),
+            "players_connected": len(self.by_player),
+            "chunks_streamed": self.chunks_streamed,
+        }
+
+world_hub = WorldHub()